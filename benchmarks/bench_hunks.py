@@ -0,0 +1,47 @@
+"""
+Compares :py:func:`github_watcher.hunks.parse_hunks` with `unidiff` on large synthetic patches (see `synthetic.py`).
+
+    PYTHONPATH=. python benchmarks/bench_hunks.py [--lines 50000] [--hunk-size 20] [--repeat 5]
+
+"""
+import argparse
+import random
+import timeit
+
+import unidiff
+
+from github_watcher import hunks
+
+import synthetic
+
+
+def parse_with_unidiff(patch: str) -> list:
+    patchset = unidiff.PatchSet(['--- a/big.py\n', '+++ b/big.py\n'] + patch.splitlines(True))
+    return [(h.source_start, h.source_length, h.target_start, h.target_length) for h in patchset[0]]
+
+
+def parse_with_hunks(patch: str) -> list:
+    return [h.ranges() for h in hunks.parse_hunks(patch)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--hunk-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    hunk_count = max(1, args.lines // (args.hunk_size + 1))
+    patch = synthetic.make_patch(random.Random(0), hunks=hunk_count, hunk_size=args.hunk_size) + '\n'
+    assert parse_with_hunks(patch) == parse_with_unidiff(patch)
+    print('{} lines, {} hunks, {:.1f} MB'.format(patch.count('\n'), patch.count('\n@@') + 1, len(patch) / 1e6))
+
+    results = {}
+    for name, fn in (('unidiff', parse_with_unidiff), ('hunks', parse_with_hunks)):
+        results[name] = min(timeit.repeat(lambda: fn(patch), number=1, repeat=args.repeat))
+        print('{:<8} {:8.2f} ms'.format(name, results[name] * 1000))
+    print('speedup  {:8.1f}x'.format(results['unidiff'] / results['hunks']))
+
+
+if __name__ == '__main__':
+    main()
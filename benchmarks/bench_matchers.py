@@ -0,0 +1,154 @@
+"""
+Measures the throughput and latency of the matchers `run` evaluates pull requests with, over synthetic configurations
+and diffs (see `synthetic.py`).
+
+    PYTHONPATH=. python benchmarks/bench_matchers.py [--paths 10,1000,100000] [--ranges 1,100,10000]
+        [--regexes 1,100,1000] [--files 1,100,10000] [--calls 20000] [--seed 0] [--json results.json]
+
+Each case times up to `--calls` calls one at a time (the regex and parser cases, whose calls are far more expensive,
+make fewer) and reports calls per second, with the median and 99th percentile latency of a call. The inputs are
+generated from `--seed`, so runs with the same arguments are comparable; `--json` writes the results for tracking
+regressions.
+
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import unidiff
+
+import github_watcher.settings as settings
+from github_watcher.commands import run
+from github_watcher.commands.config import Path
+from github_watcher.services import git
+
+import synthetic
+
+
+def measure(fn, args: list) -> dict:
+    """
+    Calls `fn` with each of `args`, timing every call.
+
+    :return: The calls per second, and the median and 99th percentile latency of a call in microseconds.
+    """
+    clock = time.perf_counter_ns
+    latencies = []
+    for arg in args:
+        start = clock()
+        fn(*arg)
+        latencies.append(clock() - start)
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'ops_per_s': len(latencies) / (sum(latencies) / 1e9),
+        'p50_us': latencies[len(latencies) // 2] / 1000,
+        'p99_us': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1000,
+    }
+
+
+def bench_paths(sizes: list, calls: int, seed: int):
+    for size in sizes:
+        repo = synthetic.make_repo(paths=size, ranges=5, seed=seed)
+        repo.matcher  # Compiled once per configuration, not per call.
+        queries = [(repo, query) for query in synthetic.make_queries(repo, calls, seed=seed)]
+        yield 'is_watched_file', 'paths={}'.format(size), measure(run.is_watched_file, queries)
+        yield 'is_watched_directory', 'paths={}'.format(size), measure(run.is_watched_directory, queries)
+
+
+def bench_ranges(sizes: list, calls: int, seed: int):
+    for size in sizes:
+        rng = random.Random(seed)
+        path = Path('synthetic.py', synthetic.make_ranges(rng, size))
+        path.index  # Compiled once per configuration, not per call.
+        max_line = size * 100
+        queries = []
+        for _ in range(calls):
+            start = rng.randrange(max_line)
+            queries.append((path, start, start + rng.randint(0, 30)))
+        yield 'are_watched_lines', 'ranges={}'.format(size), measure(run.are_watched_lines, queries)
+
+
+def bench_regexes(sizes: list, calls: int, seed: int):
+    for size in sizes:
+        # A search costs about as much per regex as per line, so fewer patches are scanned as the regexes grow.
+        head_files = synthetic.make_head_files(files=max(10, min(1000, calls // size)), hunks=3, hunk_size=10,
+                                               seed=seed)
+        for regex_lines in ('all', 'added'):
+            repo = synthetic.make_repo(paths=0, regexes=size, seed=seed, regex_lines=regex_lines)
+            repo.regex_matcher  # Compiled once per configuration, not per call.
+            blobs = [(repo, head_file['patch']) for head_file in head_files]
+            yield 'contains_watched_regex', 'regexes={} lines={}'.format(size, regex_lines), \
+                measure(run.contains_watched_regex, blobs)
+
+
+def bench_parsers(sizes: list, calls: int, seed: int):
+    for size in sizes:
+        head_files = synthetic.make_head_files(files=size, hunks=3, hunk_size=10, seed=seed)
+        diff = synthetic.make_diff(head_files)
+        repeat = max(3, min(100, calls // size))
+        yield 'unidiff.PatchSet', 'files={}'.format(size), \
+            measure(lambda blob: list(unidiff.PatchSet(blob)), [(diff,)] * repeat)
+        for parser in ('hunks', 'unidiff'):
+            settings.DIFF_PARSER = parser
+            yield 'git.patched_files', 'files={} parser={}'.format(size, parser), \
+                measure(lambda files: list(git.patched_files(files)), [(head_files,)] * repeat)
+        settings.DIFF_PARSER = 'hunks'
+
+
+def bench_evaluate(sizes: list, calls: int, seed: int):
+    for size in sizes:
+        repo = synthetic.make_repo(paths=size, ranges=5, seed=seed)
+        repo.matcher  # Compiled once per configuration, not per call.
+        head_files = synthetic.make_head_files(files=100, repo=repo, hit_rate=0.01, seed=seed)
+        patched_files = list(git.patched_files(head_files))
+        repeat = max(3, calls // 100)
+        yield 'evaluate_files', 'paths={} files=100'.format(size), \
+            measure(lambda files: run.evaluate_files(repo, files, 'someone'), [(patched_files,)] * repeat)
+
+
+def sizes(value: str) -> list:
+    return [int(size) for size in value.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paths', type=sizes, default=[10, 1000, 100000])
+    parser.add_argument('--ranges', type=sizes, default=[1, 100, 10000])
+    parser.add_argument('--regexes', type=sizes, default=[1, 100, 1000])
+    parser.add_argument('--files', type=sizes, default=[1, 100, 10000])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='Where to write the results as JSON.')
+    args = parser.parse_args()
+
+    cases = [
+        bench_paths(args.paths, args.calls, args.seed),
+        bench_ranges(args.ranges, args.calls, args.seed),
+        bench_regexes(args.regexes, args.calls, args.seed),
+        bench_parsers(args.files, args.calls, args.seed),
+        bench_evaluate(args.paths, args.calls, args.seed),
+    ]
+    results = []
+    print('{:<24} {:<26} {:>14} {:>10} {:>10}'.format('function', 'case', 'calls/s', 'p50 us', 'p99 us'))
+    for case in cases:
+        for function, label, result in case:
+            print('{:<24} {:<26} {:>14,.1f} {:>10.2f} {:>10.2f}'.format(function, label, result['ops_per_s'],
+                                                                        result['p50_us'], result['p99_us']))
+            sys.stdout.flush()
+            results.append(dict(result, function=function, case=label))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'args': {key: value for key, value in vars(args).items() if key != 'json'},
+                'results': results,
+            }, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
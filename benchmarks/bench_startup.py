@@ -0,0 +1,76 @@
+"""
+Measures how long the `github-watcher` script takes to import what each action needs, with `python -X importtime`.
+
+    PYTHONPATH=. python benchmarks/bench_startup.py [--repeat 5] [--top 5]
+
+Every sample runs in a fresh interpreter, which loads the script without running it and then imports the command
+module of the action, just like `main` does. The `eager` row imports every command module, as the script used to.
+Times are the best of `--repeat` samples. `extra ms` is the time on top of loading the script itself, and the heaviest
+packages each action imports on top of it are listed below it.
+
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'github_watcher', 'github-watcher')
+
+ACTIONS = collections.OrderedDict([
+    ('--help', ()),
+    ('config', ('config',)),
+    ('check', ('check',)),
+    ('run', ('run',)),
+    ('clean', ('clean',)),
+    ('serve', ('serve',)),
+    ('post-event', ('post_event',)),
+    ('eager', ('run', 'check', 'config', 'clean', 'serve', 'post_event')),
+])
+
+
+def sample(commands: tuple) -> list:
+    """
+    :return: `(self_us, cumulative_us, depth, module)` for every module imported, in the order `-X importtime` reports
+        them.
+    """
+    code = 'import runpy; script = runpy.run_path({!r}, run_name="bench")\n'.format(SCRIPT)
+    code += ''.join('script["command"]({!r})\n'.format(name) for name in commands)
+    env = dict(os.environ, TRAVIS='true')  # Don't require notify2 where it's not installed.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return imports
+
+
+def total(imports: list) -> int:
+    return sum(cumulative for _, cumulative, depth, _ in imports if depth == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    startup = min((sample(()) for _ in range(args.repeat)), key=total)
+    baseline, preloaded = total(startup), {name for _, _, _, name in startup}
+    print('{:<12} {:>10} {:>10} {:>8}'.format('action', 'total ms', 'extra ms', 'modules'))
+    for action, commands in ACTIONS.items():
+        best = min((sample(commands) for _ in range(args.repeat)), key=total) if commands else startup
+        print('{:<12} {:>10.1f} {:>10.1f} {:>8}'.format(action, total(best) / 1000, (total(best) - baseline) / 1000,
+                                                       len(best)))
+        packages = [(cumulative, name) for _, cumulative, _, name in best if '.' not in name and name not in preloaded]
+        for cumulative, name in sorted(packages, reverse=True)[:args.top]:
+            print('    {:<28} {:>8.1f}'.format(name, cumulative / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Generators of synthetic configurations and diffs for the benchmarks. Everything is derived from a seed, so the same
+arguments always produce the same inputs.
+
+"""
+import random
+
+from github_watcher.commands.config import Configuration, User, Repo, Path, Range
+
+
+WORDS = ('api', 'core', 'models', 'views', 'utils', 'services', 'handlers', 'tests', 'jobs', 'schema', 'client',
+         'server', 'auth', 'billing', 'search', 'storage')
+
+
+def make_filepath(rng: random.Random, depth: int=3) -> str:
+    return '/'.join(rng.choice(WORDS) + str(rng.randrange(100)) for _ in range(depth)) + \
+        '/{}_{}.py'.format(rng.choice(WORDS), rng.randrange(10 ** 6))
+
+
+def make_ranges(rng: random.Random, count: int, max_line: int=None) -> list:
+    """
+    :return: `count` line ranges of 1 to 50 lines, spread over a file of `max_line` lines (100 lines per range by
+        default).
+    """
+    max_line = max_line or count * 100
+    ranges = []
+    for _ in range(count):
+        start = rng.randrange(max_line)
+        ranges.append(Range(start, start + rng.randint(1, 50)))
+    return ranges
+
+
+def make_regexes(rng: random.Random, count: int) -> list:
+    """
+    :return: `count` regexes shaped like the ones people watch for: words, identifiers and calls. They're unlikely to
+        match the lines :py:func:`make_patch` writes, so a search scans every line.
+    """
+    shapes = (r'\bTODO_{}\b', r'secret_{}\s*=', r'deprecated_{}\(', r'FIXME[_-]{}', r'import\s+legacy_{}')
+    return [rng.choice(shapes).format(i) for i in range(count)]
+
+
+def make_repo(paths: int=100, ranges: int=5, regexes: int=0, directories: float=0.1, seed: int=0,
+              regex_lines: str='all') -> Repo:
+    """
+    :param int paths: How many paths to watch.
+    :param int ranges: How many line ranges each watched file has.
+    :param int regexes: How many regexes to watch.
+    :param float directories: The fraction of `paths` that are directories.
+    :param int seed: Seeds the generator.
+    :param str regex_lines: The repo's `regex_lines` setting.
+    """
+    rng = random.Random(seed)
+    watched = []
+    for _ in range(paths):
+        if rng.random() < directories:
+            watched.append(Path('/'.join(rng.choice(WORDS) + str(rng.randrange(100)) for _ in range(2)) + '/', []))
+        else:
+            watched.append(Path(make_filepath(rng), make_ranges(rng, ranges)))
+    return Repo(name='synthetic', paths=watched, regexes=make_regexes(rng, regexes), regex_lines=regex_lines)
+
+
+def make_configuration(repos: int=1, seed: int=0, **kwargs) -> Configuration:
+    """
+    :param int repos: How many repos to generate with :py:func:`make_repo`; `kwargs` are passed along to it.
+    """
+    return Configuration(users=[User(
+        name='synthetic',
+        repos=[make_repo(seed=seed + i, **kwargs) for i in range(repos)],
+        token='*****',
+        base_url='https://api.github.com',
+    )])
+
+
+def make_queries(repo: Repo, count: int, hit_rate: float=0.5, seed: int=0) -> list:
+    """
+    :return: `count` file paths, about `hit_rate` of which are watched by `repo`, either as a file or because they lie
+        under a watched directory.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        if repo.paths and rng.random() < hit_rate:
+            path = rng.choice(repo.paths).path
+            queries.append(path + 'inner/file.py' if path.endswith('/') else path)
+        else:
+            queries.append(make_filepath(rng))
+    return queries
+
+
+def make_patch(rng: random.Random, hunks: int=3, hunk_size: int=10) -> str:
+    """
+    :return: The hunks of one changed file, like the `patch` the API returns for it.
+    """
+    out = []
+    source_start = target_start = 1
+    for _ in range(hunks):
+        body = []
+        removed = added = 0
+        for _ in range(hunk_size):
+            kind = rng.choice(' +-')
+            body.append('{}    value = compute({}, "{}")'.format(kind, rng.randrange(10 ** 6), rng.choice(WORDS)))
+            removed += kind != '+'
+            added += kind != '-'
+        source_start += rng.randint(5, 200)
+        target_start += rng.randint(5, 200)
+        out.append('@@ -{},{} +{},{} @@ def function_{}():'.format(source_start, removed, target_start, added,
+                                                                  source_start))
+        out.extend(body)
+        source_start += removed
+        target_start += added
+    return '\n'.join(out)
+
+
+def make_head_files(files: int=10, hunks: int=3, hunk_size: int=10, repo: Repo=None, hit_rate: float=0.1,
+                    seed: int=0) -> list:
+    """
+    :return: `files` changed files, as the compare endpoint lists them. About `hit_rate` of them are watched by `repo`.
+    """
+    rng = random.Random(seed)
+    paths = make_queries(repo, files, hit_rate, seed) if repo is not None else \
+        [make_filepath(rng) for _ in range(files)]
+    return [{'filename': path, 'patch': make_patch(rng, hunks, hunk_size)} for path in paths]
+
+
+def make_diff(head_files: list) -> str:
+    """
+    :return: A unified diff of `head_files`, with the headers `unidiff` needs.
+    """
+    out = []
+    for head_file in head_files:
+        out.append('diff --git a/{0} b/{0}\n--- a/{0}\n+++ b/{0}\n{1}\n'.format(head_file['filename'],
+                                                                              head_file['patch']))
+    return ''.join(out)
@@ -1,3 +1,4 @@
+import github_watcher.notifier as notifier
 from github_watcher.commands.run import find_changes
 from github_watcher.commands.config import Configuration
 
@@ -5,4 +6,7 @@ from github_watcher.commands.config import Configuration
 def main(parser):
     conf = Configuration.from_file()
     conf.add_cli_options(parser.parse_args())
-    find_changes(conf)
+    try:
+        find_changes(conf)
+    finally:
+        notifier.shutdown()
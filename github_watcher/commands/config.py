@@ -30,32 +30,138 @@ the "top-level" configuration. Each user can have many repositories.
 
 The parameters in a repository are
 
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| parameter | type      | description                                                                                  |
-+===========+===========+==============================================================================================+
-| name      | str       | The name of the repository to watch. e.g. github_watcher                                     |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| paths     | Dict      | Relative file/directory paths (from the root of the project) are the keys. Lists of lists    |
-|           |           | containing line ranges are the value. If you pass a directory, you can just pass `null` as   |
-|           |           | the line ranges.                                                                             |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| regexes   | List[str] | A list of regexes for which to scan every pull request.                                      |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| token     | str       | Your secret user token that grants `User` and `Repo` privileges on the target repository.    |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| base_url  | str       | The base URL for the target github API. Defaults to https://api.gitub.com                    |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
-| users     | List[str] | A list of users. You'll receive an alert any time one of them submits a PR                   |
-+-----------+-----------+----------------------------------------------------------------------------------------------+
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| parameter   | type      | description                                                                                  |
++=============+===========+==============================================================================================+
+| name        | str       | The name of the repository to watch. e.g. github_watcher                                     |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| paths       | Dict      | Relative file/directory paths (from the root of the project) are the keys. Lists of lists    |
+|             |           | containing line ranges are the value. If you pass a directory, you can just pass `null` as   |
+|             |           | the line ranges.                                                                             |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| regexes     | List[str] | A list of regexes for which to scan every pull request.                                      |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| regex_lines | str       | Which lines of the diff `regexes` are scanned against. One of `all` (the default; every line |
+|             |           | including context and headers), `added`, `removed` or `changed` (added and removed).         |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| token       | str       | Your secret user token that grants `User` and `Repo` privileges on the target repository.    |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| base_url    | str       | The base URL for the target github API. Defaults to https://api.gitub.com                    |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+| users       | List[str] | A list of users. You'll receive an alert any time one of them submits a PR                   |
++-------------+-----------+----------------------------------------------------------------------------------------------+
+
+Besides users, a handful of top-level keys configure the watcher itself. Each overrides the setting of the same name,
+upper cased, in :py:mod:`github_watcher.settings`.
+
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| option              | type  | description                                                                                |
++=====================+=======+============================================================================================+
+| http_timeout        | float | Seconds to wait on the API before a request is abandoned. Defaults to 30.                  |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| http_pool_size      | int   | How many keep-alive connections are pooled per API host and token. Defaults to 10, and is  |
+|                     |       | raised to fit `fetch_concurrency` or the `pipeline_workers` making requests.               |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| fetch_mode          | str   | `serial` (the default) makes one API request at a time. `async` lists every repo and diffs |
+|                     |       | every pull request concurrently. `pipeline` runs listing, fetching, parsing, matching and  |
+|                     |       | alerting as stages with their own worker threads and bounded queues. `graphql` lists the   |
+|                     |       | open pull requests of many repos, with the paths of the files they change, in batched      |
+|                     |       | GraphQL queries, and only diffs the pull requests whose paths alone can't decide a match.  |
+|                     |       | `async` needs Python 3.5 or later.                                                         |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| fetch_concurrency   | int   | The most API requests in flight per base_url in `async` mode. Defaults to 8.               |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| diff_endpoint       | str   | `compare` (the default) diffs a pull request with one call to the compare endpoint, which  |
+|                     |       | lists no more than 300 files. `files` pages through the `pulls/{number}/files` endpoint    |
+|                     |       | instead, which lists up to 3000, evaluating each page as it arrives and fetching no more   |
+|                     |       | pages once a file matches.                                                                 |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| diff_parser         | str   | `hunks` (the default) reads only the hunk headers of each patch, which is all line ranges  |
+|                     |       | are matched against. `unidiff` parses every line of each patch with the `unidiff` package. |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| diff_cache_size     | int   | The most bytes of compressed compare results to keep in `~/.github-watcher-cache/diffs`.   |
+|                     |       | The least recently used are evicted first. 0 disables the cache. Defaults to 256 MB.       |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| http_cache_size     | int   | The most bytes of API responses to keep in `~/.github-watcher-cache/http` for conditional  |
+|                     |       | requests. The least recently used are evicted first. 0 disables the cache. Defaults to     |
+|                     |       | 64 MB.                                                                                     |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| pipeline_workers    | dict  | Worker threads per `pipeline` stage, keyed by stage name: list, fetch, parse, match and    |
+|                     |       | notify. Defaults to 2, 8, 2, 2 and 1.                                                      |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| pipeline_queue_size | int   | How many items can wait between `pipeline` stages before the stage feeding them blocks.    |
+|                     |       | Defaults to 100.                                                                           |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| depth_log_interval  | float | Seconds between logs of how many items wait on each `pipeline` stage's queue while a cycle |
+|                     |       | runs. A queue that keeps filling up is a bottleneck. 0 disables them. Defaults to 10.      |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| graphql_batch_size  | int   | The most repos listed per query in `graphql` mode. Defaults to 10.                         |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| graphql_page_size   | int   | The most pull requests listed per repo per query in `graphql` mode. Defaults to 25.        |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| graphql_files       | int   | The most changed paths listed per pull request in `graphql` mode. Larger pull requests are |
+|                     |       | diffed. Defaults to 100.                                                                   |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| rate_limit_reserve  | int   | API requests per token left unused in every rate limit window. Requests are paced so the   |
+|                     |       | rest last until the window resets. Defaults to 50.                                         |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| rate_limit_burst    | int   | API requests a token can make back to back before pacing starts. Defaults to 100.          |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| rate_limit_retries  | int   | How many times a request rejected by the rate limit is retried once the limit allows.      |
+|                     |       | Defaults to 3.                                                                             |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| alert_sinks         | list  | Where alerts are delivered. Each item has the `type` of a sink (`desktop`, `stdout`,       |
+|                     |       | `jsonl` with a `path`, or `http` with a `url`) and optionally its own `flush_interval` and |
+|                     |       | `buffer_size`. See :py:mod:`github_watcher.sinks`. Defaults to a single desktop sink.      |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| sink_flush_interval | float | Seconds alerts wait in a sink's buffer before they're written together, unless the sink    |
+|                     |       | sets its own. The desktop sink doesn't wait. Defaults to 5.                                |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| sink_buffer_size    | int   | The most alerts a sink buffers, unless the sink sets its own. A full buffer is written     |
+|                     |       | right away; if writing fails, the oldest alerts are dropped. Defaults to 500.              |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| notify_timeout      | float | Seconds a desktop notification stays up on Linux. Defaults to 5.                           |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| notify_queue_size   | int   | The most alerts that can wait for delivery. Alerts are delivered in the background; when   |
+|                     |       | this many are waiting, new ones are only logged. Defaults to 1000.                         |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| digest_window       | float | Alerts raised within this many seconds of each other are delivered as one digest           |
+|                     |       | notification, with counts per repo and per rule. 0 delivers every alert on its own.        |
+|                     |       | Defaults to 10.                                                                            |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| poll_interval       | float | Seconds between polls of a repo until its activity is known. Defaults to 600.              |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| poll_min_interval   | float | Each repo is polled about as often as it sees a new or updated pull request, but never     |
+|                     |       | more often than this. Defaults to 60.                                                      |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| poll_max_interval   | float | The longest a quiet repo goes between polls. Defaults to 1800.                             |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| webhook_host        | str   | The address `github-watcher serve` listens on for webhook deliveries. Defaults to          |
+|                     |       | 127.0.0.1.                                                                                 |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| webhook_port        | int   | The port `github-watcher serve` listens on. Defaults to 8900.                              |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| webhook_secret      | str   | The secret the webhooks are configured with. Deliveries without a valid `X-Hub-            |
+|                     |       | Signature-256` are rejected. Defaults to the GITHUB_WATCHER_WEBHOOK_SECRET environment     |
+|                     |       | variable.                                                                                  |
++---------------------+-------+--------------------------------------------------------------------------------------------+
+| catchup_interval    | float | Seconds between polls of every repo while serving webhooks, to catch up on missed          |
+|                     |       | deliveries. Defaults to 3600.                                                              |
++---------------------+-------+--------------------------------------------------------------------------------------------+
 
 Particular classes related to the grammar in configuration files follow.
 
 """
 
 from typing import List
+import bisect
+import hashlib
+import json
+import re
 
 import yaml
 
+import github_watcher.hunks as hunks
 import github_watcher.settings as settings
 
 
@@ -75,6 +181,39 @@ class Range:
         return [self.start, self.end]
 
 
+class RangeIndex:
+    """
+    A compiled form of a list of :py:class:`Range`. Overlapping ranges are merged into disjoint intervals
+    sorted by their start, so checking a changed line range against the index is a single binary search.
+
+    :param List[Range] ranges: The line ranges to index. Ranges that end before they start are ignored.
+    """
+
+    def __init__(self, ranges: List[Range]):
+        self.starts = []
+        self.ends = []
+        for watched in sorted(ranges, key=lambda r: r.start):
+            if watched.end < watched.start:
+                continue
+            if self.ends and watched.start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], watched.end)
+            else:
+                self.starts.append(watched.start)
+                self.ends.append(watched.end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end) -> bool:
+        """
+        :param start: The first line of the changed range.
+        :param end: The last line of the changed range.
+        :return: True if any indexed range shares at least one line with `start`...`end`.
+        """
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i >= 0 and self.ends[i] >= start
+
+
 class Path:
     """
     :param str path: Represents a path to watch. Container for line ranges in that path. This can be a file or a directory
@@ -84,6 +223,20 @@ class Path:
     def __init__(self, path: str, ranges: List[Range]):
         self.path = path
         self.ranges = ranges
+        self._index = None
+
+    @property
+    def index(self) -> RangeIndex:
+        """
+        The :py:class:`RangeIndex` compiled from `ranges`. It's built on first use; call :py:meth:`recompile` after
+        changing `ranges`.
+        """
+        if self._index is None:
+            self._index = RangeIndex(self.ranges)
+        return self._index
+
+    def recompile(self):
+        self._index = None
 
     def to_json(self):
         return {
@@ -91,36 +244,204 @@ class Path:
         }
 
 
+class WatchMatcher:
+    """
+    A compiled form of the paths configured on a :py:class:`Repo`. Exact file paths are kept in a hash table and watched
+    directories in a trie keyed on path components, so a lookup costs O(depth of the file) no matter how many paths are
+    configured.
+
+    :param List[Path] paths: The path configurations to compile.
+    """
+
+    DIRECTORY = object()  # Marks a trie node as the end of a watched directory.
+
+    def __init__(self, paths: List[Path]):
+        self.files = {}
+        self.directories = {}
+        for path in paths:
+            if path.path.endswith('/'):
+                self.add_directory(path.path)
+            else:
+                self.files.setdefault(path.path, path)
+
+    @classmethod
+    def from_repo(cls, repo):
+        return WatchMatcher(repo.paths)
+
+    def add_directory(self, directory: str):
+        node = self.directories
+        for component in directory.split('/')[:-1]:
+            node = node.setdefault(component, {})
+        node[WatchMatcher.DIRECTORY] = True
+
+    def watched_file(self, filepath: str) -> Path or None:
+        """
+        :param str filepath: The relative path to a changed file.
+        :return: The :py:class:`Path` configured for exactly `filepath`, or None.
+        """
+        return self.files.get(filepath)
+
+    def watched_directory(self, filepath: str) -> bool:
+        """
+        :param str filepath: The relative path to a changed file.
+        :return: True if `filepath` lies under one of the watched directories.
+        """
+        node = self.directories
+        for component in filepath.split('/')[:-1]:
+            node = node.get(component)
+            if node is None:
+                return False
+            if WatchMatcher.DIRECTORY in node:
+                return True
+        return False
+
+
+class RegexMatcher:
+    """
+    A compiled form of the regexes configured on a :py:class:`Repo`. The regexes are joined into one alternation of
+    non-capturing groups, so each line is scanned once no matter how many regexes are configured. Only a line the
+    alternation matches is searched again with each regex on its own, in order, to tell which one matched. (A named
+    group per regex would tell directly, but CPython's `re` slows down quadratically with the number of groups.)
+    Regexes that can't share an alternation (they have their own groups, which could be back-referenced by number, or
+    inline flags) are compiled on their own and tried after it.
+
+    :param List[str] regexes: The regular expressions to compile.
+    :param str lines: Which lines of a diff to scan. See :py:attr:`LINES`.
+    """
+
+    # Maps the `regex_lines` setting to the markers of the hunk lines it scans. `all` scans every line of the blob.
+    LINES = {
+        'all': None,
+        'added': '+',
+        'removed': '-',
+        'changed': '+-',
+    }
+
+    def __init__(self, regexes: List[str], lines: str='all'):
+        if lines not in RegexMatcher.LINES:
+            raise ValueError("regex_lines must be one of {}, not <{}>".format(
+                ', '.join(sorted(RegexMatcher.LINES)), lines))
+        self.regexes = list(regexes)
+        self.markers = RegexMatcher.LINES[lines]
+        self.shared = []
+        self.standalone = []
+        default_flags = re.compile('').flags
+        for regex in self.regexes:
+            compiled = re.compile(regex)
+            if compiled.groups or compiled.flags != default_flags:
+                self.standalone.append((regex, compiled))
+            else:
+                self.shared.append((regex, compiled))
+        self.combined = None
+        if self.shared:
+            self.combined = re.compile('|'.join('(?:{})'.format(regex) for regex, _ in self.shared))
+
+    def lines(self, blob: str):
+        """
+        Yields the lines of `blob` that should be scanned. When only added and/or removed lines are scanned, `blob` is
+        read as a unified diff and the +/- marker is stripped from each line yielded.
+
+        :param str blob: A blob of text, usually a diff.
+        """
+        if self.markers is None:
+            for line in blob.splitlines():
+                yield line
+            return
+        yield from hunks.changed_lines(blob, self.markers)
+
+    def search(self, blob: str) -> str or None:
+        """
+        :param str blob: A blob of text to scan.
+        :return: The first configured regex found in `blob`, or None if there was no match.
+        """
+        if not self.regexes:
+            return None
+        for line in self.lines(blob):
+            if self.combined is not None and self.combined.search(line):
+                for regex, compiled in self.shared:
+                    if compiled.search(line):
+                        return regex
+            for regex, compiled in self.standalone:
+                if compiled.search(line):
+                    return regex
+        return None
+
+
 class Repo:
     """
     :param str name: The name of the repository being watched.
     :param List[Path] paths: A list of path configurations to watch in the repository.
     :param List[str] regexes: A list of strings, regular expressions to search in the pull request diffs.
     :param List[str] users: A list of authors to watch. If any submit any PR it will be alerted.
+    :param str regex_lines: Which lines of the diff `regexes` are scanned against. See :py:attr:`RegexMatcher.LINES`.
     """
 
-    def __init__(self, name: str, paths: List[Path]=None, regexes: List[str]=None, users: List[str]=None):
+    def __init__(self, name: str, paths: List[Path]=None, regexes: List[str]=None, users: List[str]=None,
+                 regex_lines: str='all'):
         self.name = name
         self.paths = paths
         self.regexes = regexes
         self.users = users
+        self.regex_lines = regex_lines
         if paths is None:
             self.paths = []
         if regexes is None:
             self.regexes = []
         if users is None:
             self.users = []
+        self._matcher = None
+        self._regex_matcher = None
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        A digest of everything that decides whether a pull request matches this repo. It changes whenever the paths,
+        ranges, regexes or users do.
+        """
+        if self._fingerprint is None:
+            serialized = json.dumps(self.to_json(), sort_keys=True)
+            self._fingerprint = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    @property
+    def matcher(self) -> WatchMatcher:
+        """
+        The :py:class:`WatchMatcher` compiled from `paths`. It's built on first use; call :py:meth:`recompile` after
+        changing `paths`.
+        """
+        if self._matcher is None:
+            self._matcher = WatchMatcher.from_repo(self)
+        return self._matcher
+
+    @property
+    def regex_matcher(self) -> RegexMatcher:
+        """
+        The :py:class:`RegexMatcher` compiled from `regexes`. It's built on first use; call :py:meth:`recompile` after
+        changing `regexes` or `regex_lines`.
+        """
+        if self._regex_matcher is None:
+            self._regex_matcher = RegexMatcher(self.regexes, self.regex_lines)
+        return self._regex_matcher
+
+    def recompile(self):
+        self._matcher = None
+        self._regex_matcher = None
+        self._fingerprint = None
 
     def to_json(self):
         paths = {}
         for p in self.paths:
             paths.update(p.to_json())
+        repo = {
+            'paths': paths,
+            'regexes': [r for r in self.regexes] if self.regexes else [],
+            'users': [u for u in self.users] if self.users else [],
+        }
+        if self.regex_lines != 'all':
+            repo['regex_lines'] = self.regex_lines
         return {
-            self.name: {
-                'paths': paths,
-                'regexes': [r for r in self.regexes] if self.regexes else [],
-                'users': [u for u in self.users] if self.users else [],
-            }
+            self.name: repo
         }
 
     @classmethod
@@ -135,7 +456,8 @@ class Repo:
             name=name,
             paths=paths,
             users=yml.get('users'),
-            regexes=yml.get('regexes')
+            regexes=yml.get('regexes'),
+            regex_lines=yml.get('regex_lines') or 'all'
         )
 
 
@@ -180,19 +502,64 @@ class Configuration:
     :param List[User] users: A list of users with repository configurations to watch.
     :param bool silent: Silent audio alerts. This is a commandline options, --silent.
     :param bool verbose: Verbose logging (warning: prints access tokens). This is a commandline arg, --verbose.
+    :param dict options: Top-level options overriding :py:mod:`github_watcher.settings`. See :py:attr:`OPTIONS`.
     """
 
-    def __init__(self, users: List[User], silent: bool=False, verbose: bool=False):
+    # Top-level keys that configure the watcher rather than name a user.
+    OPTIONS = (
+        'http_timeout',
+        'http_pool_size',
+        'fetch_mode',
+        'fetch_concurrency',
+        'diff_endpoint',
+        'diff_parser',
+        'diff_cache_size',
+        'http_cache_size',
+        'pipeline_workers',
+        'pipeline_queue_size',
+        'depth_log_interval',
+        'graphql_batch_size',
+        'graphql_page_size',
+        'graphql_files',
+        'rate_limit_reserve',
+        'rate_limit_burst',
+        'rate_limit_retries',
+        'alert_sinks',
+        'sink_flush_interval',
+        'sink_buffer_size',
+        'notify_timeout',
+        'notify_queue_size',
+        'digest_window',
+        'poll_interval',
+        'poll_min_interval',
+        'poll_max_interval',
+        'webhook_host',
+        'webhook_port',
+        'webhook_secret',
+        'catchup_interval',
+    )
+    RESERVED = OPTIONS + ('silent', 'verbose')
+
+    def __init__(self, users: List[User], silent: bool=False, verbose: bool=False, options: dict=None):
         self.users = users
         self.silent = silent
         self.verbose = verbose
+        self.options = options or {}
 
     def to_json(self):
         users = {}
         for user in self.users:
             users.update(user.to_json())
+        users.update(self.options)
         return users
 
+    def apply_options(self):
+        """
+        Overrides :py:mod:`github_watcher.settings` with the options in this configuration.
+        """
+        for option, value in self.options.items():
+            setattr(settings, option.upper(), value)
+
     def append_ranges(self, source: List[Range], destination: List[Range]):
         for source_range in source:
             destination.append(source_range)
@@ -201,6 +568,7 @@ class Configuration:
         for dest_path in destination:
             if source_path.path == dest_path.path:
                 self.append_ranges(source_path.ranges, dest_path.ranges)
+                dest_path.recompile()
                 return
         destination.append(source_path)
 
@@ -212,6 +580,7 @@ class Configuration:
         for dest in destination:
             if dest.name == source.name:
                 self.append_paths(source.paths, dest.paths)
+                dest.recompile()
                 return
         destination.append(source)
 
@@ -232,9 +601,11 @@ class Configuration:
         if not yml:
             raise RuntimeError("No configuration found.")
         return Configuration(
-            users=[User.from_json(name, user_conf) for name, user_conf in yml.items()],
+            users=[User.from_json(name, user_conf) for name, user_conf in yml.items()
+                   if name not in Configuration.RESERVED],
             silent=yml.get('silent', False),
-            verbose=yml.get('verbose', False)
+            verbose=yml.get('verbose', False),
+            options={option: yml[option] for option in Configuration.OPTIONS if option in yml}
         )
 
     @classmethod
@@ -243,9 +614,11 @@ class Configuration:
             filepath = settings.WATCHER_CONFIG
         try:
             with open(filepath, 'rb') as config:
-                return Configuration.from_json(yaml.load(config.read().decode('utf-8')))
+                conf = Configuration.from_json(yaml.load(config.read().decode('utf-8')))
         except IOError as e:
             raise RuntimeError("Config file not found <{}>".format(filepath))
+        conf.apply_options()
+        return conf
 
     def add_cli_options(self, options):
         if not options:
@@ -0,0 +1,75 @@
+"""
+The Post Event Command Module
+-----------------------------
+
+This module implements `github-watcher post-event`, which signs a webhook payload and posts it to a running
+`github-watcher serve` the way GitHub delivers webhooks. It's useful for trying out `serve` locally.
+
+It only needs the standard library, so unlike `serve` it doesn't import the GitHub client or `requests`.
+
++------------------+---------------------------------------------------------------------------------------------+
+| CLI Argument     | Description                                                                                 |
++==================+=============================================================================================+
+| --payload        | The path of a JSON payload to sign and post to a running `serve`.                           |
++------------------+---------------------------------------------------------------------------------------------+
+| --url            | Where to post the payload. Defaults to the configured `webhook_host` and `webhook_port`.    |
++------------------+---------------------------------------------------------------------------------------------+
+| --event          | The `X-GitHub-Event` to post the payload as. Defaults to `pull_request`.                    |
++------------------+---------------------------------------------------------------------------------------------+
+
+"""
+import hashlib
+import hmac
+import json
+import urllib.error
+import urllib.request
+import uuid
+
+import github_watcher.settings as settings
+import github_watcher.commands.config as config
+
+
+def sign(secret: str, body: bytes) -> str:
+    """
+    :return: The `X-Hub-Signature-256` header GitHub sends with `body` for a webhook configured with `secret`.
+    """
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def get_secret() -> str:
+    if not settings.WEBHOOK_SECRET:
+        raise RuntimeError("Set webhook_secret in {} or GITHUB_WATCHER_WEBHOOK_SECRET to the secret the webhook is "
+                           "configured with.".format(settings.WATCHER_CONFIG))
+    return settings.WEBHOOK_SECRET
+
+
+def post_event(url: str, payload: dict, secret: str, event: str='pull_request') -> int:
+    """
+    Signs and posts `payload` the way GitHub delivers webhooks.
+
+    :param str url: Where `serve` is listening.
+    :param dict payload: The webhook payload.
+    :param str secret: The secret `serve` is configured with.
+    :param str event: The `X-GitHub-Event` header.
+    :return: The HTTP status `serve` responded with.
+    """
+    body = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-GitHub-Event': event,
+        'X-GitHub-Delivery': str(uuid.uuid4()),
+        'X-Hub-Signature-256': sign(secret, body),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=settings.HTTP_TIMEOUT) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main(parser):
+    args = parser.parse_args()
+    config.Configuration.from_file()
+    url = args.url or 'http://{}:{}/'.format(settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    with open(args.payload) as payload:
+        print(post_event(url, json.load(payload), get_secret(), event=args.event))
@@ -6,27 +6,24 @@ The Run Command Module
 This module contains the business logic for the `watch` functionality. It interprets configurations and evaluates files
 against those configurations.
 
-It also manages alerting on those files across Linux and Darwin systems.
+It also raises alerts on those files, which :py:mod:`github_watcher.notifier` delivers across Linux and Darwin systems.
 
 """
 from typing import Tuple
-import re
-import os
+import collections
 import logging
-import subprocess
-import time
-import platform
-import unidiff
+import threading
 
 import github_watcher.settings as settings
+import github_watcher.notifier as notifier
+import github_watcher.pipeline as pipeline
+import github_watcher.scheduler as scheduler
 import github_watcher.commands.config as config
 import github_watcher.services.git as git
+import github_watcher.services.store as store
 
-SYSTEM = platform.system()
-if SYSTEM == 'Darwin':
-    from pync import Notifier
-if SYSTEM == 'Linux' and os.environ.get('TRAVIS') != 'true':
-    import notify2
+FETCH_MODES = ('serial', 'async', 'pipeline', 'graphql')
+UPDATED_AT_FORMAT = '%Y-%m-%dT%H:%M:%SZ'  # how the API formats `updated_at`
 
 
 def is_watched_file(repo: config.Repo, hunk_path: str) -> config.Path or False:
@@ -39,10 +36,7 @@ def is_watched_file(repo: config.Repo, hunk_path: str) -> config.Path or False:
     """
     if not repo or not repo.paths:
         return False
-    for path in repo.paths:
-        if hunk_path == path.path:
-            return path
-    return False
+    return repo.matcher.watched_file(hunk_path) or False
 
 
 def is_watched_directory(repo: config.Repo, hunk_path: str) -> bool:
@@ -57,15 +51,27 @@ def is_watched_directory(repo: config.Repo, hunk_path: str) -> bool:
     """
     if not repo or not repo.paths:
         return False
-    for path in repo.paths:
-        if path.path.endswith('/') and hunk_path.startswith(path.path):
-            return True
-    return False
+    return repo.matcher.watched_directory(hunk_path)
+
+
+def watched_regex(repo: config.Repo, blob: str) -> str or None:
+    """
+    Searches a blob of text for a match to the regexes configured as the `regexes` attribute of `repo`. Only the lines
+    selected by the repo's `regex_lines` setting are scanned.
+
+    :param :py:class:`config.Repo`: The repo for which `regexes` is configured.
+    :param str blob: A blob of text to check for the regex.
+
+    :return: The configured regex that matched, or None.
+    """
+    if not repo.regexes:
+        return None
+    return repo.regex_matcher.search(blob)
 
 
 def contains_watched_regex(repo: config.Repo, blob: str) -> bool:
     """
-    Searches a blob of text for a match to the regexes configured as the `watched_regexes` attribute of `conf`.
+    Searches a blob of text for a match to the regexes configured as the `regexes` attribute of `repo`.
 
     :param :py:class:`config.Repo`: The repo for which `regexes` is configured.
     :param str blob: A blob of text to check for the regex.
@@ -73,12 +79,7 @@ def contains_watched_regex(repo: config.Repo, blob: str) -> bool:
     :rtype: bool
     :return: True if `blob` contains one of the configured regexes.
     """
-    lines = blob.splitlines()
-    for regex in repo.regexes:
-        for line in lines:
-            if re.search(regex, line):
-                return True
-    return False
+    return watched_regex(repo, blob) is not None
 
 
 def submitted_by_watched_user(repo: config.Repo, author) -> bool:
@@ -88,63 +89,92 @@ def submitted_by_watched_user(repo: config.Repo, author) -> bool:
     return False
 
 
-def alert(file: str, range: Tuple[int, int], pr_link: str, silent=False) -> None:
+def alert(file: str, range: Tuple[int, int], pr_link: str, silent=False, rule: str=None) -> None:
     """
     Alerts that a file has been changed over range `range`. Also provides a link as supported by the target system.
+    The alert is logged, then queued for :py:class:`notifier.NotificationWorker` to deliver, so this never waits on the
+    system.
 
     :param str file: The name of the file that has been changed.
     :param tuple range: The range over which the change coincides with the watcher configuration.
     :param str pr_link: A link to the pull request containing the change.
     :param bool silent: Whether or not to silence audio alerts.
+    :param str rule: The kind of rule that matched, counted when alerts are coalesced into a digest.
     :return: None
     """
     msg = 'Found a PR effecting {file} {range}'.format(file=file, range=str(range))
     logging.info(msg)
-    if SYSTEM == 'Darwin':
-        if not silent:
-            subprocess.call('say ' + msg, shell=True)
-        Notifier.notify(msg, title='Github Watcher', open=pr_link)
-    elif SYSTEM == 'Linux' and os.environ.get('TRAVIS') != 'true':
-        notify2.init(app_name='github-watcher')
-        note = notify2.Notification(
-            'Github Watcher', message=msg)
-        note.show()
-        time.sleep(5)
-        note.close()
-
-
-def are_watched_lines(path: config.Path, start, end):
+    notifier.get_worker().put(msg, pr_link, silent=silent, rule=rule)
+
+
+def are_watched_lines(path: config.Path, start, end) -> bool:
+    """
+    Determines whether the changed lines `start` through `end` overlap any line range watched at `path`.
+
+    :param :py:class:`config.Path` path: The watched file configuration.
+    :param int start: The first changed line.
+    :param int end: The last changed line.
+    :return: True if any of the ranges configured for `path` overlaps the change.
+    """
     if not path.ranges:
         return False
     if end < start:
         raise ValueError("Changed line ranges were out of order.")
-    for watched in path.ranges:
-        if start < watched.start and end < watched.start:
-            return False
-        if start > watched.end:
-            return False
-    return True
+    return path.index.overlaps(start, end)
 
 
-def alert_if_watched_changes(conf: config.Configuration, user: config.User, repo: config.Repo,
-                             patched_file, link, diffstring, source_or_target='source', author=None):
+class Match:
+    """
+    Describes why a pull request is of interest.
+
+    :param str rule: The kind of rule that matched. One of `user`, `regex`, `directory` or `lines`.
+    :param str file: The file the match was found in.
+    :param range: The changed line range overlapping a watched range when `rule` is `lines`; otherwise empty.
+    :param str detail: The author for a `user` match, or the regex for a `regex` match.
+    """
+
+    def __init__(self, rule: str, file: str='', range: Tuple[int, int] or str='', detail: str=None):
+        self.rule = rule
+        self.file = file
+        self.range = range
+        self.detail = detail
+
+    def __eq__(self, other):
+        return isinstance(other, Match) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        return 'Match({})'.format(self.to_json())
+
+    def to_json(self):
+        return {
+            'rule': self.rule,
+            'file': self.file,
+            'range': self.range,
+            'detail': self.detail,
+        }
+
+
+def get_filepath(patched_file, source_or_target='source') -> str:
     filepath = getattr(patched_file, source_or_target + '_file')
     if filepath.startswith('a/') or filepath.startswith('b/'):
         filepath = filepath[2:]
+    return filepath
 
-    if already_alerted(link):
-        return False
 
-    if submitted_by_watched_user(repo, author):
-        alert(filepath, '', link)
-        mark_as_alerted(link)
-        return True
-
-    if is_watched_directory(repo, filepath) or contains_watched_regex(repo, diffstring):
-        alert(filepath, '', link)
-        mark_as_alerted(link)
-        return True
+def evaluate_file(repo: config.Repo, patched_file, source_or_target='source') -> Match or None:
+    """
+    Checks one side of a changed file against the directories, files and line ranges watched in `repo`.
 
+    :param :py:class:`config.Repo` repo: The repo configuration.
+    :param unidiff.PatchedFile patched_file: The changed file.
+    :param str source_or_target: Which side of the change to evaluate.
+    :return: The :py:class:`Match` found, or None.
+    """
+    if not repo.paths:
+        return None
+    filepath = get_filepath(patched_file, source_or_target)
+    if is_watched_directory(repo, filepath):
+        return Match('directory', filepath)
     path = is_watched_file(repo, filepath)
     if path:
         for hunk in patched_file:
@@ -152,60 +182,382 @@ def alert_if_watched_changes(conf: config.Configuration, user: config.User, repo
             offset = getattr(hunk, source_or_target + '_length')
             end = start + offset
             if are_watched_lines(path, start, end):
-                alert(filepath, (start, end), link, silent=conf.silent)
-                mark_as_alerted(link)
-                return True
+                return Match('lines', filepath, (start, end))
+    return None
+
+
+def evaluate_paths(repo: config.Repo, files: list, author: str=None) -> Match or None or bool:
+    """
+    Evaluates a pull request against `repo` from the paths of the files it changes alone, without its diff.
+
+    :param :py:class:`config.Repo` repo: The repo configuration.
+    :param list files: The files the pull request changes, each with its `path` and `changeType`, as
+        :py:func:`git.open_pull_requests_graphql` lists them.
+    :param str author: The login of the pull request's author.
+    :return: The :py:class:`Match` found, None if nothing can match, or True if the diff is needed to tell: the repo
+        watches regexes, one of the paths is a watched file whose changed lines have to be checked, or a file was
+        renamed. Only the diff names the path a renamed file was moved from, which may be watched.
+    """
+    if submitted_by_watched_user(repo, author):
+        return Match('user', files[0]['path'] if files else '', detail=author)
+    if repo.regexes:
+        return True
+    if not repo.paths:
+        return None
+    for file in files:
+        path = file['path']
+        if file.get('changeType') == 'RENAMED':
+            return True
+        if is_watched_directory(repo, path):
+            return Match('directory', path)
+        if is_watched_file(repo, path):
+            return True
+    return None
+
+
+def watched_files(repo: config.Repo, head_files):
+    """
+    Yields the changed files whose patches have to be read to evaluate them against `repo`. Without regexes to scan
+    for, that's only the files with a watched path, so every other file is skipped by its name alone and its patch is
+    never parsed.
+
+    :param :py:class:`config.Repo` repo: The repo configuration.
+    :param head_files: An iterable of changed files, as :py:func:`git.diff_files` yields them.
+    """
+    if repo.regexes:
+        yield from head_files
+        return
+    if not repo.paths:
+        return
+    for head_file in head_files:
+        for path in (head_file.get('previous_filename'), head_file.get('filename')):
+            if path and (is_watched_directory(repo, path) or is_watched_file(repo, path)):
+                yield head_file
+                break
+
+
+def evaluate_files(repo: config.Repo, patched_files, author: str=None) -> Match or None:
+    """
+    Evaluates a pull request one changed file at a time. When `patched_files` is lazy, like
+    :py:func:`git.patched_files` over :py:func:`git.diff_files`, no file is fetched if the author is watched, and no
+    more are fetched or parsed once a file matches.
+
+    :param :py:class:`config.Repo` repo: The repo configuration.
+    :param patched_files: An iterable of `(patched_file, patch)` tuples, as :py:func:`git.patched_files` yields them.
+        Each patch is scanned for `repo.regexes`, after the file's diff headers when `repo.regex_lines` is `all`.
+    :param str author: The login of the pull request's author.
+    :return: The first :py:class:`Match` found, or None.
+    """
+    if submitted_by_watched_user(repo, author):
+        return Match('user', detail=author)
+    for patched_file, patch in patched_files:
+        regex = None
+        if repo.regex_lines == 'all':
+            regex = watched_regex(repo, git.diff_headers(patched_file.source_file, patched_file.target_file))
+        if regex is None:
+            regex = watched_regex(repo, patch)
+        if regex is not None:
+            return Match('regex', get_filepath(patched_file, 'target'), detail=regex)
+        for source_or_target in ('source', 'target'):
+            match = evaluate_file(repo, patched_file, source_or_target)
+            if match:
+                return match
+    return None
+
+
+def alert_match(conf: config.Configuration, match: Match, link: str) -> None:
+    alert(match.file, match.range, link, silent=conf.silent, rule=match.rule)
+    mark_as_alerted(link)
+
+
+def alert_if_watched_changes(conf: config.Configuration, user: config.User, repo: config.Repo,
+                             patched_file, link, diffstring, source_or_target='source', author=None):
+    """
+    Evaluates a single side of a single changed file, along with the pull request level rules, and alerts on a match.
+    :py:func:`find_changes` evaluates whole pull requests with :py:func:`evaluate_files` instead.
+    """
+    if already_alerted(link):
+        return False
+
+    filepath = get_filepath(patched_file, source_or_target)
+    if submitted_by_watched_user(repo, author):
+        match = Match('user', filepath, detail=author)
+    elif contains_watched_regex(repo, diffstring):
+        match = Match('regex', filepath)
+    else:
+        match = evaluate_file(repo, patched_file, source_or_target)
+
+    if match:
+        alert_match(conf, match, link)
+        return True
     return False
 
 
 def mark_as_alerted(pr_link):
-    with open(settings.WATCHER_ALERT_LOG, 'a+') as fp:
-        fp.write(pr_link + '\n')
-        fp.flush()
+    store.get_store().mark_alerted(pr_link)
 
 
 def already_alerted(pr_link):
+    return store.get_store().is_alerted(pr_link)
+
+
+def pull_request_state(repo: config.Repo, open_pr) -> tuple or None:
+    """
+    Decides whether `open_pr` needs to be evaluated against `repo`.
+
+    :return: The `(link, base_sha, head_sha, fingerprint)` to record once `open_pr` is evaluated, or None if it has
+        already been alerted on or hasn't changed since it was last evaluated.
+    """
+    link = open_pr.html_url
+    logging.info("Checking link %s for overlaps in watched files...", link)
+    if already_alerted(link):
+        return None
+    state = (link, open_pr.base.sha, open_pr.head.sha, repo.fingerprint)
+    if store.get_store().is_unchanged(*state):
+        logging.info("Skipping %s, nothing has changed since it was last checked.", link)
+        return None
+    return state
+
+
+def record_match(conf: config.Configuration, open_pr, state: tuple, match: Match or None) -> Match or None:
+    """
+    Records the outcome of evaluating `open_pr` under `state` and alerts on a match.
+    """
+    store.get_store().record_pull_request(*state, result=match.rule if match else '')
+    if match:
+        logging.info("Found %s in %s", match, open_pr.html_url)
+        alert_match(conf, match, open_pr.html_url)
+    return match
+
+
+class Activity:
+    """
+    Counts, per repo, the pull requests found new or changed during a cycle, and tracks the most recent `updated_at` of
+    the pull requests listed. Keys are `(user name, repo name)`.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.updated_at = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return self.counts[key]
+
+    def add(self, user: config.User, repo: config.Repo):
+        with self.lock:
+            self.counts[(user.name, repo.name)] += 1
+
+    def seen(self, user: config.User, repo: config.Repo, open_pr):
+        updated_at = open_pr.updated_at.strftime(UPDATED_AT_FORMAT)
+        key = (user.name, repo.name)
+        with self.lock:
+            if updated_at > self.updated_at.get(key, ''):
+                self.updated_at[key] = updated_at
+
+
+def cursor_key(user: config.User, repo: config.Repo) -> str:
+    return '{}/repos/{}/{}'.format(user.base_url, user.name, repo.name)
+
+
+def list_pull_requests(user: config.User, repo: config.Repo, activity: Activity):
+    """
+    Yields the open pull requests in `repo` updated since the end of the last cycle that completed, or all of them if
+    the repo's configuration has changed since.
+    """
+    since = store.get_store().get_cursor(cursor_key(user, repo), repo.fingerprint)
+    for open_pr in git.open_pull_requests(user.base_url, user.token, user.name, repo.name, since=since):
+        activity.seen(user, repo, open_pr)
+        yield open_pr
+
+
+def save_cursors(targets, activity: Activity):
+    """
+    Moves the cursor of every targeted repo up to the most recently updated pull request listed in it. Only called
+    once a cycle completed, so pull requests whose evaluation failed are listed again next time.
+    """
+    for user, repo in targets:
+        updated_at = activity.updated_at.get((user.name, repo.name))
+        if updated_at is not None:
+            store.get_store().set_cursor(cursor_key(user, repo), updated_at, repo.fingerprint)
+
+
+def find_changes(conf, targets=None) -> Activity:
+    """
+    Checks the open pull requests in the targeted repos that were updated since the last cycle. How the API is called is
+    decided by `settings.FETCH_MODE`: `serial` makes one request at a time, `async` overlaps them with a
+    :py:class:`fetcher.AsyncFetcher`, `pipeline` runs the cycle as a staged :py:class:`pipeline.Pipeline` (see
+    :py:func:`find_changes_pipeline`) and `graphql` lists pull requests in batched GraphQL queries (see
+    :py:func:`find_changes_graphql`).
+
+    :param :py:class:`config.Configuration` conf: The configuration to check.
+    :param targets: A list of `(user, repo)` configurations to check. Defaults to every repo in `conf`.
+    :return: The :py:class:`Activity` seen in each targeted repo.
+    """
+    if settings.FETCH_MODE not in FETCH_MODES:
+        raise ValueError("fetch_mode must be one of {}, not <{}>".format(', '.join(FETCH_MODES), settings.FETCH_MODE))
+    if targets is None:
+        targets = [(user, repo) for user in conf.users for repo in user.repos]
+    activity = Activity()
     try:
-        with open(settings.WATCHER_ALERT_LOG, 'rb') as fp:
-            alerted = fp.readlines()
-            for line in alerted:
-                line = line.decode('utf-8')
-                if pr_link in line:
-                    return True
-    except IOError:
-        pass
-    return False
+        if settings.FETCH_MODE == 'async':
+            import github_watcher.fetcher as fetcher
+            fetcher.find_changes(conf, targets, activity)
+        elif settings.FETCH_MODE == 'pipeline':
+            find_changes_pipeline(conf, targets, activity)
+        elif settings.FETCH_MODE == 'graphql':
+            find_changes_graphql(conf, targets, activity)
+        else:
+            _find_changes(conf, targets, activity)
+        save_cursors(targets, activity)
+    finally:
+        store.flush()
+    return activity
+
+
+def _find_changes(conf, targets, activity):
+    for user, repo in targets:
+        logging.info("Searching for pull requests in repo %s...", repo.name)
+        open_prs = list(list_pull_requests(user, repo, activity))
+        logging.info("Found %s pull requests in %s", len(open_prs), repo.name)
+        for open_pr in open_prs:
+            check_pull_request(conf, user, repo, open_pr, activity)
+
+
+def check_pull_request(conf, user, repo, open_pr, activity=None) -> Match or None:
+    """
+    Diffs and evaluates a single pull request, unless it has been alerted on or hasn't changed since it was last checked.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check against.
+    :param :py:class:`config.User` user: The owner of the repo.
+    :param :py:class:`config.Repo` repo: The repo the pull request was opened against.
+    :param open_pr: The pull request.
+    :param :py:class:`Activity` activity: Counts the pull request if it was new or changed.
+    :return: The match, if any.
+    """
+    state = pull_request_state(repo, open_pr)
+    if state is None:
+        return None
+    if activity is not None:
+        activity.add(user, repo)
+    return check_diff(conf, user, repo, open_pr, state)
+
 
+def check_diff(conf, user, repo, open_pr, state: tuple) -> Match or None:
+    """
+    Evaluates the files `open_pr` changes as they're fetched and parsed, records the outcome under `state` and alerts
+    on a match.
+    """
+    try:
+        patched_files = git.patched_files(watched_files(repo, git.diff_files(user.base_url, user.token, open_pr)))
+        return record_match(conf, open_pr, state, evaluate_files(repo, patched_files, open_pr.user.login))
+    except git.Noop:
+        store.get_store().record_pull_request(*state, result='noop')
 
-def find_changes(conf):
-    for user in conf.users:
-        for repo in user.repos:
-            logging.info("Searching for pull requests in repo %s...", repo.name)
-            open_prs = [pr for pr in git.open_pull_requests(user.base_url, user.token, user.name, repo.name)]
-            logging.info("Found %s pull requests in %s", len(open_prs), repo.name)
-            for open_pr in open_prs:
-                author = open_pr.user.login
-                link = open_pr.html_url
-                logging.info("Checking link %s for overlaps in watched files...", link)
-                try:
-                    diffstring = git.diff(user.base_url, user.token, open_pr)
-                    patchset = unidiff.PatchSet.from_string(diffstring)
-                except git.Noop:
-                    continue
-                for patched_file in patchset:
-                    if alert_if_watched_changes(
-                            conf, user, repo, patched_file, link, diffstring, 'source', author):
-                        continue
-                    if alert_if_watched_changes(
-                        conf, user, repo, patched_file, link, diffstring, 'target', author):
-                        continue
+
+def find_changes_pipeline(conf, targets, activity):
+    """
+    Like :py:func:`find_changes` in `serial` mode, but the cycle runs as a pipeline of stages: list pull requests, fetch
+    diffs, parse, match and notify. Each stage has its own worker threads (`settings.PIPELINE_WORKERS`) and bounded
+    queue (`settings.PIPELINE_QUEUE_SIZE`), so parsing one repo overlaps fetching the next and a slow stage applies
+    backpressure instead of buffering. Queue depths are logged every `settings.DEPTH_LOG_INTERVAL` seconds while the
+    cycle runs, and per stage stats when it ends.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check.
+    :param targets: A list of `(user, repo)` configurations to check.
+    :param :py:class:`Activity` activity: Counts the new and changed pull requests.
+    """
+    def list_repo(item):
+        user, repo = item
+        logging.info("Searching for pull requests in repo %s...", repo.name)
+        for open_pr in list_pull_requests(user, repo, activity):
+            state = pull_request_state(repo, open_pr)
+            if state is not None:
+                activity.add(user, repo)
+                yield user, repo, open_pr, state
+
+    def fetch(item):
+        user, repo, open_pr, state = item
+        try:
+            yield item + (list(git.diff_files(user.base_url, user.token, open_pr)),)
+        except git.Noop:
+            store.get_store().record_pull_request(*state, result='noop')
+
+    def parse(item):
+        user, repo, open_pr, state, files = item
+        yield user, repo, open_pr, state, list(git.patched_files(watched_files(repo, files)))
+
+    def match(item):
+        user, repo, open_pr, state, patched_files = item
+        found = evaluate_files(repo, patched_files, open_pr.user.login)
+        store.get_store().record_pull_request(*state, result=found.rule if found else '')
+        if found:
+            logging.info("Found %s in %s", found, open_pr.html_url)
+            yield found, open_pr.html_url
+
+    def notify(item):
+        found, link = item
+        alert_match(conf, found, link)
+
+    handlers = [
+        ('list', list_repo),
+        ('fetch', fetch),
+        ('parse', parse),
+        ('match', match),
+        ('notify', notify),
+    ]
+    stages = [pipeline.Stage(name, handler, workers=settings.PIPELINE_WORKERS.get(name, 1),
+                             queue_size=settings.PIPELINE_QUEUE_SIZE)
+              for name, handler in handlers]
+    pipeline.Pipeline(stages, report_interval=settings.DEPTH_LOG_INTERVAL).run(targets)
+
+
+def find_changes_graphql(conf, targets, activity):
+    """
+    Like :py:func:`find_changes` in `serial` mode, but the repos sharing a base url and token are listed together with
+    :py:func:`git.open_pull_requests_graphql`, which also returns the files each pull request changes. Pull requests
+    that the paths alone decide (see :py:func:`evaluate_paths`) are never diffed; the rest are diffed over REST.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check.
+    :param targets: A list of `(user, repo)` configurations to check.
+    :param :py:class:`Activity` activity: Counts the new and changed pull requests.
+    """
+    groups = collections.OrderedDict()
+    for user, repo in targets:
+        groups.setdefault((user.base_url, user.token), []).append((user, repo))
+    for (base_url, token), group in groups.items():
+        logging.info("Searching for pull requests in %s repos on %s...", len(group), base_url)
+        repos = {(user.name, repo.name): (user, repo) for user, repo in group}
+        cursors = [(user.name, repo.name, store.get_store().get_cursor(cursor_key(user, repo), repo.fingerprint))
+                   for user, repo in group]
+        for owner, name, open_pr, files in git.open_pull_requests_graphql(base_url, token, cursors):
+            user, repo = repos[(owner, name)]
+            activity.seen(user, repo, open_pr)
+            state = pull_request_state(repo, open_pr)
+            if state is None:
+                continue
+            activity.add(user, repo)
+            if files == []:
+                store.get_store().record_pull_request(*state, result='noop')
+                continue
+            match = True if files is None else evaluate_paths(repo, files, open_pr.user.login)
+            if match is True:
+                check_diff(conf, user, repo, open_pr, state)
+            else:
+                record_match(conf, open_pr, state, match)
 
 
 def main(parser):
     conf = config.Configuration.from_file()
     conf.add_cli_options(parser.parse_args())
+    targets = {(user.name, repo.name): (user, repo) for user in conf.users for repo in user.repos}
+    schedule = scheduler.Scheduler(targets.keys())
     while True:
-        logging.info("Finding changes...")
-        find_changes(conf)
+        due = schedule.due()
+        if due:
+            logging.info("Finding changes in %s...", ', '.join('/'.join(key) for key in due))
+            activity = find_changes(conf, [targets[key] for key in due])
+            for key in due:
+                schedule.record(key, activity[key])
         logging.info("Sleeping...")
-        time.sleep(60 * 10) # 10 minutes
+        schedule.wait()
@@ -0,0 +1,189 @@
+"""
+The Serve Command Module
+------------------------
+
+This module implements `github-watcher serve`, which has GitHub push pull requests to the watcher instead of waiting
+for the next poll. It listens for `pull_request` webhook deliveries and checks the pull requests that were `opened`,
+`reopened` or pushed to (`synchronize`) against the configuration, just like `run` does for the pull requests it lists.
+
+Deliveries are only accepted with a valid `X-Hub-Signature-256`, computed with the `webhook_secret` the webhook was
+configured with. Every repo is still polled every `catchup_interval` seconds (and once on startup), so pull requests
+opened while the watcher was down, or whose deliveries were lost, are caught up on.
+
+Use `github-watcher post-event` (:py:mod:`github_watcher.commands.post_event`) to post a signed payload to a running
+`serve` while trying it out.
+
+"""
+import hmac
+import http.server
+import json
+import logging
+import queue
+import threading
+import time
+
+import github_watcher.settings as settings
+import github_watcher.notifier as notifier
+import github_watcher.commands.config as config
+import github_watcher.commands.post_event as post_event
+import github_watcher.commands.run as run
+import github_watcher.services.git as git
+import github_watcher.services.store as store
+
+
+EVENT_ACTIONS = ('opened', 'synchronize', 'reopened')
+
+_STOP = object()  # Tells the worker to exit.
+
+
+def verify_signature(secret: str, body: bytes, signature: str or None) -> bool:
+    """
+    :return: Whether `signature` is the signature of `body` under `secret`, compared in constant time.
+    """
+    if not signature:
+        return False
+    return hmac.compare_digest(post_event.sign(secret, body), signature)
+
+
+class Receiver:
+    """
+    Accepts webhook deliveries and checks the pull requests they carry on a single worker thread, which also runs the
+    catch-up polls. Checking everything on one thread means a delivery and a catch-up poll never check the same pull
+    request at the same time.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check pull requests against.
+    :param str secret: The secret the webhook is configured with.
+    :param float catchup_interval: Seconds between catch-up polls. Defaults to `settings.CATCHUP_INTERVAL`.
+    """
+
+    def __init__(self, conf: config.Configuration, secret: str, catchup_interval: float=None):
+        self.conf = conf
+        self.secret = secret
+        self.catchup_interval = settings.CATCHUP_INTERVAL if catchup_interval is None else catchup_interval
+        self.targets = {(user.name.lower(), repo.name.lower()): (user, repo)
+                        for user in conf.users for repo in user.repos}
+        self.events = queue.Queue()
+        self.thread = None
+
+    def deliver(self, event: str, body: bytes, signature: str) -> int:
+        """
+        Queues the pull request in a delivery if it belongs to a watched repo.
+
+        :param str event: The `X-GitHub-Event` header.
+        :param bytes body: The payload.
+        :param str signature: The `X-Hub-Signature-256` header.
+        :return: The HTTP status to respond with.
+        """
+        if not verify_signature(self.secret, body, signature):
+            logging.warning("Rejecting a %s delivery with an invalid signature", event)
+            return 401
+        if event == 'ping':
+            return 200
+        if event != 'pull_request':
+            return 204
+        try:
+            payload = json.loads(body.decode('utf-8'))
+            action = payload['action']
+            repository = payload['repository']
+            key = (repository['owner']['login'].lower(), repository['name'].lower())
+            pull_request = payload['pull_request']
+        except (ValueError, KeyError, TypeError):
+            logging.warning("Rejecting a malformed pull_request delivery")
+            return 400
+        if action not in EVENT_ACTIONS or key not in self.targets:
+            return 204
+        logging.info("Received %s %s", action, pull_request.get('html_url'))
+        self.events.put((key, pull_request))
+        return 202
+
+    def check(self, key: tuple, raw: dict):
+        user, repo = self.targets[key]
+        open_pr = git.pull_request_from_json(user.base_url, user.token, raw)
+        try:
+            run.check_pull_request(self.conf, user, repo, open_pr)
+        finally:
+            store.flush()
+
+    def catch_up(self):
+        logging.info("Catching up on every repo...")
+        run.find_changes(self.conf)
+
+    def work(self):
+        next_catchup = time.time()
+        while True:
+            timeout = next_catchup - time.time()
+            if timeout <= 0:
+                try:
+                    self.catch_up()
+                except Exception:
+                    logging.exception("Catch-up poll failed")
+                next_catchup = time.time() + self.catchup_interval
+                continue
+            try:
+                item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return
+            try:
+                self.check(*item)
+            except Exception:
+                logging.exception("Checking %s failed", item[1].get('html_url'))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.work, name='webhook-receiver', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Checks the pull requests already received, then stops the worker.
+        """
+        if self.thread is not None:
+            self.events.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        status = self.server.receiver.deliver(self.headers.get('X-GitHub-Event'), body,
+                                              self.headers.get('X-Hub-Signature-256'))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.address_string(), format % args)
+
+
+def make_server(receiver: Receiver, host: str=None, port: int=None) -> http.server.HTTPServer:
+    """
+    :param :py:class:`Receiver` receiver: Handles the deliveries.
+    :param str host: Defaults to `settings.WEBHOOK_HOST`.
+    :param int port: Defaults to `settings.WEBHOOK_PORT`. Pass 0 to listen on any free port.
+    :return: A server listening for deliveries; call `serve_forever` on it.
+    """
+    host = settings.WEBHOOK_HOST if host is None else host
+    port = settings.WEBHOOK_PORT if port is None else port
+    server = http.server.HTTPServer((host, int(port)), WebhookHandler)
+    server.receiver = receiver
+    return server
+
+
+def main(parser):
+    conf = config.Configuration.from_file()
+    conf.add_cli_options(parser.parse_args())
+    receiver = Receiver(conf, post_event.get_secret())
+    server = make_server(receiver)
+    receiver.start()
+    logging.info("Listening for webhooks on %s:%s...", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        receiver.stop()
+        notifier.shutdown()
+
@@ -0,0 +1,131 @@
+"""
+The Fetcher Module
+------------------
+
+This module implements the `async` fetch mode. Every repo is listed and every pull request diffed concurrently from an
+asyncio event loop, while the blocking API calls of :py:mod:`github_watcher.services.git` run on a bounded pool of
+worker threads per base url.
+
+It's only imported when `settings.FETCH_MODE` is `async`, so the other modes still run on Pythons without `async def`
+(before 3.5).
+
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+
+import github_watcher.settings as settings
+import github_watcher.commands.run as run
+import github_watcher.services.git as git
+import github_watcher.services.store as store
+
+
+class AsyncFetcher:
+    """
+    Makes the blocking API calls in :py:mod:`github_watcher.services.git` from an asyncio event loop. Each base url gets
+    its own pool of `concurrency` worker threads, so no more than that many requests are ever in flight against one host
+    while the calls for every repo and pull request overlap.
+
+    :param int concurrency: The most requests in flight per base url. Defaults to `settings.FETCH_CONCURRENCY`.
+    """
+
+    def __init__(self, concurrency: int=None):
+        self.concurrency = concurrency or settings.FETCH_CONCURRENCY
+        self.executors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def executor(self, base_url) -> concurrent.futures.ThreadPoolExecutor:
+        if base_url not in self.executors:
+            self.executors[base_url] = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        return self.executors[base_url]
+
+    async def call(self, base_url, fn, *args):
+        """
+        Runs `fn(*args)` on the worker threads for `base_url` and waits for the result.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor(base_url), functools.partial(fn, *args))
+
+    async def open_pull_requests(self, base_url, access_token, user, repo, since: str=None) -> list:
+        return await self.call(base_url, lambda: list(git.open_pull_requests(base_url, access_token, user, repo,
+                                                                             since=since)))
+
+    async def diff_files(self, base_url, access_token, pull_request) -> list:
+        return await self.call(base_url, lambda: list(git.diff_files(base_url, access_token, pull_request)))
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        self.executors = {}
+
+
+async def gather(coroutines) -> list:
+    """
+    Like `asyncio.gather`, but when one of `coroutines` fails the others are cancelled, and waited on, before the error
+    is raised. None of them is left pending for the event loop to destroy when it's closed.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def find_changes_async(conf, fetcher, targets, activity):
+    """
+    Like :py:func:`run.find_changes` in `serial` mode, but every repo is listed and every pull request diffed
+    concurrently, bounded only by the concurrency of `fetcher`. Diffs are evaluated on the event loop as they arrive.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check.
+    :param :py:class:`AsyncFetcher` fetcher: Makes the API calls.
+    :param targets: A list of `(user, repo)` configurations to check.
+    :param :py:class:`run.Activity` activity: Counts the new and changed pull requests.
+    """
+    async def check_pull_request(user, repo, open_pr):
+        state = run.pull_request_state(repo, open_pr)
+        if state is None:
+            return
+        activity.add(user, repo)
+        try:
+            files = await fetcher.diff_files(user.base_url, user.token, open_pr)
+        except git.Noop:
+            store.get_store().record_pull_request(*state, result='noop')
+            return
+        patched_files = git.patched_files(run.watched_files(repo, files))
+        run.record_match(conf, open_pr, state, run.evaluate_files(repo, patched_files, open_pr.user.login))
+
+    async def check_repo(user, repo):
+        logging.info("Searching for pull requests in repo %s...", repo.name)
+        since = store.get_store().get_cursor(run.cursor_key(user, repo), repo.fingerprint)
+        open_prs = await fetcher.open_pull_requests(user.base_url, user.token, user.name, repo.name, since=since)
+        for open_pr in open_prs:
+            activity.seen(user, repo, open_pr)
+        logging.info("Found %s pull requests in %s", len(open_prs), repo.name)
+        await gather(check_pull_request(user, repo, open_pr) for open_pr in open_prs)
+
+    await gather(check_repo(user, repo) for user, repo in targets)
+
+
+def find_changes(conf, targets, activity):
+    """
+    Runs :py:func:`find_changes_async` to completion on an event loop of its own.
+
+    :param :py:class:`config.Configuration` conf: The configuration to check.
+    :param targets: A list of `(user, repo)` configurations to check.
+    :param :py:class:`run.Activity` activity: Counts the new and changed pull requests.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        with AsyncFetcher() as fetcher:
+            loop.run_until_complete(find_changes_async(conf, fetcher, targets, activity))
+    finally:
+        loop.close()
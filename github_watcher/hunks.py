@@ -0,0 +1,82 @@
+"""
+The Hunks Module
+----------------
+
+This module is a lightweight alternative to `unidiff` for reading patches. Matching changed lines against watched
+ranges only needs the `@@ -start,length +start,length @@` header of each hunk, so :py:func:`parse_hunks` finds the
+headers with one regex scan of the patch instead of building an object for every line. :py:func:`changed_lines` reads
+just the added and/or removed lines, for the regexes.
+
+:py:class:`PatchedFile` and :py:class:`Hunk` have the attributes of their `unidiff` counterparts that the watcher reads,
+so either can be evaluated by :py:func:`github_watcher.commands.run.evaluate_file`.
+
+"""
+import re
+
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', re.MULTILINE)
+
+
+class Hunk:
+    """
+    The line ranges of one hunk. As in `unidiff`, a length left out of the header is 1.
+    """
+
+    __slots__ = ('source_start', 'source_length', 'target_start', 'target_length')
+
+    def __init__(self, source_start: int, source_length: int, target_start: int, target_length: int):
+        self.source_start = source_start
+        self.source_length = source_length
+        self.target_start = target_start
+        self.target_length = target_length
+
+    def __eq__(self, other):
+        return isinstance(other, Hunk) and self.ranges() == other.ranges()
+
+    def __repr__(self):
+        return 'Hunk(-{},{} +{},{})'.format(*self.ranges())
+
+    def ranges(self) -> tuple:
+        return self.source_start, self.source_length, self.target_start, self.target_length
+
+
+class PatchedFile(list):
+    """
+    The hunks of one changed file.
+
+    :param str source_file: The path before the change, prefixed with `a/` like in a git diff.
+    :param str target_file: The path after the change, prefixed with `b/`.
+    :param hunks: The file's :py:class:`Hunk` objects.
+    """
+
+    def __init__(self, source_file: str, target_file: str, hunks=()):
+        super().__init__(hunks)
+        self.source_file = source_file
+        self.target_file = target_file
+
+
+def parse_hunks(patch: str) -> list:
+    """
+    :param str patch: The hunks of one file, like the `patch` the API returns for a changed file.
+    :return: A :py:class:`Hunk` for every hunk header in `patch`.
+    """
+    return [Hunk(int(source_start), int(source_length or 1), int(target_start), int(target_length or 1))
+            for source_start, source_length, target_start, target_length in HUNK_HEADER.findall(patch)]
+
+
+def changed_lines(blob: str, markers: str='+-'):
+    """
+    Yields the lines in the hunks of a diff that start with one of `markers`, without the marker. Lines outside of hunks,
+    like file headers, are skipped.
+
+    :param str blob: A patch, or a whole unified diff.
+    :param str markers: `+` for added lines, `-` for removed lines, or both.
+    """
+    in_hunk = False
+    for line in blob.splitlines():
+        if line.startswith('@@'):
+            in_hunk = True
+        elif line.startswith('diff --git'):
+            in_hunk = False
+        elif in_hunk and line and line[0] in markers:
+            yield line[1:]
@@ -0,0 +1,179 @@
+"""
+The Notifier Module
+-------------------
+
+This module delivers alerts off the scanning thread. :py:func:`github_watcher.commands.run.alert` only puts an alert on
+the :py:class:`NotificationWorker` queue; the worker's thread hands alerts to the sinks configured in
+`settings.ALERT_SINKS` (see :py:mod:`github_watcher.sinks`), by default a single desktop sink whose `notify2`
+connection is set up once and reused.
+
+A large refactor or a wave of release pull requests can match dozens of times in one cycle. Rather than a notification
+per match, the worker coalesces the alerts raised within `settings.DIGEST_WINDOW` seconds of the first one and emits
+them to every sink together; the desktop sink shows them as one digest (see :py:func:`github_watcher.sinks.digest`),
+which counts them per repo and per rule. The worker also keeps running per repo and per rule totals in `repo_counts`
+and `rule_counts`, and flushes each sink's buffer when it's due.
+
+Alerts still waiting when the process exits are delivered first, and every sink is flushed; see :py:func:`shutdown`.
+
+"""
+import atexit
+import collections
+import queue
+import logging
+import threading
+import time
+
+import github_watcher.settings as settings
+from github_watcher.sinks import Alert, digest, make_sinks, repo_of
+
+
+_STOP = object()  # Tells the worker to exit.
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class NotificationWorker:
+    """
+    Emits queued alerts to `sinks` on a background thread, coalescing those raised close together.
+
+    :param list sinks: The :py:class:`sinks.Sink` objects to deliver alerts to. Defaults to those configured in
+        `settings.ALERT_SINKS`.
+    :param int queue_size: The most alerts that can wait for delivery. Defaults to `settings.NOTIFY_QUEUE_SIZE`.
+    :param float window: Seconds after an alert during which further alerts are coalesced with it into a digest.
+        Defaults to `settings.DIGEST_WINDOW`; 0 delivers every alert on its own.
+    """
+
+    def __init__(self, sinks: list=None, queue_size: int=None, window: float=None):
+        self.sinks = make_sinks() if sinks is None else sinks
+        self.queue = queue.Queue(maxsize=settings.NOTIFY_QUEUE_SIZE if queue_size is None else queue_size)
+        self.window = settings.DIGEST_WINDOW if window is None else window
+        self.repo_counts = collections.Counter()
+        self.rule_counts = collections.Counter()
+        self.thread = None
+
+    def put(self, msg: str, pr_link: str, silent: bool=False, rule: str=None):
+        """
+        Queues an alert without waiting. If the queue is full the alert is dropped; it's been logged already.
+
+        :param str rule: The kind of rule that matched, counted in digests.
+        """
+        try:
+            self.queue.put_nowait(Alert(msg, pr_link, silent, rule, time.time()))
+        except queue.Full:
+            logging.warning("Dropping an alert for %s, %s alerts are already waiting", pr_link, self.queue.qsize())
+
+    def flush_timeout(self) -> float or None:
+        """
+        :return: Seconds until the next sink is due to be flushed, or None if no sink has alerts buffered.
+        """
+        due = [when for when in (sink.next_flush() for sink in self.sinks) if when is not None]
+        if not due:
+            return None
+        return max(0, min(due) - time.monotonic())
+
+    def flush_sinks(self, due_only: bool=True):
+        now = time.monotonic()
+        for sink in self.sinks:
+            when = sink.next_flush()
+            if when is not None and (not due_only or when <= now):
+                sink.flush()
+
+    def collect(self, first) -> tuple:
+        """
+        :return: `first` and every alert queued within `window` seconds of it, and whether the worker was stopped
+            meanwhile.
+        """
+        if first is _STOP:
+            return [], True
+        alerts = [first]
+        deadline = time.monotonic() + self.window
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return alerts, False
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return alerts, False
+            if item is _STOP:
+                return alerts, True
+            alerts.append(item)
+
+    def deliver(self, alerts: list):
+        for alert in alerts:
+            self.repo_counts[repo_of(alert.pr_link)] += 1
+            self.rule_counts[alert.rule or 'match'] += 1
+        if len(alerts) > 1:
+            logging.info(digest(alerts).msg)
+        for sink in self.sinks:
+            try:
+                sink.emit(alerts)
+            except Exception:
+                logging.exception("Emitting %s alerts to %s failed", len(alerts), type(sink).__name__)
+
+    def work(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_timeout())
+            except queue.Empty:
+                self.flush_sinks()
+                continue
+            alerts, stopped = self.collect(first)
+            try:
+                if alerts:
+                    self.deliver(alerts)
+                self.flush_sinks(due_only=not stopped)
+            finally:
+                for _ in range(len(alerts) + stopped):
+                    self.queue.task_done()
+            if stopped:
+                return
+
+    def start(self):
+        self.thread = threading.Thread(target=self.work, name='notifier', daemon=True)
+        self.thread.start()
+
+    def flush(self):
+        """
+        Waits for every alert queued so far to be emitted, then flushes every sink.
+        """
+        if self.thread is not None:
+            self.queue.join()
+        self.flush_sinks(due_only=False)
+
+    def stop(self):
+        """
+        Delivers the alerts already queued, without waiting out the coalescing window, flushes every sink, then stops
+        the worker.
+        """
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+
+def get_worker() -> NotificationWorker:
+    """
+    :return: The process's :py:class:`NotificationWorker`, started on first use. It's stopped when the process exits.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = NotificationWorker()
+            _worker.start()
+        return _worker
+
+
+def shutdown():
+    """
+    Delivers the alerts still queued and stops the worker. The next :py:func:`get_worker` starts a new one.
+    """
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop()
+
+
+atexit.register(shutdown)
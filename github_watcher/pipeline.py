@@ -0,0 +1,141 @@
+"""
+The Pipeline Module
+-------------------
+
+This module implements a small staged producer/consumer pipeline. Each :py:class:`Stage` has its own bounded queue and
+its own worker threads; the items a stage's handler yields are put on the next stage's queue. Because the queues are
+bounded, a slow stage makes the stages before it wait rather than letting work pile up in memory. While a pipeline
+runs, the depth of every queue can be logged periodically, which shows where work backs up and which stage needs more
+workers.
+
+"""
+import queue
+import logging
+import threading
+from typing import Callable, List
+
+
+_STOP = object()  # Tells a worker to exit.
+
+
+class Stage:
+    """
+    :param str name: The name of the stage, used in logs and :py:meth:`Pipeline.depths`.
+    :param Callable handler: Called with each item taken off the stage's queue. It returns an iterable (usually it's a
+        generator) of items for the next stage, or None.
+    :param int workers: How many threads take items off the queue.
+    :param int queue_size: The most items that can wait on the queue before producers block.
+    """
+
+    def __init__(self, name: str, handler: Callable, workers: int=1, queue_size: int=100):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_depth = 0
+        self.processed = 0
+        self.errors = 0
+
+    def put(self, item):
+        self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+
+class Pipeline:
+    """
+    :param List[Stage] stages: The stages, in the order items flow through them.
+    :param float report_interval: Seconds between logs of :py:meth:`depths` while the pipeline runs. 0 only logs
+        :py:meth:`stats` once it has drained.
+    """
+
+    def __init__(self, stages: List[Stage], report_interval: float=0):
+        self.stages = stages
+        self.report_interval = report_interval
+        self.threads = []
+        self.lock = threading.Lock()
+        self.exception = None
+
+    def work(self, index: int):
+        stage = self.stages[index]
+        downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                for output in stage.handler(item) or ():
+                    if downstream is not None:
+                        downstream.put(output)
+                with self.lock:
+                    stage.processed += 1
+            except Exception as e:
+                logging.exception("Stage %s failed on %s", stage.name, item)
+                with self.lock:
+                    stage.errors += 1
+                    if self.exception is None:
+                        self.exception = e
+            finally:
+                stage.queue.task_done()
+
+    def report(self, stopped: threading.Event):
+        while not stopped.wait(self.report_interval):
+            logging.info("Pipeline queue depths: %s", self.depths())
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self.work, args=(index,),
+                                          name='pipeline-{}-{}'.format(stage.name, n), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def run(self, items):
+        """
+        Feeds `items` to the first stage and waits until every stage has drained. The first exception raised by any
+        handler is re-raised once the pipeline has drained; the other items are still processed.
+
+        :param items: An iterable of items for the first stage.
+        """
+        self.start()
+        stopped = threading.Event()
+        if self.report_interval > 0:
+            threading.Thread(target=self.report, args=(stopped,), name='pipeline-report', daemon=True).start()
+        try:
+            for item in items:
+                self.stages[0].put(item)
+            for stage in self.stages:
+                stage.queue.join()
+        finally:
+            stopped.set()
+            self.stop()
+        logging.info("Pipeline stats: %s", self.stats())
+        if self.exception is not None:
+            raise self.exception
+
+    def depths(self) -> dict:
+        """
+        :return: The number of items currently waiting on each stage's queue, by stage name.
+        """
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def stats(self) -> dict:
+        """
+        :return: The items processed, errors raised and deepest queue seen for each stage, by stage name. A stage
+            whose queue keeps filling up is a bottleneck; give it more workers.
+        """
+        return {
+            stage.name: {
+                'workers': stage.workers,
+                'processed': stage.processed,
+                'errors': stage.errors,
+                'max_depth': stage.max_depth,
+            } for stage in self.stages
+        }
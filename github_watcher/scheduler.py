@@ -0,0 +1,103 @@
+"""
+The Scheduler Module
+--------------------
+
+This module decides when each watched repo is polled next. Every repo keeps an exponentially weighted moving average of
+how many pull requests were opened or pushed to per second when it was last polled, and is polled about as often as it
+expects one such change, bounded by `settings.POLL_MIN_INTERVAL` and `settings.POLL_MAX_INTERVAL`. Busy repos are
+checked within a minute or so of a change, while quiet ones drift towards the maximum and stop using up the rate limit.
+
+"""
+import time
+import logging
+
+import github_watcher.settings as settings
+
+
+class Schedule:
+    """
+    The polling schedule of one repo.
+
+    :param float interval: The interval to poll at until activity has been observed.
+    :param float min_interval: The shortest interval the repo can be polled at.
+    :param float max_interval: The longest interval the repo can be polled at.
+    :param float now: The current time. The first poll is due immediately.
+    :param float smoothing: How much weight the latest observation gets in the moving average, from 0 to 1.
+    """
+
+    def __init__(self, interval: float, min_interval: float, max_interval: float, now: float, smoothing: float=0.5):
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.rate = None
+        self.last_run = None
+        self.next_run = now
+
+    def record(self, changes: int, now: float):
+        """
+        Updates the schedule after a poll.
+
+        :param int changes: How many pull requests were new or changed since the previous poll.
+        :param float now: The time the poll finished.
+        """
+        if self.last_run is not None and now > self.last_run:
+            rate = changes / (now - self.last_run)
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+            interval = 1 / self.rate if self.rate > 0 else self.max_interval
+            self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.last_run = now
+        self.next_run = now + self.interval
+
+
+class Scheduler:
+    """
+    :param keys: The keys of the repos to schedule.
+    :param float min_interval: Defaults to `settings.POLL_MIN_INTERVAL`.
+    :param float max_interval: Defaults to `settings.POLL_MAX_INTERVAL`.
+    :param float interval: The interval repos are polled at until activity has been observed. Defaults to
+        `settings.POLL_INTERVAL`.
+    :param clock: Returns the current time in seconds. Defaults to `time.time`.
+    :param sleep: Sleeps for a number of seconds. Defaults to `time.sleep`.
+    """
+
+    def __init__(self, keys, min_interval: float=None, max_interval: float=None, interval: float=None,
+                 clock=None, sleep=None):
+        self.min_interval = settings.POLL_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_interval = settings.POLL_MAX_INTERVAL if max_interval is None else max_interval
+        interval = settings.POLL_INTERVAL if interval is None else interval
+        self.clock = clock or time.time
+        self.sleep = sleep or time.sleep
+        now = self.clock()
+        self.schedules = {key: Schedule(interval, self.min_interval, self.max_interval, now) for key in keys}
+
+    def due(self) -> list:
+        """
+        :return: The keys of the repos due to be polled, most overdue first.
+        """
+        now = self.clock()
+        due = [key for key, schedule in self.schedules.items() if schedule.next_run <= now]
+        return sorted(due, key=lambda key: self.schedules[key].next_run)
+
+    def record(self, key, changes: int):
+        """
+        :param key: The key of a repo that was just polled.
+        :param int changes: How many pull requests were new or changed since it was last polled.
+        """
+        schedule = self.schedules[key]
+        schedule.record(changes, self.clock())
+        logging.info("Polling %s every %.0f seconds", key, schedule.interval)
+
+    def wait(self):
+        """
+        Sleeps until the next repo is due.
+        """
+        if not self.schedules:
+            self.sleep(self.max_interval)
+            return
+        delay = min(schedule.next_run for schedule in self.schedules.values()) - self.clock()
+        if delay > 0:
+            self.sleep(delay)
@@ -0,0 +1,243 @@
+"""
+The Cache Module
+----------------
+
+This module implements the on-disk caches the watcher keeps between cycles and restarts.
+
+:py:class:`HTTPCache` keeps the last response body seen for each API resource along with its `ETag` and `Last-Modified`
+headers, so the next request for that resource can be made conditional. GitHub answers a conditional request for an
+unchanged resource with 304 Not Modified, which doesn't count against the rate limit, and the cached body is replayed.
+
+:py:class:`DiffCache` keeps the files changed between two commits, as the compare endpoint lists them. A compare url
+names both shas, so its result never changes and is never revalidated; it's read straight from disk. Entries are
+gzipped.
+
+Both are capped (`settings.HTTP_CACHE_SIZE` and `settings.DIFF_CACHE_SIZE` bytes); once a cache outgrows its cap, the
+least recently used entries are evicted, so listings of closed pull requests and stale cursors don't pile up.
+
+"""
+import os
+import gzip
+import json
+import hashlib
+import collections
+import logging
+import tempfile
+import threading
+
+import github_watcher.settings as settings
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def make_key(*parts) -> str:
+    """
+    :return: A digest of `parts` safe to use as a file name. Secrets passed as parts never reach the disk.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def write_atomically(filepath: str, data: bytes):
+    directory = os.path.dirname(filepath)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, filepath)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class LRUCache:
+    """
+    Keeps entries as files under `directory`, and evicts the least recently used once they outgrow `max_bytes`.
+    Subclasses encode and decode the entries.
+
+    :param str directory: The directory entries are kept in. It's created on the first write.
+    :param int max_bytes: The most bytes of entries to keep. 0 disables the cache.
+    """
+
+    SUFFIX = ''
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = None  # The size of each entry by key, least recently used first.
+        self.size = 0
+
+    def filepath(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.SUFFIX)
+
+    def index(self) -> collections.OrderedDict:
+        """
+        :return: The size of each entry on disk by key, least recently used first. The directory is only scanned once;
+            entries are ordered by modification time, which :py:meth:`read` bumps.
+        """
+        if self.entries is None:
+            found = []
+            for root, _, filenames in os.walk(self.directory):
+                for filename in filenames:
+                    if filename.endswith(self.SUFFIX) and not filename.startswith('.tmp-'):
+                        try:
+                            stat = os.stat(os.path.join(root, filename))
+                        except OSError:
+                            continue
+                        found.append((stat.st_mtime, filename[:len(filename) - len(self.SUFFIX)], stat.st_size))
+            self.entries = collections.OrderedDict((key, size) for _, key, size in sorted(found))
+            self.size = sum(self.entries.values())
+        return self.entries
+
+    def read(self, key: str) -> bytes or None:
+        """
+        :return: The bytes cached under `key`, or None. The entry becomes the most recently used.
+        """
+        filepath = self.filepath(key)
+        try:
+            with open(filepath, 'rb') as fp:
+                data = fp.read()
+        except IOError:
+            return None
+        with self.lock:
+            entries = self.index()
+            if key in entries:
+                entries.move_to_end(key)
+            try:
+                os.utime(filepath)
+            except OSError:
+                pass
+        return data
+
+    def write(self, key: str, data: bytes):
+        """
+        Caches `data` under `key`, then evicts the least recently used entries until the cache fits in `max_bytes`.
+        """
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        try:
+            write_atomically(self.filepath(key), data)
+        except OSError as e:
+            logging.warning("Couldn't cache %s in %s: %s", key, self.directory, e)
+            return
+        with self.lock:
+            entries = self.index()
+            self.size += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            while self.size > self.max_bytes and entries:
+                evicted, size = entries.popitem(last=False)
+                self.size -= size
+                try:
+                    os.remove(self.filepath(evicted))
+                except OSError:
+                    pass
+
+
+class HTTPCache(LRUCache):
+    """
+    :param str directory: The directory cached responses are kept in. It's created on the first write.
+    :param int max_bytes: The most bytes of responses to keep. 0 disables the cache.
+    """
+
+    SUFFIX = '.json'
+
+    def get(self, key: str) -> dict or None:
+        """
+        :param str key: The key the response was cached under. See :py:func:`make_key`.
+        :return: A dict with the `etag`, `last_modified`, `headers` and `body` of the cached response, or None.
+        """
+        data = self.read(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+
+    def put(self, key: str, etag: str=None, last_modified: str=None, headers: dict=None, body: str=''):
+        """
+        Caches a response. Responses without an `etag` or `last_modified` can't be revalidated, so they're not kept.
+
+        :param str key: The key to cache the response under. See :py:func:`make_key`.
+        :param str etag: The `ETag` header of the response.
+        :param str last_modified: The `Last-Modified` header of the response.
+        :param dict headers: Other response headers to replay along with the body, e.g. `Link`.
+        :param str body: The response body.
+        """
+        if not etag and not last_modified:
+            return
+        entry = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': headers or {},
+            'body': body,
+        }
+        self.write(key, json.dumps(entry).encode('utf-8'))
+
+
+class DiffCache(LRUCache):
+    """
+    :param str directory: The directory cached diffs are kept in. It's created on the first write.
+    :param int max_bytes: The most bytes of compressed diffs to keep. 0 disables the cache.
+    """
+
+    SUFFIX = '.json.gz'
+
+    def get(self, key: str) -> list or None:
+        """
+        :param str key: The key the diff was cached under. See :py:func:`make_key`.
+        :return: The changed files cached under `key`, or None.
+        """
+        data = self.read(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(gzip.decompress(data).decode('utf-8'))
+        except (IOError, ValueError, EOFError):
+            return None
+
+    def put(self, key: str, files: list):
+        """
+        Caches the changed files of a diff, gzipped.
+
+        :param str key: The key to cache the diff under. See :py:func:`make_key`.
+        :param list files: The changed files, as the compare endpoint lists them.
+        """
+        if self.max_bytes <= 0:
+            return
+        self.write(key, gzip.compress(json.dumps(files).encode('utf-8')))
+
+
+def get_http_cache(directory: str=None) -> HTTPCache:
+    """
+    :param str directory: Defaults to `settings.WATCHER_HTTP_CACHE`.
+    :return: The :py:class:`HTTPCache` kept in `directory`, capped at `settings.HTTP_CACHE_SIZE` bytes and shared by
+        every caller in the process.
+    """
+    if directory is None:
+        directory = settings.WATCHER_HTTP_CACHE
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = HTTPCache(directory, settings.HTTP_CACHE_SIZE)
+        return _caches[directory]
+
+
+def get_diff_cache(directory: str=None) -> DiffCache:
+    """
+    :param str directory: Defaults to `settings.WATCHER_DIFF_CACHE`.
+    :return: The :py:class:`DiffCache` kept in `directory`, capped at `settings.DIFF_CACHE_SIZE` bytes and shared by
+        every caller in the process.
+    """
+    if directory is None:
+        directory = settings.WATCHER_DIFF_CACHE
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = DiffCache(directory, settings.DIFF_CACHE_SIZE)
+        return _caches[directory]
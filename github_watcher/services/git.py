@@ -1,14 +1,109 @@
+import json
+import atexit
 import logging
-import datetime
+import threading
+import urllib.parse
 
 import github
 from github import Github
 import requests
+import requests.adapters
+import requests.utils
+
+import github_watcher.hunks as hunks
+import github_watcher.settings as settings
+import github_watcher.services.cache as cache
+import github_watcher.services.ratelimit as ratelimit
+
+
+# Response headers replayed along with a cached body when GitHub answers 304 Not Modified.
+REPLAYED_HEADERS = ('Link',)
+
+# The open pull requests of one repo, most recently updated first, along with the paths of the files they change and
+# how. Each repo in a batched query gets its own alias and variables.
+GRAPHQL_REPOSITORY = """
+  r{n}: repository(owner: $owner{n}, name: $name{n}) {{
+    pullRequests(states: OPEN, first: {page_size}, after: $after{n}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{
+        number
+        url
+        updatedAt
+        author {{ login }}
+        baseRefOid
+        headRefOid
+        baseRepository {{ name owner {{ login }} }}
+        headRepositoryOwner {{ login }}
+        files(first: {files}) {{ pageInfo {{ hasNextPage }} nodes {{ path changeType }} }}
+      }}
+    }}
+  }}"""
+
+
+_clients = {}
+_sessions = {}
+_registry_lock = threading.Lock()
 
 
 class Noop(Exception): pass
 
 
+class GraphQLError(Exception): pass
+
+
+def get_client(base_url, access_token) -> Github:
+    """
+    :param str base_url: The API base url.
+    :param str access_token: The token to authenticate with.
+    :return: The PyGithub client for `base_url` and `access_token`, shared by every caller in the process.
+    """
+    key = (base_url, access_token)
+    with _registry_lock:
+        if key not in _clients:
+            _clients[key] = Github(access_token, base_url=base_url, timeout=settings.HTTP_TIMEOUT)
+        return _clients[key]
+
+
+def pool_size() -> int:
+    """
+    :return: `settings.HTTP_POOL_SIZE`, or more if the fetch mode can have more requests in flight against one host:
+        `settings.FETCH_CONCURRENCY` in `async` mode, or the `list` and `fetch` workers in `pipeline` mode. Otherwise
+        connections would be dropped as soon as they're released.
+    """
+    workers = settings.PIPELINE_WORKERS
+    return max(settings.HTTP_POOL_SIZE, settings.FETCH_CONCURRENCY, workers.get('list', 1) + workers.get('fetch', 1))
+
+
+def get_session(url, access_token) -> requests.Session:
+    """
+    :param str url: Any url on the API host.
+    :param str access_token: The token to authenticate with.
+    :return: A keep-alive session authenticated with `access_token`, pooling up to :py:func:`pool_size` connections
+        to the host of `url`. Sessions are shared by every caller in the process, and closed when it exits.
+    """
+    key = (urllib.parse.urlsplit(url).netloc, access_token)
+    with _registry_lock:
+        if key not in _sessions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size())
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Authorization'] = 'token {}'.format(access_token)
+            _sessions[key] = session
+        return _sessions[key]
+
+
+def close_sessions():
+    with _registry_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _clients.clear()
+
+
+atexit.register(close_sessions)
+
+
 def close(entity, dry_run=True):
     print('would close', type(entity), get_last_updated(entity))
 
@@ -27,29 +122,124 @@ def delete(entity, dry_run=True):
     print('would delete', type(entity), get_last_updated(entity))
 
 
+def get(url, access_token, params=None, cache_response=True):
+    """
+    GETs `url` from the API. Responses carrying an `ETag` or `Last-Modified` header are cached on disk, and the next
+    request for the same resource is made conditional. When GitHub answers 304 Not Modified, which doesn't count against
+    the rate limit, the cached body is replayed.
+
+    Requests are paced per token by :py:mod:`github_watcher.services.ratelimit`. A request rejected by the rate limit
+    is retried, up to `settings.RATE_LIMIT_RETRIES` times, once the limit allows it.
+
+    :param str url: The API url to GET.
+    :param str access_token: The token to authenticate with.
+    :param dict params: Query string parameters.
+    :param bool cache_response: Whether to cache the response and revalidate a cached one. Responses kept elsewhere,
+        like compare results in the :py:class:`cache.DiffCache`, skip the HTTP cache so they aren't stored twice.
+    :return: A tuple of the decoded JSON body and a dict of response headers.
+    :raises requests.HTTPError: If the response is neither a 200 nor a 304 for a cached body, so errors (and rate
+        limited requests that ran out of retries) are never mistaken for data.
+    """
+    headers = {}
+    http_cache = cache.get_http_cache()
+    key = cache.make_key(url, sorted((params or {}).items()), access_token)
+    cached = http_cache.get(key) if cache_response else None
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    pacer = ratelimit.get_pacer(urllib.parse.urlsplit(url).netloc, access_token)
+    for attempt in range(settings.RATE_LIMIT_RETRIES + 1):
+        pacer.acquire()
+        response = get_session(url, access_token).get(
+            url, headers=headers, params=params, timeout=settings.HTTP_TIMEOUT)
+        if not pacer.update(response.status_code, response.headers):
+            break
+
+    if cached and response.status_code == 304:
+        logging.info("Not modified, replaying cached response for %s", url)
+        return json.loads(cached['body']), cached['headers']
+    if response.status_code != 200:
+        raise requests.HTTPError(
+            '{} {} for url: {}'.format(response.status_code, response.reason, url), response=response)
+    if cache_response:
+        http_cache.put(key,
+                       etag=response.headers.get('ETag'),
+                       last_modified=response.headers.get('Last-Modified'),
+                       headers={h: response.headers[h] for h in REPLAYED_HEADERS if h in response.headers},
+                       body=response.text)
+    return response.json(), response.headers
+
+
+def paginate(url, access_token, params=None, cache_response=True):
+    """
+    Yields every item of a paginated API listing, following the `Link` headers. Each page goes through :py:func:`get`.
+
+    :param str url: The API url of the first page.
+    :param str access_token: The token to authenticate with.
+    :param dict params: Query string parameters for the first page. Later pages carry them in their urls.
+    :param bool cache_response: Whether to keep the pages in the HTTP cache. See :py:func:`get`.
+    """
+    while url:
+        page, headers = get(url, access_token, params=params, cache_response=cache_response)
+        for item in page:
+            yield item
+        url, params = None, None
+        for link in requests.utils.parse_header_links(headers.get('Link', '')):
+            if link.get('rel') == 'next':
+                url = link['url']
+
+
 def get_branches(user, repo):
-    gh = Github(user.token, base_url=user.base_url)
-    repo = gh.get_repo(user.name + '/' + repo.name)
-    return repo.get_branches()
+    """
+    Yields the branches of a repo. The listing only names each branch's head commit, so the commit is fetched with
+    :py:func:`get` too, and PyGithub never has to fetch it lazily (around the pacer and the HTTP cache) when
+    :py:func:`get_last_updated` reads its date.
+    """
+    gh = get_client(user.base_url, user.token)
+    url = '{}/repos/{}/{}/branches'.format(user.base_url, user.name, repo.name)
+    for raw in paginate(url, user.token, params={'per_page': 100}):
+        commit, _ = get(raw['commit']['url'], user.token)
+        yield gh.create_from_raw_data(github.Branch.Branch, dict(raw, commit=commit))
 
 
 def get_last_updated(entity=None):
+    """
+    :param entity: A pull request, or a branch as :py:func:`get_branches` yields it.
+    :return: When the pull request was last updated, or when the branch's head commit was committed.
+    """
     if isinstance(entity, github.PullRequest.PullRequest):
-        return pr.updated_at
+        return entity.updated_at
     elif isinstance(entity, github.Branch.Branch):
-        last_modified_str = entity.commit.stats.last_modified
-        return datetime.datetime.strptime(last_modified_str, "%a, %d %b %Y %H:%M:%S %Z")
+        return entity.commit.commit.committer.date
+
 
+def open_pull_requests(base_url, access_token, user, repo, since: str=None):
+    """
+    Yields the open pull requests of a repo, most recently updated first.
 
-def open_pull_requests(base_url, access_token, user, repo):
+    :param str since: An ISO 8601 `updated_at` timestamp. Listing stops at the first pull request updated before it, so
+        only the pages with pull requests updated since then are fetched.
+    """
     repo_name = '{}/{}'.format(user, repo)
     logging.info("getting open pull requests for repo name={}".format(repo_name))
     logging.info("base_url=%s, access_token=%s, repo=%s", base_url, access_token, repo_name)
-    gh = Github(access_token, base_url=base_url)
-    repo = gh.get_repo(repo_name)
-    pulls = repo.get_pulls(state='open')
-    for pr in pulls:
-        yield pr
+    url = '{}/repos/{}/pulls'.format(base_url, repo_name)
+    params = {'state': 'open', 'sort': 'updated', 'direction': 'desc', 'per_page': 100}
+    for raw in paginate(url, access_token, params=params):
+        if since is not None and raw['updated_at'] < since:
+            return
+        yield pull_request_from_json(base_url, access_token, raw)
+
+
+def pull_request_from_json(base_url, access_token, raw: dict) -> github.PullRequest.PullRequest:
+    """
+    :param dict raw: A pull request as the REST API (or a webhook payload) represents it.
+    :return: The PyGithub pull request for `raw`, without making a request.
+    """
+    return get_client(base_url, access_token).create_from_raw_data(github.PullRequest.PullRequest, raw)
 
 
 def construct_compare_url(base_url, pull_request):
@@ -70,26 +260,196 @@ def get_sentinel_diff_headers():
     return diff_headers
 
 
-def diff(base_url, access_token, pull_request):
-    compare_url = construct_compare_url(base_url, pull_request)
-    headers = {'Authorization': 'token {}'.format(access_token)}
+def diff_headers(source_file: str, target_file: str) -> str:
+    """
+    :param str source_file: The path before the change, prefixed with `a/`.
+    :param str target_file: The path after the change, prefixed with `b/`.
+    :return: The `diff --git`, `---` and `+++` lines git writes above a changed file's hunks.
+    """
+    return 'diff --git {0} {1}\n--- {0}\n+++ {1}\n'.format(source_file, target_file)
 
-    diff_json = requests.get(compare_url, headers=headers).json()
 
-    if not diff_json.get('files'):
+def pull_request_files(base_url, access_token, pull_request):
+    """
+    Yields the files a pull request changes, as the `pulls/{number}/files` endpoint lists them, one page at a time.
+    Unlike the compare endpoint, which stops at 300 files, it lists up to 3000, and only one page is held in memory at
+    once. Like compare results, the pages carry every patch, so they're kept out of the HTTP cache, which isn't capped.
+
+    :raises Noop: If the pull request changes no files.
+    """
+    url = '{}/repos/{}/{}/pulls/{}/files'.format(
+        base_url, pull_request.base.user.login, pull_request.base.repo.name, pull_request.number)
+    empty = True
+    for head_file in paginate(url, access_token, params={'per_page': 100}, cache_response=False):
+        empty = False
+        yield head_file
+    if empty:
+        raise Noop("Pull request effects no files")
+
+
+def diff_files(base_url, access_token, pull_request):
+    """
+    Yields the files a pull request changes, each with its patch, from the endpoint chosen by `settings.DIFF_ENDPOINT`.
+    Nothing is requested until the first file is asked for. Compare results are kept in the
+    :py:class:`cache.DiffCache`, keyed by the compare url, which names the base and head shas, and not in the HTTP
+    cache.
+
+    :raises Noop: If the pull request changes no files.
+    """
+    if settings.DIFF_ENDPOINT == 'files':
+        yield from pull_request_files(base_url, access_token, pull_request)
+        return
+    compare_url = construct_compare_url(base_url, pull_request)
+    diff_cache = cache.get_diff_cache()
+    key = cache.make_key(compare_url)
+    head_files = diff_cache.get(key)
+    if head_files is None:
+        diff_json, _ = get(compare_url, access_token, cache_response=False)
+        head_files = diff_json.get('files')
+        if head_files:
+            diff_cache.put(key, head_files)
+    if not head_files:
         raise Noop("Pull request effects no files")
+    yield from head_files
 
-    complete_diff = ""
-    diff_headers = get_sentinel_diff_headers()
-    for head_file in diff_json.get('files'):
-        head_filename = head_file.get('filename')
-        head_diff_headers = diff_headers.format(filename=head_filename)
 
-        # When a file is deleted, created, or renamed; the patch is None
-        if head_file.get('patch') is None:
+def patched_files(head_files):
+    """
+    Parses the patch of each changed file as it's needed, without joining them into one diff first.
+
+    :param head_files: An iterable of changed files, as the compare and `pulls/{number}/files` endpoints list them.
+    :return: A generator of `(patched_file, patch)` tuples. `patched_file` is a :py:class:`hunks.PatchedFile`, or a
+        `unidiff.PatchedFile` when `settings.DIFF_PARSER` is `unidiff`. Files without a patch (like binary files, or
+        renames without changes) are skipped. `unidiff` is only imported when it's the parser.
+    """
+    if settings.DIFF_PARSER != 'hunks':
+        import unidiff
+    for head_file in head_files:
+        patch = head_file.get('patch')
+        if patch is None:
+            continue
+        source_file = 'a/' + (head_file.get('previous_filename') or head_file['filename'])
+        target_file = 'b/' + head_file['filename']
+        if settings.DIFF_PARSER == 'hunks':
+            yield hunks.PatchedFile(source_file, target_file, hunks.parse_hunks(patch)), patch
             continue
+        lines = ['--- {}\n'.format(source_file), '+++ {}\n'.format(target_file)]
+        lines.extend(patch.splitlines(True))
+        for patched_file in unidiff.PatchSet(lines):
+            yield patched_file, patch
+
+
+def graphql_url(base_url) -> str:
+    """
+    :param str base_url: The REST API base url, like `https://api.github.com` or `https://github.example.com/api/v3`.
+    :return: The GraphQL endpoint of the same host.
+    """
+    if base_url.rstrip('/').endswith('/api/v3'):
+        return base_url.rstrip('/')[:-len('/v3')] + '/graphql'
+    return base_url.rstrip('/') + '/graphql'
+
+
+def graphql(base_url, access_token, query, variables=None) -> dict:
+    """
+    POSTs a GraphQL query. Queries are paced like :py:func:`get`, but against the GraphQL rate limit, which is counted
+    in points rather than requests. The cost of each query is logged when it asks for `rateLimit`.
+
+    :param str base_url: The REST API base url.
+    :param str access_token: The token to authenticate with.
+    :param str query: The query.
+    :param dict variables: Values for the variables in `query`.
+    :return: The `data` of the response. Errors that came with data, like a repo that doesn't exist, are logged.
+    """
+    url = graphql_url(base_url)
+    pacer = ratelimit.get_pacer(urllib.parse.urlsplit(url).netloc + '/graphql', access_token)
+    for attempt in range(settings.RATE_LIMIT_RETRIES + 1):
+        pacer.acquire()
+        response = get_session(url, access_token).post(
+            url, json={'query': query, 'variables': variables or {}}, timeout=settings.HTTP_TIMEOUT)
+        if not pacer.update(response.status_code, response.headers):
+            break
+    response.raise_for_status()
+    body = response.json()
+    errors = [error.get('message') for error in body.get('errors') or []]
+    if body.get('data') is None:
+        raise GraphQLError('; '.join(errors) or 'The query returned no data')
+    for error in errors:
+        logging.warning("GraphQL error: %s", error)
+    rate_limit = body['data'].get('rateLimit')
+    if rate_limit:
+        logging.info("GraphQL query cost %s points, %s left until %s",
+                     rate_limit.get('cost'), rate_limit.get('remaining'), rate_limit.get('resetAt'))
+    return body['data']
+
+
+def pull_request_from_graphql(node: dict) -> dict:
+    """
+    :param dict node: A pull request as :py:data:`GRAPHQL_REPOSITORY` queries it.
+    :return: The parts of the REST representation of the pull request the watcher reads.
+    """
+    base_repository = node.get('baseRepository') or {}
+    return {
+        'number': node['number'],
+        'html_url': node['url'],
+        'updated_at': node['updatedAt'],
+        'user': {'login': (node.get('author') or {}).get('login')},
+        'base': {
+            'sha': node['baseRefOid'],
+            'user': {'login': (base_repository.get('owner') or {}).get('login')},
+            'repo': {'name': base_repository.get('name')},
+        },
+        'head': {
+            'sha': node['headRefOid'],
+            'user': {'login': (node.get('headRepositoryOwner') or {}).get('login')},
+        },
+    }
+
+
+def open_pull_requests_graphql(base_url, access_token, repos):
+    """
+    Lists the open pull requests of many repos with a handful of GraphQL queries instead of a REST listing per repo.
+    Up to `settings.GRAPHQL_BATCH_SIZE` repos are queried at once, `settings.GRAPHQL_PAGE_SIZE` pull requests at a
+    time, and the paths of the files each pull request changes come along with it.
+
+    :param str base_url: The REST API base url.
+    :param str access_token: The token to authenticate with.
+    :param repos: A list of `(owner, name, since)` tuples. Like in :py:func:`open_pull_requests`, listing a repo stops
+        at the first pull request updated before `since`, when it's not None.
+    :return: A generator of `(owner, name, pull_request, files)` tuples. `files` lists the `path` and `changeType`
+        (like `MODIFIED` or `RENAMED`) of each file the pull request changes, or is None when it changes more than
+        `settings.GRAPHQL_FILES` files.
+    """
+    gh = get_client(base_url, access_token)
+    pending = [{'owner': owner, 'name': name, 'since': since, 'after': None} for owner, name, since in repos]
+    while pending:
+        batch, pending = pending[:settings.GRAPHQL_BATCH_SIZE], pending[settings.GRAPHQL_BATCH_SIZE:]
+        declarations, selections, variables = ['$after{}: String'.format(n) for n in range(len(batch))], [], {}
+        for n, repo in enumerate(batch):
+            declarations += ['$owner{}: String!'.format(n), '$name{}: String!'.format(n)]
+            selections.append(GRAPHQL_REPOSITORY.format(n=n, page_size=settings.GRAPHQL_PAGE_SIZE,
+                                                        files=settings.GRAPHQL_FILES))
+            variables.update({'owner{}'.format(n): repo['owner'], 'name{}'.format(n): repo['name'],
+                              'after{}'.format(n): repo['after']})
+        query = 'query({}) {{\n  rateLimit {{ cost remaining resetAt }}{}\n}}'.format(
+            ', '.join(declarations), ''.join(selections))
+        data = graphql(base_url, access_token, query, variables)
 
-        complete_diff += head_diff_headers + head_file.get('patch', '')
-        complete_diff += "\n"
+        unfinished = []
+        for n, repo in enumerate(batch):
+            if data.get('r{}'.format(n)) is None:
+                logging.warning("Couldn't list pull requests in %s/%s", repo['owner'], repo['name'])
+                continue
+            connection = data['r{}'.format(n)]['pullRequests']
+            finished = not connection['pageInfo']['hasNextPage']
+            for node in connection['nodes']:
+                if repo['since'] is not None and node['updatedAt'] < repo['since']:
+                    finished = True
+                    break
+                files = None if node['files']['pageInfo']['hasNextPage'] else node['files']['nodes']
+                pull_request = gh.create_from_raw_data(github.PullRequest.PullRequest, pull_request_from_graphql(node))
+                yield repo['owner'], repo['name'], pull_request, files
+            if not finished:
+                repo['after'] = connection['pageInfo']['endCursor']
+                unfinished.append(repo)
+        pending = unfinished + pending
 
-    return complete_diff
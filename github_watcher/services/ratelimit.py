@@ -0,0 +1,127 @@
+"""
+The Rate Limit Module
+---------------------
+
+This module paces API requests so the watcher never runs a token's rate limit dry. A :py:class:`Pacer` reads the
+`X-RateLimit-Remaining` and `X-RateLimit-Reset` headers of every response and spreads the requests left in the window
+over the time left in it, keeping `settings.RATE_LIMIT_RESERVE` requests back for other tools using the same token. Once
+only the reserve is left, requests wait for the window to reset instead of failing. When GitHub asks the watcher to slow
+down (a secondary rate limit) with `Retry-After`, no request is made with that token until the time is up.
+
+"""
+import time
+import logging
+import threading
+
+import github_watcher.settings as settings
+
+
+_pacers = {}
+_pacers_lock = threading.Lock()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Pacer:
+    """
+    A token bucket refilled at the rate GitHub's headers allow: the requests left in the window, less the reserve,
+    divided by the seconds until the window resets. Up to `burst` unused tokens accumulate, so a quiet token can make a
+    short burst of requests without waiting.
+
+    :param int reserve: How many requests to leave unused in every window. Defaults to `settings.RATE_LIMIT_RESERVE`.
+    :param int burst: The most tokens the bucket holds. Defaults to `settings.RATE_LIMIT_BURST`.
+    :param clock: Returns the current time in seconds since the epoch.
+    :param sleep: Sleeps for a number of seconds.
+    """
+
+    def __init__(self, reserve: int=None, burst: int=None, clock=time.time, sleep=time.sleep):
+        self.reserve = settings.RATE_LIMIT_RESERVE if reserve is None else reserve
+        self.burst = settings.RATE_LIMIT_BURST if burst is None else burst
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+        self.blocked_until = 0
+        self.tokens = self.burst
+        self.refilled_at = clock()
+
+    def reserve_slot(self) -> float:
+        """
+        Takes a token for the next request.
+
+        :return: How many seconds to wait before making the request.
+        """
+        with self.lock:
+            now = self.clock()
+            delay = max(0, self.blocked_until - now)
+            if self.remaining is None or self.reset is None or self.reset <= now:
+                return delay
+            window = self.reset - now
+            budget = self.remaining - self.reserve
+            if budget <= 0:
+                return max(delay, window)
+            rate = budget / window
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * rate)
+            self.refilled_at = now
+            self.tokens -= 1
+            self.remaining -= 1
+            if self.tokens >= 0:
+                return delay
+            return max(delay, -self.tokens / rate)
+
+    def acquire(self):
+        """
+        Blocks until the next request may be made.
+        """
+        delay = self.reserve_slot()
+        if delay > 0:
+            logging.info("Pacing API requests, waiting %.2f seconds", delay)
+            self.sleep(delay)
+
+    def update(self, status_code: int, headers) -> bool:
+        """
+        Reads the rate limit headers of a response.
+
+        :param int status_code: The response status.
+        :param headers: The response headers.
+        :return: True if the response was a rate limit rejection and the request should be retried.
+        """
+        remaining = _number(headers.get('X-RateLimit-Remaining'))
+        reset = _number(headers.get('X-RateLimit-Reset'))
+        retry_after = _number(headers.get('Retry-After'))
+        with self.lock:
+            now = self.clock()
+            if remaining is not None:
+                self.remaining = remaining
+            if reset is not None:
+                self.reset = reset
+            if status_code not in (403, 429):
+                return False
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                logging.warning("Secondary rate limit hit, pausing for %s seconds", retry_after)
+                return True
+            if remaining == 0 and reset is not None:
+                self.blocked_until = max(self.blocked_until, reset)
+                logging.warning("Rate limit exhausted, pausing until %s", reset)
+                return True
+        return False
+
+
+def get_pacer(host: str, access_token: str) -> Pacer:
+    """
+    :param str host: The API host.
+    :param str access_token: The token requests are made with.
+    :return: The :py:class:`Pacer` for `access_token` on `host`, shared by every caller in the process.
+    """
+    key = (host, access_token)
+    with _pacers_lock:
+        if key not in _pacers:
+            _pacers[key] = Pacer()
+        return _pacers[key]
@@ -0,0 +1,229 @@
+"""
+The State Store Module
+----------------------
+
+This module persists what the watcher has already done between cycles and restarts: the pull requests it has alerted on,
+and the base and head of every pull request it has evaluated along with the configuration it was evaluated against. It
+also keeps a cursor per repo: the `updated_at` of the most recently updated pull request seen in it. The store
+is backed by sqlite in WAL mode so lookups are indexed and exact, and writes are buffered and committed in batches.
+
+The first time a store is opened, the links in the old append-only alert log (`settings.WATCHER_ALERT_LOG`) are
+imported into it.
+
+"""
+import logging
+import threading
+import time
+import atexit
+import sqlite3
+
+import github_watcher.settings as settings
+
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS alerts (link TEXT PRIMARY KEY, alerted_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS pull_requests (link TEXT PRIMARY KEY, base_sha TEXT, head_sha TEXT, "
+    "fingerprint TEXT, result TEXT, checked_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS cursors (repo TEXT PRIMARY KEY, updated_at TEXT, fingerprint TEXT)",
+]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class Store:
+    """
+    :param str path: The path to the sqlite database. It's created if it doesn't exist.
+    :param str alert_log: The path to the old alert log to migrate from. Defaults to `settings.WATCHER_ALERT_LOG`.
+    :param int batch_size: How many pending writes to buffer before they're committed without waiting for a flush.
+    """
+
+    def __init__(self, path: str, alert_log: str=None, batch_size: int=100):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        self.pending_alerts = {}
+        self.pending_pull_requests = {}
+        self.pending_cursors = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.migrate_alert_log(settings.WATCHER_ALERT_LOG if alert_log is None else alert_log)
+
+    def get_meta(self, key: str) -> str or None:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.connection.commit()
+
+    def migrate_alert_log(self, alert_log: str):
+        """
+        Imports every link in the old alert log, once.
+
+        :param str alert_log: The path to the old alert log.
+        """
+        if self.get_meta('alert_log_migrated'):
+            return
+        try:
+            with open(alert_log, 'rb') as fp:
+                links = set(line.decode('utf-8').strip() for line in fp.readlines())
+        except IOError:
+            links = set()
+        links.discard('')
+        now = time.time()
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO alerts (link, alerted_at) VALUES (?, ?)",
+                                        [(link, now) for link in links])
+            self.connection.commit()
+        logging.info("Migrated %s links from %s", len(links), alert_log)
+        self.set_meta('alert_log_migrated', str(now))
+
+    def is_alerted(self, link: str) -> bool:
+        """
+        :param str link: The link to a pull request.
+        :return: True if an alert has been recorded for exactly `link`.
+        """
+        with self.lock:
+            if link in self.pending_alerts:
+                return True
+            row = self.connection.execute("SELECT 1 FROM alerts WHERE link = ?", (link,)).fetchone()
+        return row is not None
+
+    def mark_alerted(self, link: str):
+        """
+        Records an alert for `link`. The write is buffered until :py:meth:`flush` or until `batch_size` writes are
+        pending.
+
+        :param str link: The link to a pull request.
+        """
+        with self.lock:
+            self.pending_alerts[link] = time.time()
+            if len(self.pending_alerts) >= self.batch_size:
+                self.flush()
+
+    def get_pull_request(self, link: str) -> tuple or None:
+        """
+        :param str link: The link to a pull request.
+        :return: The `(base_sha, head_sha, fingerprint, result)` last recorded for `link`, or None.
+        """
+        with self.lock:
+            if link in self.pending_pull_requests:
+                return self.pending_pull_requests[link][:4]
+            return self.connection.execute(
+                "SELECT base_sha, head_sha, fingerprint, result FROM pull_requests WHERE link = ?", (link,)).fetchone()
+
+    def is_unchanged(self, link: str, base_sha: str, head_sha: str, fingerprint: str) -> bool:
+        """
+        :param str link: The link to a pull request.
+        :param str base_sha: The pull request's current base sha.
+        :param str head_sha: The pull request's current head sha.
+        :param str fingerprint: The fingerprint of the configuration the pull request would be evaluated against.
+        :return: True if `link` was last evaluated at the same base and head against the same configuration.
+        """
+        state = self.get_pull_request(link)
+        return state is not None and tuple(state[:3]) == (base_sha, head_sha, fingerprint)
+
+    def record_pull_request(self, link: str, base_sha: str, head_sha: str, fingerprint: str, result: str=''):
+        """
+        Records the outcome of evaluating a pull request. The write is buffered like :py:meth:`mark_alerted`.
+
+        :param str link: The link to a pull request.
+        :param str base_sha: The base sha that was evaluated.
+        :param str head_sha: The head sha that was evaluated.
+        :param str fingerprint: The fingerprint of the configuration it was evaluated against.
+        :param str result: A description of the outcome.
+        """
+        with self.lock:
+            self.pending_pull_requests[link] = (base_sha, head_sha, fingerprint, result, time.time())
+            if len(self.pending_pull_requests) >= self.batch_size:
+                self.flush()
+
+    def get_cursor(self, repo: str, fingerprint: str) -> str or None:
+        """
+        :param str repo: The API url of a repo.
+        :param str fingerprint: The fingerprint of the repo's current configuration.
+        :return: The `updated_at` cursor of `repo`, or None if it has none or it was recorded against another
+            configuration, in which case every pull request has to be evaluated again.
+        """
+        with self.lock:
+            if repo in self.pending_cursors:
+                row = self.pending_cursors[repo]
+            else:
+                row = self.connection.execute(
+                    "SELECT updated_at, fingerprint FROM cursors WHERE repo = ?", (repo,)).fetchone()
+        if row is None or row[1] != fingerprint:
+            return None
+        return row[0]
+
+    def set_cursor(self, repo: str, updated_at: str, fingerprint: str):
+        """
+        Records the cursor of a repo once every pull request updated up to `updated_at` has been evaluated. The write is
+        buffered like :py:meth:`mark_alerted`, and committed in the same transaction as the evaluations.
+
+        :param str repo: The API url of a repo.
+        :param str updated_at: The ISO 8601 `updated_at` of the most recently updated pull request.
+        :param str fingerprint: The fingerprint of the configuration the pull requests were evaluated against.
+        """
+        with self.lock:
+            self.pending_cursors[repo] = (updated_at, fingerprint)
+
+    def flush(self):
+        """
+        Commits all of the buffered writes in one transaction.
+        """
+        with self.lock:
+            if not self.pending_alerts and not self.pending_pull_requests and not self.pending_cursors:
+                return
+            self.connection.executemany("INSERT OR IGNORE INTO alerts (link, alerted_at) VALUES (?, ?)",
+                                        list(self.pending_alerts.items()))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pull_requests (link, base_sha, head_sha, fingerprint, result, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(link,) + state for link, state in self.pending_pull_requests.items()])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cursors (repo, updated_at, fingerprint) VALUES (?, ?, ?)",
+                [(repo,) + cursor for repo, cursor in self.pending_cursors.items()])
+            self.connection.commit()
+            self.pending_alerts = {}
+            self.pending_pull_requests = {}
+            self.pending_cursors = {}
+
+    def close(self):
+        with _stores_lock:
+            if _stores.get(self.path) is self:
+                del _stores[self.path]
+        with self.lock:
+            self.flush()
+            self.connection.close()
+
+
+def get_store(path: str=None) -> Store:
+    """
+    :param str path: The path to the sqlite database. Defaults to `settings.WATCHER_STATE_DB`.
+    :return: The :py:class:`Store` at `path`, shared by every caller in the process.
+    """
+    if path is None:
+        path = settings.WATCHER_STATE_DB
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = Store(path)
+        return _stores[path]
+
+
+@atexit.register
+def flush():
+    """
+    Commits the buffered writes of every store opened in this process.
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
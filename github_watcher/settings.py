@@ -4,3 +4,43 @@ import os
 HOME = os.path.expanduser('~')
 WATCHER_CONFIG = os.path.join(HOME, '.github-watcher.yml')
 WATCHER_ALERT_LOG = '/tmp/watcher_alert.log'
+WATCHER_STATE_DB = os.path.join(HOME, '.github-watcher.db')
+WATCHER_CACHE_DIR = os.path.join(HOME, '.github-watcher-cache')
+WATCHER_HTTP_CACHE = os.path.join(WATCHER_CACHE_DIR, 'http')
+WATCHER_DIFF_CACHE = os.path.join(WATCHER_CACHE_DIR, 'diffs')
+DIFF_CACHE_SIZE = 256 * 1024 * 1024  # bytes of compressed diffs kept on disk
+HTTP_CACHE_SIZE = 64 * 1024 * 1024  # bytes of cached API responses kept on disk
+
+HTTP_TIMEOUT = 30  # seconds
+HTTP_POOL_SIZE = 10
+
+FETCH_MODE = 'serial'  # serial|async|pipeline|graphql
+FETCH_CONCURRENCY = 8  # requests in flight per base_url in async mode
+PIPELINE_WORKERS = {'list': 2, 'fetch': 8, 'parse': 2, 'match': 2, 'notify': 1}  # threads per stage
+PIPELINE_QUEUE_SIZE = 100  # items waiting per stage before producers block
+DEPTH_LOG_INTERVAL = 10  # seconds between logs of the pipeline's queue depths; 0 disables them
+DIFF_ENDPOINT = 'compare'  # compare|files
+DIFF_PARSER = 'hunks'  # hunks|unidiff
+GRAPHQL_BATCH_SIZE = 10  # repos listed per query in graphql mode
+GRAPHQL_PAGE_SIZE = 25  # pull requests listed per repo per query
+GRAPHQL_FILES = 100  # changed paths listed per pull request; larger pull requests are diffed over REST
+
+RATE_LIMIT_RESERVE = 50  # requests per token left unused in every rate limit window
+RATE_LIMIT_BURST = 100  # requests a token can make back to back before pacing kicks in
+RATE_LIMIT_RETRIES = 3  # times a rate limited request is retried
+
+ALERT_SINKS = [{'type': 'desktop'}]  # where alerts are delivered: desktop|stdout|jsonl|http, see github_watcher.sinks
+SINK_FLUSH_INTERVAL = 5  # seconds alerts wait in a sink's buffer before they're written together
+SINK_BUFFER_SIZE = 500  # alerts a sink buffers; a full buffer is written right away
+NOTIFY_TIMEOUT = 5  # seconds a desktop notification stays up on Linux
+NOTIFY_QUEUE_SIZE = 1000  # alerts waiting for delivery before new ones are dropped
+DIGEST_WINDOW = 10  # seconds after an alert during which further alerts are coalesced into a digest
+
+POLL_INTERVAL = 60 * 10  # seconds between polls of a repo until its activity is known
+POLL_MIN_INTERVAL = 60
+POLL_MAX_INTERVAL = 60 * 30
+
+WEBHOOK_HOST = '127.0.0.1'  # where `serve` listens for webhook deliveries
+WEBHOOK_PORT = 8900
+WEBHOOK_SECRET = os.environ.get('GITHUB_WATCHER_WEBHOOK_SECRET')  # the secret the webhooks are signed with
+CATCHUP_INTERVAL = 60 * 60  # seconds between catch-up polls of every repo while serving webhooks
@@ -0,0 +1,257 @@
+"""
+The Sinks Module
+----------------
+
+This module implements the places alerts are delivered to. `settings.ALERT_SINKS` lists the sinks the
+:py:class:`github_watcher.notifier.NotificationWorker` hands alerts to, e.g.
+
+.. code-block:: yaml
+
+    alert_sinks:
+      - type: jsonl
+        path: /var/log/github-watcher/alerts.jsonl
+      - type: http
+        url: http://127.0.0.1:9000/alerts
+        flush_interval: 30
+
++-----------+--------------------------------------------------------------------------------------------------------+
+| Type      | Description                                                                                            |
++===========+========================================================================================================+
+| desktop   | Shows alerts as desktop notifications, and speaks them on Darwin. Alerts coalesced by the worker are   |
+|           | shown as one digest. Doesn't buffer by default. This is the default sink.                              |
++-----------+--------------------------------------------------------------------------------------------------------+
+| stdout    | Prints a JSON object per alert to standard output.                                                     |
++-----------+--------------------------------------------------------------------------------------------------------+
+| jsonl     | Appends a JSON object per alert to the file at `path`.                                                 |
++-----------+--------------------------------------------------------------------------------------------------------+
+| http      | POSTs `{"alerts": [...]}` to `url`, one request per flush.                                             |
++-----------+--------------------------------------------------------------------------------------------------------+
+
+Every sink buffers alerts and writes them all at once every `flush_interval` seconds (`settings.SINK_FLUSH_INTERVAL`
+by default), or as soon as `buffer_size` alerts (`settings.SINK_BUFFER_SIZE`) are waiting, so a burst of matches costs
+a write or a request per flush rather than per alert. If a write fails, the alerts stay buffered until the next flush;
+once the buffer is full, the oldest are dropped.
+
+"""
+import collections
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import github_watcher.settings as settings
+
+SYSTEM = platform.system()
+
+
+Alert = collections.namedtuple('Alert', ('msg', 'pr_link', 'silent', 'rule', 'time'))
+
+
+def repo_of(pr_link: str) -> str:
+    """
+    :param str pr_link: The `html_url` of a pull request, like `https://github.com/owner/repo/pull/1`.
+    :return: `owner/repo`, or `pr_link` itself if it isn't a pull request link.
+    """
+    parts = urllib.parse.urlparse(pr_link).path.strip('/').split('/')
+    if len(parts) >= 4 and parts[-2] == 'pull':
+        return '/'.join(parts[-4:-2])
+    return pr_link
+
+
+def to_json(alert: Alert) -> dict:
+    return {
+        'time': alert.time,
+        'repo': repo_of(alert.pr_link),
+        'rule': alert.rule,
+        'message': alert.msg,
+        'pr_link': alert.pr_link,
+    }
+
+
+def digest(alerts: list) -> Alert:
+    """
+    :param list alerts: The :py:class:`Alert` objects to coalesce.
+    :return: One alert summing up `alerts` per repo and per rule. It links to the first pull request and is silent only
+        if every alert was.
+    """
+    repos = collections.Counter(repo_of(alert.pr_link) for alert in alerts)
+    rules = collections.Counter(alert.rule or 'match' for alert in alerts)
+    msg = 'Found {} PRs of interest: {} ({})'.format(
+        len(alerts),
+        ', '.join('{} in {}'.format(count, repo) for repo, count in repos.most_common()),
+        ', '.join('{} {}'.format(count, rule) for rule, count in rules.most_common()))
+    return Alert(msg, alerts[0].pr_link, all(alert.silent for alert in alerts), None, alerts[0].time)
+
+
+class Sink:
+    """
+    Buffers alerts and writes them in batches. Subclasses implement :py:meth:`write`.
+
+    :param float flush_interval: The most seconds an alert waits in the buffer. 0 writes every batch the worker emits
+        right away. Defaults to `settings.SINK_FLUSH_INTERVAL`.
+    :param int buffer_size: The most alerts kept in the buffer. Defaults to `settings.SINK_BUFFER_SIZE`.
+    """
+
+    FLUSH_INTERVAL = None  # Overrides `settings.SINK_FLUSH_INTERVAL` for the sink type.
+
+    def __init__(self, flush_interval: float=None, buffer_size: int=None):
+        if flush_interval is None:
+            flush_interval = settings.SINK_FLUSH_INTERVAL if self.FLUSH_INTERVAL is None else self.FLUSH_INTERVAL
+        self.flush_interval = flush_interval
+        self.buffer = collections.deque(maxlen=settings.SINK_BUFFER_SIZE if buffer_size is None else buffer_size)
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.failing = False
+        self.dropped = 0
+
+    def emit(self, alerts: list):
+        """
+        Buffers `alerts`, and flushes if the buffer is full or the sink doesn't wait.
+        """
+        with self.lock:
+            for alert in alerts:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped += 1
+                self.buffer.append(alert)
+            full = len(self.buffer) == self.buffer.maxlen and not self.failing
+            if full or self.flush_interval <= 0:
+                self._flush()
+
+    def next_flush(self) -> float or None:
+        """
+        :return: When the buffered alerts are due to be written, on the `time.monotonic` clock, or None if there are
+            none.
+        """
+        if not self.buffer:
+            return None
+        return self.last_flush + self.flush_interval
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        if self.dropped:
+            logging.warning("The %s sink dropped %s alerts", type(self).__name__, self.dropped)
+            self.dropped = 0
+        try:
+            self.write(list(self.buffer))
+        except Exception:
+            logging.exception("Writing %s alerts with %s failed", len(self.buffer), type(self).__name__)
+            self.failing = True
+            return
+        self.failing = False
+        self.buffer.clear()
+
+    def write(self, alerts: list):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class DesktopSink(Sink):
+    """
+    Shows alerts as desktop notifications, as supported by the target system. `pync` and `notify2` are only imported
+    for the first notification, so commands that never alert don't pay for them. The `notify2` connection is set up
+    once and reused, and notifications close themselves after `settings.NOTIFY_TIMEOUT` seconds.
+    """
+
+    FLUSH_INTERVAL = 0
+
+    def __init__(self, flush_interval: float=None, buffer_size: int=None):
+        super().__init__(flush_interval, buffer_size)
+        self.initialized = False
+
+    def write(self, alerts: list):
+        alert = alerts[0] if len(alerts) == 1 else digest(alerts)
+        self.notify(alert.msg, alert.pr_link, alert.silent)
+
+    def notify(self, msg: str, pr_link: str, silent: bool=False):
+        """
+        :param str msg: The alert.
+        :param str pr_link: A link to the pull request, opened when the notification is clicked on Darwin.
+        :param bool silent: Whether or not to silence audio alerts.
+        """
+        if SYSTEM == 'Darwin':
+            from pync import Notifier
+            if not silent:
+                subprocess.call('say ' + msg, shell=True)
+            Notifier.notify(msg, title='Github Watcher', open=pr_link)
+        elif SYSTEM == 'Linux' and os.environ.get('TRAVIS') != 'true':
+            import notify2
+            if not self.initialized:
+                notify2.init(app_name='github-watcher')
+                self.initialized = True
+            note = notify2.Notification('Github Watcher', message=msg)
+            note.set_timeout(int(settings.NOTIFY_TIMEOUT * 1000))
+            note.show()
+
+
+class StdoutSink(Sink):
+
+    def write(self, alerts: list):
+        sys.stdout.write(''.join(json.dumps(to_json(alert)) + '\n' for alert in alerts))
+        sys.stdout.flush()
+
+
+class JSONLinesSink(Sink):
+    """
+    :param str path: The file to append alerts to. It's created if it doesn't exist.
+    """
+
+    def __init__(self, path: str, flush_interval: float=None, buffer_size: int=None):
+        super().__init__(flush_interval, buffer_size)
+        self.path = path
+
+    def write(self, alerts: list):
+        with open(self.path, 'a') as fp:
+            fp.write(''.join(json.dumps(to_json(alert)) + '\n' for alert in alerts))
+
+
+class HTTPSink(Sink):
+    """
+    :param str url: Where to POST the alerts.
+    """
+
+    def __init__(self, url: str, flush_interval: float=None, buffer_size: int=None):
+        super().__init__(flush_interval, buffer_size)
+        self.url = url
+
+    def write(self, alerts: list):
+        response = requests.post(self.url, json={'alerts': [to_json(alert) for alert in alerts]},
+                                 timeout=settings.HTTP_TIMEOUT)
+        response.raise_for_status()
+
+
+SINKS = {
+    'desktop': DesktopSink,
+    'stdout': StdoutSink,
+    'jsonl': JSONLinesSink,
+    'http': HTTPSink,
+}
+
+
+def make_sinks(specs: list=None) -> list:
+    """
+    :param list specs: Dicts with the `type` of each sink and its options. Defaults to `settings.ALERT_SINKS`.
+    :return: A sink for each spec.
+    """
+    sinks = []
+    for spec in settings.ALERT_SINKS if specs is None else specs:
+        options = dict(spec)
+        kind = options.pop('type', None)
+        if kind not in SINKS:
+            raise ValueError("Unknown alert sink type {!r}; expected one of {}.".format(kind, ', '.join(SINKS)))
+        sinks.append(SINKS[kind](**options))
+    return sinks
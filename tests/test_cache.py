@@ -0,0 +1,104 @@
+import os
+import gzip
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from github_watcher.services import cache
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_make_key(self):
+        key = cache.make_key('https://api.github.com', '*****')
+        self.assertEqual(key, cache.make_key('https://api.github.com', '*****'))
+        self.assertNotEqual(key, cache.make_key('https://api.github.com', 'another token'))
+        self.assertNotEqual(cache.make_key('ab', 'c'), cache.make_key('a', 'bc'))
+        self.assertNotIn('*****', key)
+
+    def test_http_cache(self):
+        http_cache = cache.HTTPCache(os.path.join(self.tmpdir.name, 'http'), 1024 * 1024)
+        key = cache.make_key('my url')
+        self.assertIsNone(http_cache.get(key))
+        http_cache.put(key, etag='"abc"', headers={'Link': 'my link'}, body='[]')
+        self.assertEqual(http_cache.get(key), {
+            'etag': '"abc"',
+            'last_modified': None,
+            'headers': {'Link': 'my link'},
+            'body': '[]',
+        })
+
+    def test_http_cache_skips_responses_that_cant_be_revalidated(self):
+        http_cache = cache.HTTPCache(self.tmpdir.name, 1024 * 1024)
+        key = cache.make_key('my url')
+        http_cache.put(key, body='[]')
+        self.assertIsNone(http_cache.get(key))
+
+    def test_http_cache_evicts_the_least_recently_used(self):
+        size = len(b'{"etag": "\\"abc\\"", "last_modified": null, "headers": {}, "body": "[]"}')
+        http_cache = cache.HTTPCache(self.tmpdir.name, 2 * size)
+        first, second, third = cache.make_key('first'), cache.make_key('second'), cache.make_key('third')
+        for key in (first, second):
+            http_cache.put(key, etag='"abc"', body='[]')
+        http_cache.get(first)
+        http_cache.put(third, etag='"abc"', body='[]')
+        self.assertIsNotNone(http_cache.get(first))
+        self.assertIsNone(http_cache.get(second))
+        self.assertIsNotNone(http_cache.get(third))
+        self.assertEqual(http_cache.size, 2 * size)
+
+        http_cache = cache.HTTPCache(self.tmpdir.name, 2 * size)
+        self.assertEqual(sorted(http_cache.index()), sorted([first, third]))
+
+    def test_get_http_cache(self):
+        with mock.patch('github_watcher.settings.WATCHER_HTTP_CACHE', self.tmpdir.name):
+            with mock.patch('github_watcher.settings.HTTP_CACHE_SIZE', 1024):
+                self.assertIs(cache.get_http_cache(), cache.get_http_cache())
+                self.assertEqual(cache.get_http_cache().directory, self.tmpdir.name)
+                self.assertEqual(cache.get_http_cache().max_bytes, 1024)
+
+    def test_diff_cache(self):
+        diff_cache = cache.DiffCache(os.path.join(self.tmpdir.name, 'diffs'), 1024 * 1024)
+        key = cache.make_key('my compare url')
+        files = [{'filename': 'a.py', 'patch': '@@ -1 +1 @@\n-a\n+b'}]
+        self.assertIsNone(diff_cache.get(key))
+        diff_cache.put(key, files)
+        self.assertEqual(diff_cache.get(key), files)
+        with open(diff_cache.filepath(key), 'rb') as fp:
+            self.assertEqual(gzip.decompress(fp.read()), b'[{"filename": "a.py", "patch": "@@ -1 +1 @@\\n-a\\n+b"}]')
+
+    def test_diff_cache_evicts_the_least_recently_used(self):
+        files = [{'filename': 'a.py', 'patch': 'x' * 100}]
+        size = len(gzip.compress(b'[{"filename": "a.py", "patch": "' + b'x' * 100 + b'"}]'))
+        diff_cache = cache.DiffCache(self.tmpdir.name, 2 * size)
+        first, second, third = cache.make_key('first'), cache.make_key('second'), cache.make_key('third')
+        diff_cache.put(first, files)
+        diff_cache.put(second, files)
+        diff_cache.get(first)
+        diff_cache.put(third, files)
+        self.assertEqual(diff_cache.get(first), files)
+        self.assertIsNone(diff_cache.get(second))
+        self.assertEqual(diff_cache.get(third), files)
+        self.assertFalse(os.path.exists(diff_cache.filepath(second)))
+        self.assertEqual(diff_cache.size, 2 * size)
+
+    def test_diff_cache_indexes_entries_already_on_disk(self):
+        cache.DiffCache(self.tmpdir.name, 1024).put(cache.make_key('first'), [])
+        diff_cache = cache.DiffCache(self.tmpdir.name, 1024)
+        self.assertEqual(list(diff_cache.index()), [cache.make_key('first')])
+        self.assertEqual(diff_cache.size, os.path.getsize(diff_cache.filepath(cache.make_key('first'))))
+
+    def test_diff_cache_disabled(self):
+        diff_cache = cache.DiffCache(self.tmpdir.name, 0)
+        diff_cache.put(cache.make_key('first'), [])
+        self.assertIsNone(diff_cache.get(cache.make_key('first')))
+
+    def test_get_diff_cache(self):
+        with mock.patch('github_watcher.settings.WATCHER_DIFF_CACHE', self.tmpdir.name):
+            with mock.patch('github_watcher.settings.DIFF_CACHE_SIZE', 1024):
+                self.assertIs(cache.get_diff_cache(), cache.get_diff_cache())
+                self.assertEqual(cache.get_diff_cache().max_bytes, 1024)
@@ -4,6 +4,7 @@ import unittest.mock as mock
 
 import yaml
 
+import github_watcher.settings as settings
 import github_watcher.commands.config as config
 
 
@@ -307,6 +308,129 @@ username:
         }}
         self.assertEqual(config.Configuration.from_json(conf).to_json(), conf)
 
+    def test_watch_matcher(self):
+        repo = config.Repo(name='github_watcher', paths=[
+            config.Path(path='docs/', ranges=[]),
+            config.Path(path='github_watcher/commands/', ranges=[]),
+            config.Path(path='github_watcher/settings.py', ranges=[config.Range(0, 1)]),
+            config.Path(path='/', ranges=[])])
+        matcher = repo.matcher
+
+        self.assertIs(matcher.watched_file('github_watcher/settings.py'), repo.paths[2])
+        self.assertIsNone(matcher.watched_file('github_watcher/util.py'))
+        self.assertIsNone(matcher.watched_file('docs/'))
+
+        self.assertTrue(matcher.watched_directory('docs/index.rst'))
+        self.assertTrue(matcher.watched_directory('github_watcher/commands/run.py'))
+        self.assertTrue(matcher.watched_directory('github_watcher/commands/deeply/nested.py'))
+        self.assertTrue(matcher.watched_directory('/absolute.py'))
+        self.assertFalse(matcher.watched_directory('github_watcher/commands'))
+        self.assertFalse(matcher.watched_directory('github_watcher/settings.py'))
+        self.assertFalse(matcher.watched_directory('docsx/index.rst'))
+        self.assertFalse(matcher.watched_directory('README.md'))
+
+    def test_watch_matcher_recompiles_when_paths_are_appended(self):
+        conf = config.Configuration(users=[config.User(
+            name='akellehe', token='', base_url='foobar',
+            repos=[config.Repo(name='github_watcher', paths=[config.Path(path='docs/', ranges=[])])])])
+        repo = conf.users[0].repos[0]
+        self.assertFalse(repo.matcher.watched_directory('tests/test_config.py'))
+
+        conf.append_repo(config.Repo(name='github_watcher', paths=[config.Path(path='tests/', ranges=[])]),
+                         conf.users[0].repos)
+        self.assertTrue(repo.matcher.watched_directory('tests/test_config.py'))
+
+
+    def test_range_index(self):
+        index = config.RangeIndex([config.Range(40, 50), config.Range(0, 5), config.Range(3, 10),
+                                   config.Range(100, 90)])
+        self.assertEqual(index.starts, [0, 40])
+        self.assertEqual(index.ends, [10, 50])
+        self.assertTrue(index.overlaps(10, 12))
+        self.assertTrue(index.overlaps(-5, 0))
+        self.assertTrue(index.overlaps(45, 45))
+        self.assertTrue(index.overlaps(20, 60))
+        self.assertFalse(index.overlaps(11, 39))
+        self.assertFalse(index.overlaps(51, 95))
+        self.assertFalse(index.overlaps(-10, -1))
+
+        unbounded = config.RangeIndex([config.Range()])
+        self.assertTrue(unbounded.overlaps(1000, 2000))
+        self.assertFalse(config.RangeIndex([]).overlaps(0, 10))
+
+    def test_range_index_recompiles_when_ranges_are_appended(self):
+        path = config.Path(path='github_watcher/settings.py', ranges=[config.Range(0, 1)])
+        self.assertFalse(path.index.overlaps(4, 5))
+        conf = config.Configuration(users=[])
+        conf.append_paths([config.Path(path='github_watcher/settings.py', ranges=[config.Range(4, 5)])], [path])
+        self.assertTrue(path.index.overlaps(4, 5))
+
+
+    def test_regex_matcher(self):
+        matcher = config.RegexMatcher(['foo', r'(ba)\1r', '(?i)biz', 'b[aeiou]z'])
+        self.assertEqual(len(matcher.standalone), 2)
+        self.assertEqual(matcher.search('nothing here\nstill nothing'), None)
+        self.assertEqual(matcher.search('nothing here\nthen a baz'), 'b[aeiou]z')
+        self.assertEqual(matcher.search('a babar'), r'(ba)\1r')
+        self.assertEqual(matcher.search('a BIZ'), '(?i)biz')
+        self.assertIsNone(config.RegexMatcher([]).search('foo'))
+        with self.assertRaisesRegex(ValueError, 'regex_lines must be one of'):
+            config.RegexMatcher(['foo'], 'context')
+
+    def test_regex_matcher_alternation_has_no_groups(self):
+        regexes = [r'\bTODO_{}\b'.format(i) for i in range(1000)]
+        matcher = config.RegexMatcher(regexes)
+        # Named or capturing groups in a big alternation make CPython's `re` quadratic in the number of regexes.
+        self.assertEqual(matcher.combined.groups, 0)
+        self.assertEqual(matcher.search('context\n# TODO_999 and TODO_500'), r'\bTODO_500\b')
+        self.assertIsNone(matcher.search('TODO_1000'))
+
+    def test_regex_lines_round_trip(self):
+        conf = {'akellehe': {
+            'repos': {
+                'github_watcher': {
+                    'paths': {},
+                    'regexes': ['foo'],
+                    'regex_lines': 'added',
+                    'users': []
+                },
+            },
+            'base_url': 'https://api.gitub.com',
+            'token': '*****',
+        }}
+        target = config.Configuration.from_json(conf)
+        self.assertEqual(target.users[0].repos[0].regex_matcher.markers, '+')
+        self.assertEqual(target.to_json(), conf)
+
+
+    def test_repo_fingerprint(self):
+        repo = config.Repo(name='github_watcher', paths=[config.Path(path='docs/', ranges=[])], regexes=['foo'])
+        same = config.Repo(name='github_watcher', paths=[config.Path(path='docs/', ranges=[])], regexes=['foo'])
+        fingerprint = repo.fingerprint
+        self.assertEqual(fingerprint, same.fingerprint)
+        repo.users.append('akellehe')
+        self.assertEqual(repo.fingerprint, fingerprint)
+        repo.recompile()
+        self.assertNotEqual(repo.fingerprint, fingerprint)
+
+
+    def test_options(self):
+        conf = {
+            'akellehe': {
+                'repos': {},
+                'base_url': 'https://api.gitub.com',
+                'token': '*****',
+            },
+            'http_timeout': 5,
+        }
+        target = config.Configuration.from_json(conf)
+        self.assertEqual([u.name for u in target.users], ['akellehe'])
+        self.assertEqual(target.options, {'http_timeout': 5})
+        self.assertEqual(target.to_json(), conf)
+        with mock.patch('github_watcher.settings.HTTP_TIMEOUT', 30):
+            target.apply_options()
+            self.assertEqual(settings.HTTP_TIMEOUT, 5)
+
 
 if __name__ == '__main__':
     unittest.main()
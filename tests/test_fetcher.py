@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+import collections
+import unittest
+import unittest.mock as mock
+
+from github_watcher import fetcher
+
+
+class TestFetcher(unittest.TestCase):
+
+    def test_bounds_concurrency_per_base_url(self):
+        lock = threading.Lock()
+        in_flight = collections.Counter()
+        most_in_flight = collections.Counter()
+
+        def diff_files(base_url, access_token, pull_request):
+            with lock:
+                in_flight[base_url] += 1
+                most_in_flight[base_url] = max(most_in_flight[base_url], in_flight[base_url])
+            time.sleep(0.01)
+            with lock:
+                in_flight[base_url] -= 1
+            return iter(['file of {}'.format(pull_request)])
+
+        async def fetch_all(async_fetcher):
+            return await asyncio.gather(*[async_fetcher.diff_files(base_url, '*****', n)
+                                          for base_url in ('https://one', 'https://two') for n in range(10)])
+
+        loop = asyncio.new_event_loop()
+        with mock.patch('github_watcher.services.git.diff_files', side_effect=diff_files):
+            with fetcher.AsyncFetcher(concurrency=3) as async_fetcher:
+                diffs = loop.run_until_complete(fetch_all(async_fetcher))
+        loop.close()
+        self.assertEqual(diffs[:2], [['file of 0'], ['file of 1']])
+        self.assertEqual(len(diffs), 20)
+        self.assertEqual(most_in_flight['https://one'], 3)
+        self.assertEqual(most_in_flight['https://two'], 3)
+
+    def test_open_pull_requests(self):
+        loop = asyncio.new_event_loop()
+        with mock.patch('github_watcher.services.git.open_pull_requests', return_value=iter([1, 2])) as open_prs:
+            with fetcher.AsyncFetcher() as async_fetcher:
+                prs = loop.run_until_complete(async_fetcher.open_pull_requests('my base url', '*****', 'akellehe', 'repo'))
+        loop.close()
+        self.assertEqual(prs, [1, 2])
+        open_prs.assert_called_once_with('my base url', '*****', 'akellehe', 'repo', since=None)
+
+    def test_gather_cancels_the_other_coroutines_on_failure(self):
+        cancelled = []
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('Server Error')
+
+        async def wait(n):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(n)
+                raise
+
+        loop = asyncio.new_event_loop()
+        with self.assertRaisesRegex(RuntimeError, 'Server Error'):
+            loop.run_until_complete(fetcher.gather([wait(0), fail(), wait(1)]))
+        self.assertEqual(sorted(cancelled), [0, 1])
+        loop.close()
+
+    def test_find_changes_cancels_pending_diffs_when_one_fails(self):
+        started = []
+
+        def diff_files(base_url, access_token, pull_request):
+            started.append(pull_request)
+            if pull_request == 0:
+                raise RuntimeError('Server Error')
+            time.sleep(0.05)
+            return []
+
+        conf, targets, activity = mock.MagicMock(), [(mock.MagicMock(), mock.MagicMock())], mock.MagicMock()
+        with mock.patch('github_watcher.services.git.open_pull_requests', return_value=iter(range(20))), \
+                mock.patch('github_watcher.services.git.diff_files', side_effect=diff_files), \
+                mock.patch('github_watcher.services.store.get_store'), \
+                mock.patch('github_watcher.commands.run.pull_request_state', return_value=('state',)), \
+                mock.patch('github_watcher.settings.FETCH_CONCURRENCY', 1):
+            with self.assertRaisesRegex(RuntimeError, 'Server Error'):
+                fetcher.find_changes(conf, targets, activity)
+        # Only the diff already running when the first one failed was let finish; the rest were cancelled.
+        self.assertLess(len(started), 20)
@@ -1,29 +1,205 @@
+import os
+import json
+import datetime
+import contextlib
+import tempfile
 import unittest
 import unittest.mock as mock
 
+import github
+import requests
 
 from github_watcher.services import git
 
 
 class TestGit(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for setting, directory in (('WATCHER_HTTP_CACHE', 'http'), ('WATCHER_DIFF_CACHE', 'diffs')):
+            patch = mock.patch('github_watcher.settings.' + setting, os.path.join(self.tmpdir.name, directory))
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def response(self, status_code=200, body=None, headers=None):
+        resp = mock.MagicMock()
+        resp.status_code = status_code
+        resp.headers = headers or {}
+        resp.text = json.dumps(body)
+        resp.json.return_value = body
+        return resp
+
+    @contextlib.contextmanager
+    def session(self, response):
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            get_session.return_value.get.return_value = response
+            yield get_session.return_value.get
+
     def test_open_pull_requests(self):
-        base_url = 'my base url'
+        base_url = 'https://api.github.com'
         access_token = '*******'
         user = 'akellehe'
         repo = 'github-watcher'
-        prs = [1, 2, 3, 4, 5]
-        github = mock.MagicMock()
-        with mock.patch('github_watcher.services.git.Github', return_value=github):
-            Repo = mock.MagicMock()
-            Repo.get_pulls.return_value = prs
-            get_repo = mock.MagicMock()
-            get_repo.return_value = Repo
+        pages = [
+            self.response(body=[{'number': 1}, {'number': 2}], headers={
+                'Link': '<https://api.github.com/repositories/1/pulls?state=open&page=2>; rel="next"'}),
+            self.response(body=[{'number': 3}]),
+        ]
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            session_get = get_session.return_value.get
+            session_get.side_effect = pages
+            target = [pr for pr in git.open_pull_requests(base_url, access_token, user, repo)]
+        self.assertEqual([pr.number for pr in target], [1, 2, 3])
+        self.assertTrue(all(isinstance(pr, github.PullRequest.PullRequest) for pr in target))
+        get_session.assert_any_call('https://api.github.com/repos/akellehe/github-watcher/pulls', '*******')
+        session_get.assert_any_call('https://api.github.com/repos/akellehe/github-watcher/pulls',
+                                     headers={}, params={'state': 'open', 'sort': 'updated', 'direction': 'desc',
+                                                          'per_page': 100}, timeout=30)
+        session_get.assert_any_call('https://api.github.com/repositories/1/pulls?state=open&page=2',
+                                     headers={}, params=None, timeout=30)
 
-            github.get_repo = get_repo
+    def test_open_pull_requests_since(self):
+        pages = [
+            self.response(body=[{'number': 3, 'updated_at': '2019-01-03T00:00:00Z'},
+                                {'number': 2, 'updated_at': '2019-01-02T00:00:00Z'}],
+                          headers={'Link': '<https://api.github.com/repositories/1/pulls?page=2>; rel="next"'}),
+            self.response(body=[{'number': 1, 'updated_at': '2019-01-01T00:00:00Z'}]),
+        ]
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            session_get = get_session.return_value.get
+            session_get.side_effect = pages
+            target = list(git.open_pull_requests('https://api.github.com', '*****', 'akellehe', 'github-watcher',
+                                                 since='2019-01-02T00:00:00Z'))
+            self.assertEqual([pr.number for pr in target], [3, 2])
+            self.assertEqual(session_get.call_count, 2)
 
-            target = [pr for pr in git.open_pull_requests(base_url, access_token, user, repo)]
-            self.assertEqual(prs, target)
+            session_get.reset_mock()
+            session_get.side_effect = pages
+            target = list(git.open_pull_requests('https://api.github.com', '*****', 'akellehe', 'github-watcher',
+                                                 since='2019-01-02T12:00:00Z'))
+            self.assertEqual([pr.number for pr in target], [3])
+            self.assertEqual(session_get.call_count, 1)
+
+    def test_get_replays_cached_body_when_not_modified(self):
+        url = 'https://api.github.com/repos/akellehe/github-watcher/pulls'
+        first = self.response(body=[{'number': 1}], headers={'ETag': '"abc"', 'Link': '<next>; rel="next"'})
+        with self.session(first) as session_get:
+            body, headers = git.get(url, '*****')
+        self.assertEqual(body, [{'number': 1}])
+        session_get.assert_called_once_with(url, headers={}, params=None, timeout=30)
+
+        with self.session(self.response(status_code=304)) as session_get:
+            body, headers = git.get(url, '*****')
+        self.assertEqual(body, [{'number': 1}])
+        self.assertEqual(headers, {'Link': '<next>; rel="next"'})
+        session_get.assert_called_once_with(
+            url, headers={'If-None-Match': '"abc"'}, params=None, timeout=30)
+
+        with self.session(self.response(status_code=304)) as session_get:
+            with self.assertRaises(requests.HTTPError):
+                git.get(url, 'another token')
+        session_get.assert_called_once_with(url, headers={}, params=None, timeout=30)
+
+    def test_get_revalidates_with_last_modified(self):
+        url = 'https://api.github.com/repos/akellehe/github-watcher/pulls'
+        first = self.response(body=[], headers={'Last-Modified': 'Thu, 05 Jul 2012 15:31:30 GMT'})
+        with self.session(first):
+            git.get(url, '*****')
+        second = self.response(body=[{'number': 2}], headers={'ETag': '"def"'})
+        with self.session(second) as session_get:
+            body, _ = git.get(url, '*****')
+        self.assertEqual(body, [{'number': 2}])
+        session_get.assert_called_once_with(
+            url, headers={'If-Modified-Since': 'Thu, 05 Jul 2012 15:31:30 GMT'}, params=None, timeout=30)
+
+    def test_get_retries_rate_limited_requests(self):
+        url = 'https://api.github.com/repos/akellehe/github-watcher/pulls'
+        limited = self.response(status_code=429, body={'message': 'slow down'}, headers={'Retry-After': '0'})
+        ok = self.response(body=[{'number': 1}])
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            get_session.return_value.get.side_effect = [limited, ok]
+            body, _ = git.get(url, 'rate limited token')
+        self.assertEqual(body, [{'number': 1}])
+        self.assertEqual(get_session.return_value.get.call_count, 2)
+
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            get_session.return_value.get.return_value = limited
+            with self.assertRaises(requests.HTTPError):
+                git.get(url, 'rate limited token')
+        self.assertEqual(get_session.return_value.get.call_count, 4)
+
+    def test_get_raises_on_errors(self):
+        url = 'https://api.github.com/repos/akellehe/github-watcher/pulls'
+        for status_code in (401, 404, 500, 502):
+            with self.session(self.response(status_code=status_code, body={'message': 'error'})):
+                with self.assertRaisesRegex(requests.HTTPError, str(status_code)) as raised:
+                    git.get(url, '*****')
+            self.assertEqual(raised.exception.response.status_code, status_code)
+        with self.session(self.response(status_code=304)) as session_get:
+            with self.assertRaises(requests.HTTPError):
+                git.get(url, '*****')
+        # Nothing was cached, so the next request isn't conditional.
+        session_get.assert_called_once_with(url, headers={}, params=None, timeout=30)
+
+    def test_open_pull_requests_raises_on_errors(self):
+        for status_code in (401, 503):
+            with self.session(self.response(status_code=status_code, body={'message': 'error'})):
+                with self.assertRaises(requests.HTTPError):
+                    list(git.open_pull_requests('https://api.github.com', '*****', 'akellehe', 'github-watcher'))
+
+    def test_get_without_caching_the_response(self):
+        url = 'https://api.github.com/repos/akellehe/github-watcher/compare/a...b'
+        with self.session(self.response(body={'files': []}, headers={'ETag': '"abc"'})):
+            git.get(url, '*****', cache_response=False)
+        with self.session(self.response(body={'files': []})) as session_get:
+            git.get(url, '*****')
+        session_get.assert_called_once_with(url, headers={}, params=None, timeout=30)
+
+    def test_get_branches(self):
+        user, repo = mock.MagicMock(), mock.MagicMock()
+        user.base_url, user.token, user.name, repo.name = 'https://api.github.com', '*****', 'akellehe', 'github-watcher'
+        commit_url = 'https://api.github.com/repos/akellehe/github-watcher/commits/abc'
+        responses = [
+            self.response(body=[{'name': 'master', 'commit': {'sha': 'abc', 'url': commit_url}}]),
+            self.response(body={'sha': 'abc', 'url': commit_url,
+                                'commit': {'committer': {'name': 'someone', 'date': '2019-01-02T03:04:05Z'}}}),
+        ]
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            get_session.return_value.get.side_effect = responses
+            with mock.patch('github.Requester.Requester.requestJsonAndCheck',
+                            side_effect=AssertionError('PyGithub made a request')):
+                branches = list(git.get_branches(user, repo))
+                last_updated = git.get_last_updated(branches[0])
+        self.assertEqual(last_updated.replace(tzinfo=None), datetime.datetime(2019, 1, 2, 3, 4, 5))
+        self.assertEqual(branches[0].name, 'master')
+        get_session.return_value.get.assert_called_with(commit_url, headers={}, params=None, timeout=30)
+
+    def test_get_session(self):
+        session = git.get_session('https://api.github.com/repos/akellehe/github-watcher/pulls', '*****')
+        self.assertIs(session, git.get_session('https://api.github.com/repos/akellehe/github-watcher/compare', '*****'))
+        self.assertIsNot(session, git.get_session('https://api.github.com/repos/akellehe/github-watcher', 'other'))
+        self.assertIsNot(session, git.get_session('https://github.example.com/api/v3/repos', '*****'))
+        self.assertEqual(session.headers['Authorization'], 'token *****')
+        self.assertEqual(session.get_adapter('https://api.github.com')._pool_maxsize, 10)
+        git.close_sessions()
+        self.assertIsNot(session, git.get_session('https://api.github.com/repos/akellehe/github-watcher', '*****'))
+
+    def test_get_session_pools_enough_connections_for_the_workers(self):
+        git.close_sessions()
+        self.addCleanup(git.close_sessions)
+        with mock.patch('github_watcher.settings.FETCH_CONCURRENCY', 32):
+            session = git.get_session('https://api.github.com', '*****')
+        self.assertEqual(session.get_adapter('https://api.github.com')._pool_maxsize, 32)
+        git.close_sessions()
+        with mock.patch('github_watcher.settings.PIPELINE_WORKERS', {'list': 4, 'fetch': 16}):
+            session = git.get_session('https://api.github.com', '*****')
+        self.assertEqual(session.get_adapter('https://api.github.com')._pool_maxsize, 20)
+
+    def test_get_client(self):
+        client = git.get_client('https://api.github.com', '*****')
+        self.assertIs(client, git.get_client('https://api.github.com', '*****'))
+        self.assertIsNot(client, git.get_client('https://github.example.com/api/v3', '*****'))
 
     def test_construct_compare_url(self):
         base_url = 'all of your base'
@@ -72,84 +248,178 @@ class TestGit(unittest.TestCase):
         head.sha = '56789'
 
         with self.assertRaisesRegex(git.Noop, "Pull request effects no files"):
-            with mock.patch('requests.get') as requests_get:
-                resp = mock.MagicMock()
-                requests_get.return_value = resp
-                resp.json = mock.MagicMock()
-                resp.json.return_value = {
-                    'files': None
-                }
-                git.diff(base_url, '*****', pull_request)
-
-    def test_empty_diff(self):
-        base_url = 'all of your base'
-        base = mock.MagicMock()
-        head = mock.MagicMock()
-        user = mock.MagicMock()
+            with self.session(self.response(body={'files': []})):
+                list(git.diff_files(base_url, '*****', pull_request))
 
+    def files_pull_request(self):
         pull_request = mock.MagicMock()
-        pull_request.base = base
-        pull_request.head = head
-        pull_request.head.user = user
+        pull_request.base.user.login = 'akellehe'
+        pull_request.base.repo.name = 'github-watcher'
+        pull_request.number = 7
+        return pull_request
 
-        base.user.login = 'akellehe'
-        head.user.login = 'akelleh'
-        base.repo.name = 'github-watcher'
-        base.sha = '12345'
-        head.sha = '56789'
+    def test_pull_request_files(self):
+        pages = [
+            self.response(body=[{'filename': 'a.py', 'patch': '@@ -1 +1 @@'}, {'filename': 'b.png'}], headers={
+                'Link': '<https://api.github.com/repositories/1/pulls/7/files?page=2>; rel="next"'}),
+            self.response(body=[{'filename': 'c.py', 'patch': '@@ -2 +2 @@'}]),
+        ]
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            session_get = get_session.return_value.get
+            session_get.side_effect = pages
+            files = git.pull_request_files('https://api.github.com', '*****', self.files_pull_request())
+            self.assertEqual(next(files)['filename'], 'a.py')
+            self.assertEqual(session_get.call_count, 1)
+            self.assertEqual([f['filename'] for f in files], ['b.png', 'c.py'])
+            self.assertEqual(session_get.call_count, 2)
+        session_get.assert_any_call('https://api.github.com/repos/akellehe/github-watcher/pulls/7/files',
+                                    headers={}, params={'per_page': 100}, timeout=30)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'http')))
 
-        head_files = [{
-            'filename': 'my head file',
-            'patch': None
-        }]
+    def test_pull_request_files_without_files(self):
+        with self.session(self.response(body=[])):
+            with self.assertRaises(git.Noop):
+                list(git.pull_request_files('https://api.github.com', '*****', self.files_pull_request()))
 
-        expected = ''
+    @mock.patch('github_watcher.settings.DIFF_ENDPOINT', 'files')
+    def test_diff_files_from_files_endpoint(self):
+        body = [{'filename': 'a.py', 'patch': '@@ -1 +1 @@'}, {'filename': 'b.png'}]
+        with self.session(self.response(body=body)) as session_get:
+            target = list(git.diff_files('https://api.github.com', '*****', self.files_pull_request()))
+        self.assertEqual(target, body)
+        self.assertIn('/pulls/7/files', session_get.call_args[0][0])
 
-        with mock.patch('requests.get') as requests_get:
-            resp = mock.MagicMock()
-            requests_get.return_value = resp
-            resp.json = mock.MagicMock()
-            resp.json.return_value = {
-                'files': head_files
-            }
-            complete_diff = git.diff(base_url, '*****', pull_request)
-            self.assertEqual(complete_diff, expected)
+    def test_diff_files_reads_compare_results_from_the_diff_cache(self):
+        pull_request = self.files_pull_request()
+        pull_request.head.user.login = 'akelleh'
+        pull_request.base.sha = '12345'
+        pull_request.head.sha = '56789'
+        body = {'files': [{'filename': 'a.py', 'patch': '@@ -1 +1 @@'}]}
+        with self.session(self.response(body=body)) as session_get:
+            first = list(git.diff_files('https://api.github.com', '*****', pull_request))
+            second = list(git.diff_files('https://api.github.com', '*****', pull_request))
+        self.assertEqual(first, body['files'])
+        self.assertEqual(second, body['files'])
+        self.assertEqual(session_get.call_count, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'http')))
 
-    def test_diff(self):
-        base_url = 'all of your base'
-        base = mock.MagicMock()
-        head = mock.MagicMock()
-        user = mock.MagicMock()
+        pull_request.head.sha = 'abcde'
+        with self.session(self.response(body=body)) as session_get:
+            list(git.diff_files('https://api.github.com', '*****', pull_request))
+        self.assertEqual(session_get.call_count, 1)
 
-        pull_request = mock.MagicMock()
-        pull_request.base = base
-        pull_request.head = head
-        pull_request.head.user = user
+    def test_diff_files_raises_on_compare_errors(self):
+        pull_request = self.files_pull_request()
+        for status_code in (401, 500):
+            with self.session(self.response(status_code=status_code, body={'message': 'error'})):
+                with self.assertRaises(requests.HTTPError):
+                    list(git.diff_files('https://api.github.com', '*****', pull_request))
+        # Errors aren't cached as an empty diff.
+        body = {'files': [{'filename': 'a.py', 'patch': '@@ -1 +1 @@'}]}
+        with self.session(self.response(body=body)):
+            self.assertEqual(list(git.diff_files('https://api.github.com', '*****', pull_request)), body['files'])
 
-        base.user.login = 'akellehe'
-        head.user.login = 'akelleh'
-        base.repo.name = 'github-watcher'
-        base.sha = '12345'
-        head.sha = '56789'
+    def test_patched_files(self):
+        head_files = [
+            {'filename': 'new.py', 'previous_filename': 'old.py', 'patch': '@@ -1,2 +1,2 @@\n context\n-old\n+new'},
+            {'filename': 'logo.png'},
+            {'filename': 'b.py', 'patch': '@@ -10,1 +10,2 @@\n-a\n+b\n+c\n\\ No newline at end of file'},
+        ]
+        for parser in ('hunks', 'unidiff'):
+            with mock.patch('github_watcher.settings.DIFF_PARSER', parser):
+                target = list(git.patched_files(iter(head_files)))
+            self.assertEqual([(f.source_file, f.target_file) for f, patch in target],
+                             [('a/old.py', 'b/new.py'), ('a/b.py', 'b/b.py')])
+            self.assertEqual([[(h.source_start, h.source_length, h.target_start, h.target_length) for h in f]
+                              for f, patch in target], [[(1, 2, 1, 2)], [(10, 1, 10, 2)]])
+            self.assertIs(target[1][1], head_files[2]['patch'])
+
+    def graphql_node(self, number, updated_at, paths=('foo/bar/pants.py',), more_files=False):
+        return {
+            'number': number,
+            'url': 'https://github.com/akellehe/github-watcher/pull/{}'.format(number),
+            'updatedAt': updated_at,
+            'author': {'login': 'someone'},
+            'baseRefOid': 'base{}'.format(number),
+            'headRefOid': 'head{}'.format(number),
+            'baseRepository': {'name': 'github-watcher', 'owner': {'login': 'akellehe'}},
+            'headRepositoryOwner': {'login': 'someone'},
+            'files': {'pageInfo': {'hasNextPage': more_files},
+                      'nodes': [{'path': path, 'changeType': 'MODIFIED'} for path in paths]},
+        }
+
+    def graphql_page(self, nodes, end_cursor=None):
+        return {'pullRequests': {'pageInfo': {'hasNextPage': end_cursor is not None, 'endCursor': end_cursor},
+                                 'nodes': nodes}}
+
+    def test_graphql_url(self):
+        self.assertEqual(git.graphql_url('https://api.github.com'), 'https://api.github.com/graphql')
+        self.assertEqual(git.graphql_url('https://github.example.com/api/v3'), 'https://github.example.com/api/graphql')
+
+    def test_graphql(self):
+        body = {'data': {'rateLimit': {'cost': 1, 'remaining': 4999, 'resetAt': '2019-01-01T00:00:00Z'}, 'r0': None},
+                'errors': [{'message': "Could not resolve to a Repository with the name 'nope'."}]}
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            session_post = get_session.return_value.post
+            session_post.return_value = self.response(body=body)
+            with mock.patch('github_watcher.services.git.logging') as logging:
+                data = git.graphql('https://api.github.com', '*****', 'query { r0: ... }', {'owner0': 'akellehe'})
+        self.assertEqual(data, body['data'])
+        session_post.assert_called_once_with('https://api.github.com/graphql', timeout=30, json={
+            'query': 'query { r0: ... }', 'variables': {'owner0': 'akellehe'}})
+        logging.info.assert_called_once_with("GraphQL query cost %s points, %s left until %s",
+                                             1, 4999, '2019-01-01T00:00:00Z')
+        logging.warning.assert_called_once_with("GraphQL error: %s",
+                                                "Could not resolve to a Repository with the name 'nope'.")
+
+    def test_graphql_without_data(self):
+        with mock.patch('github_watcher.services.git.get_session') as get_session:
+            get_session.return_value.post.return_value = self.response(
+                body={'data': None, 'errors': [{'message': 'Something went wrong'}]})
+            with self.assertRaisesRegex(git.GraphQLError, 'Something went wrong'):
+                git.graphql('https://api.github.com', '*****', 'query')
+
+    def test_open_pull_requests_graphql(self):
+        pages = [
+            {'r0': self.graphql_page([self.graphql_node(3, '2019-01-03T00:00:00Z'),
+                                      self.graphql_node(2, '2019-01-02T00:00:00Z', more_files=True)], 'cursor'),
+             'r1': self.graphql_page([self.graphql_node(9, '2019-01-01T00:00:00Z', paths=())]),
+             'r2': None},
+            {'r0': self.graphql_page([self.graphql_node(1, '2019-01-01T00:00:00Z')], 'another cursor')},
+        ]
+        repos = [('akellehe', 'github-watcher', '2019-01-01T12:00:00Z'), ('akellehe', 'other', None),
+                 ('akellehe', 'missing', None)]
+        with mock.patch('github_watcher.services.git.graphql', side_effect=pages) as graphql:
+            results = list(git.open_pull_requests_graphql('https://api.github.com', '*****', repos))
+
+        self.assertEqual([(owner, name, pr.number, files) for owner, name, pr, files in results], [
+            ('akellehe', 'github-watcher', 3, [{'path': 'foo/bar/pants.py', 'changeType': 'MODIFIED'}]),
+            ('akellehe', 'github-watcher', 2, None),
+            ('akellehe', 'other', 9, []),
+        ])
+        pr = results[0][2]
+        self.assertIsInstance(pr, github.PullRequest.PullRequest)
+        self.assertEqual(pr.html_url, 'https://github.com/akellehe/github-watcher/pull/3')
+        self.assertEqual(pr.user.login, 'someone')
+        self.assertEqual(git.construct_compare_url('https://api.github.com', pr),
+                         'https://api.github.com/repos/akellehe/github-watcher/compare/akellehe:base3...someone:head3')
+
+        self.assertEqual(graphql.call_count, 2)
+        first_query, first_variables = graphql.call_args_list[0][0][2:]
+        self.assertIn('r2: repository(owner: $owner2, name: $name2)', first_query)
+        self.assertIn('rateLimit', first_query)
+        self.assertIn('nodes { path changeType }', first_query)
+        self.assertEqual(first_variables['name1'], 'other')
+        self.assertIsNone(first_variables['after0'])
+        second_query, second_variables = graphql.call_args_list[1][0][2:]
+        self.assertNotIn('r1:', second_query)
+        self.assertEqual(second_variables, {'owner0': 'akellehe', 'name0': 'github-watcher', 'after0': 'cursor'})
 
-        head_files = [{
-            'filename': 'my head file',
-            'patch': 'foo bar biz baz'
-        }]
-
-        expected = """diff --git a/my head file b/my head file
-index foo..bar 100644
---- a/my head file
-+++ b/my head file
-foo bar biz baz
-"""
-
-        with mock.patch('requests.get') as requests_get:
-            resp = mock.MagicMock()
-            requests_get.return_value = resp
-            resp.json = mock.MagicMock()
-            resp.json.return_value = {
-                'files': head_files
-            }
-            complete_diff = git.diff(base_url, '*****', pull_request)
-            self.assertEqual(complete_diff, expected)
+    @mock.patch('github_watcher.settings.GRAPHQL_BATCH_SIZE', 1)
+    def test_open_pull_requests_graphql_batches(self):
+        pages = [{'r0': self.graphql_page([self.graphql_node(n, '2019-01-01T00:00:00Z')])} for n in range(3)]
+        repos = [('akellehe', 'repo{}'.format(n), None) for n in range(3)]
+        with mock.patch('github_watcher.services.git.graphql', side_effect=pages) as graphql:
+            results = list(git.open_pull_requests_graphql('https://api.github.com', '*****', repos))
+        self.assertEqual([name for owner, name, pr, files in results], ['repo0', 'repo1', 'repo2'])
+        self.assertEqual(graphql.call_count, 3)
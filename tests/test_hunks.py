@@ -0,0 +1,66 @@
+import unittest
+
+import unidiff
+
+from github_watcher import hunks
+
+
+PATCH = (
+    "@@ -1,3 +1,4 @@\n"
+    " import os\n"
+    "-import sys\n"
+    "+import re\n"
+    "+import json\n"
+    " \n"
+    "@@ -10 +11 @@ def main():\n"
+    "-    return sys.argv\n"
+    "+    return re.compile('@@ -1 +1 @@')\n"
+    "@@ -0,0 +20,2 @@\n"
+    "+\n"
+    "+# The end\n"
+    "\\ No newline at end of file"
+)
+
+
+class TestHunks(unittest.TestCase):
+
+    def test_parse_hunks(self):
+        self.assertEqual(hunks.parse_hunks(PATCH), [
+            hunks.Hunk(1, 3, 1, 4),
+            hunks.Hunk(10, 1, 11, 1),
+            hunks.Hunk(0, 0, 20, 2),
+        ])
+        self.assertEqual(hunks.parse_hunks(''), [])
+
+    def test_parse_hunks_agrees_with_unidiff(self):
+        patchset = unidiff.PatchSet(['--- a/main.py\n', '+++ b/main.py\n'] + PATCH.splitlines(True))
+        expected = [(h.source_start, h.source_length, h.target_start, h.target_length) for h in patchset[0]]
+        self.assertEqual([h.ranges() for h in hunks.parse_hunks(PATCH)], expected)
+
+    def test_changed_lines(self):
+        self.assertEqual(list(hunks.changed_lines(PATCH, '+')),
+                         ['import re', 'import json', "    return re.compile('@@ -1 +1 @@')", '', '# The end'])
+        self.assertEqual(list(hunks.changed_lines(PATCH, '-')), ['import sys', '    return sys.argv'])
+        self.assertEqual(len(list(hunks.changed_lines(PATCH))), 7)
+
+    def test_changed_lines_skips_file_headers(self):
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1 +1 @@\n"
+            "-old\n"
+            "+new\n"
+            "diff --git a/b.py b/b.py\n"
+            "--- a/b.py\n"
+            "+++ b/b.py\n"
+            "@@ -1 +1 @@\n"
+            "+newer\n"
+        )
+        self.assertEqual(list(hunks.changed_lines(diff)), ['old', 'new', 'newer'])
+
+    def test_patched_file(self):
+        patched_file = hunks.PatchedFile('a/main.py', 'b/main.py', hunks.parse_hunks(PATCH))
+        self.assertEqual(patched_file.source_file, 'a/main.py')
+        self.assertEqual(patched_file.target_file, 'b/main.py')
+        self.assertEqual(len(patched_file), 3)
@@ -0,0 +1,98 @@
+import threading
+import unittest
+import unittest.mock as mock
+
+from github_watcher import notifier
+
+
+class RecordingSink:
+
+    def __init__(self):
+        self.batches = []
+        self.flushed = 0
+
+    def emit(self, alerts):
+        self.batches.append([(alert.msg, alert.pr_link, alert.silent) for alert in alerts])
+
+    def next_flush(self):
+        return None
+
+    def flush(self):
+        self.flushed += 1
+
+
+class TestNotifier(unittest.TestCase):
+
+    def test_worker_delivers_in_the_background(self):
+        release = threading.Event()
+        sink = RecordingSink()
+        emit = sink.emit
+
+        def slow_emit(alerts):
+            release.wait()
+            emit(alerts)
+
+        sink.emit = slow_emit
+        worker = notifier.NotificationWorker([sink], window=0)
+        worker.start()
+        self.addCleanup(worker.stop)
+        worker.put('first', 'link 1')
+        worker.put('second', 'link 2', silent=True)
+        self.assertEqual(sink.batches, [])
+        release.set()
+        worker.flush()
+        self.assertEqual(sink.batches, [[('first', 'link 1', False)], [('second', 'link 2', True)]])
+
+    def test_stop_delivers_pending_alerts(self):
+        broken, sink = mock.MagicMock(), RecordingSink()
+        broken.emit.side_effect = Exception('no display')
+        broken.next_flush.return_value = None
+        worker = notifier.NotificationWorker([broken, sink], window=0)
+        worker.put('first', 'link 1')
+        worker.put('second', 'link 2')
+        worker.start()
+        worker.stop()
+        self.assertEqual(broken.emit.call_count, 2)
+        self.assertEqual(len(sink.batches), 2)
+        self.assertIsNone(worker.thread)
+
+    def test_full_queue_drops_alerts(self):
+        sink = RecordingSink()
+        worker = notifier.NotificationWorker([sink], queue_size=1, window=0)
+        worker.put('first', 'link 1')
+        worker.put('second', 'link 2')
+        worker.start()
+        worker.stop()
+        self.assertEqual(sink.batches, [[('first', 'link 1', False)]])
+
+    def test_worker_coalesces_alerts(self):
+        sink = RecordingSink()
+        worker = notifier.NotificationWorker([sink], window=60)
+        worker.put('first', 'https://github.com/akellehe/github-watcher/pull/1', rule='lines')
+        worker.put('second', 'https://github.com/akellehe/github-watcher/pull/2', silent=True, rule='regex')
+        worker.put('third', 'https://github.com/akellehe/other/pull/3', rule='lines')
+        worker.start()
+        worker.stop()
+        self.assertEqual(len(sink.batches), 1)
+        self.assertEqual(len(sink.batches[0]), 3)
+        self.assertEqual(worker.repo_counts, {'akellehe/github-watcher': 2, 'akellehe/other': 1})
+        self.assertEqual(worker.rule_counts, {'lines': 2, 'regex': 1})
+
+    def test_worker_flushes_sinks_when_due(self):
+        sink = mock.MagicMock()
+        sink.next_flush.side_effect = lambda: 0
+        worker = notifier.NotificationWorker([sink], window=0)
+        self.assertEqual(worker.flush_timeout(), 0)
+        worker.flush_sinks()
+        sink.flush.assert_called_once_with()
+        sink.next_flush.side_effect = lambda: None
+        self.assertIsNone(worker.flush_timeout())
+
+    def test_get_worker(self):
+        with mock.patch('github_watcher.settings.ALERT_SINKS', [{'type': 'stdout'}]):
+            worker = notifier.get_worker()
+            self.assertIs(worker, notifier.get_worker())
+            notifier.shutdown()
+            self.assertIsNone(worker.thread)
+            self.assertIsNot(worker, notifier.get_worker())
+            notifier.shutdown()
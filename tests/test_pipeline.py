@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+from github_watcher import pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_run(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        stages = [
+            pipeline.Stage('split', lambda n: range(n), workers=2),
+            pipeline.Stage('square', lambda n: [n * n], workers=3),
+            pipeline.Stage('collect', collect),
+        ]
+        p = pipeline.Pipeline(stages)
+        p.run([1, 2, 3])
+        self.assertEqual(sorted(results), [0, 0, 0, 1, 1, 4])
+        stats = p.stats()
+        self.assertEqual(stats['split']['processed'], 3)
+        self.assertEqual(stats['square']['processed'], 6)
+        self.assertEqual(stats['collect']['processed'], 6)
+        self.assertEqual(stats['square']['workers'], 3)
+        self.assertEqual(p.depths(), {'split': 0, 'square': 0, 'collect': 0})
+        self.assertEqual(p.threads, [])
+
+    def test_bounded_queues_apply_backpressure(self):
+        produced = []
+
+        def produce(n):
+            for i in range(n):
+                produced.append(i)
+                yield i
+
+        def consume(i):
+            time.sleep(0.01)
+
+        stages = [
+            pipeline.Stage('produce', produce),
+            pipeline.Stage('consume', consume, queue_size=2),
+        ]
+        p = pipeline.Pipeline(stages)
+        p.run([20])
+        self.assertEqual(len(produced), 20)
+        self.assertLessEqual(p.stats()['consume']['max_depth'], 2)
+
+    def test_run_reraises_after_draining(self):
+        seen = []
+
+        def fail_on_two(n):
+            if n == 2:
+                raise ValueError('two')
+            seen.append(n)
+
+        p = pipeline.Pipeline([pipeline.Stage('fail', fail_on_two)])
+        with self.assertRaisesRegex(ValueError, 'two'):
+            p.run([1, 2, 3])
+        self.assertEqual(seen, [1, 3])
+        self.assertEqual(p.stats()['fail']['errors'], 1)
+
+    def test_run_reports_depths_while_running(self):
+        stages = [pipeline.Stage('slow', lambda n: time.sleep(0.01))]
+        p = pipeline.Pipeline(stages, report_interval=0.005)
+        with mock.patch('github_watcher.pipeline.logging') as logging:
+            p.run(range(10))
+        depths = [call[0][1] for call in logging.info.call_args_list if call[0][0] == "Pipeline queue depths: %s"]
+        self.assertTrue(depths)
+        self.assertTrue(any(depth['slow'] > 0 for depth in depths))
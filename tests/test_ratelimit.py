@@ -0,0 +1,64 @@
+import unittest
+
+from github_watcher.services import ratelimit
+
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_unpaced_without_rate_limit_headers(self):
+        clock = Clock()
+        pacer = ratelimit.Pacer(reserve=10, burst=1, clock=clock, sleep=clock.sleep)
+        for _ in range(5):
+            self.assertEqual(pacer.reserve_slot(), 0)
+
+    def test_bursts_then_spreads_requests_over_the_window(self):
+        clock = Clock()
+        pacer = ratelimit.Pacer(reserve=10, burst=2, clock=clock, sleep=clock.sleep)
+        self.assertFalse(pacer.update(200, {'X-RateLimit-Remaining': '110', 'X-RateLimit-Reset': '1100'}))
+        self.assertEqual(pacer.reserve_slot(), 0)
+        self.assertEqual(pacer.reserve_slot(), 0)
+        # 98 requests left for 100 seconds.
+        self.assertAlmostEqual(pacer.reserve_slot(), 100 / 98)
+        pacer.acquire()
+        self.assertGreater(clock.now, 1000)
+
+    def test_waits_for_reset_once_only_the_reserve_is_left(self):
+        clock = Clock()
+        pacer = ratelimit.Pacer(reserve=10, burst=100, clock=clock, sleep=clock.sleep)
+        pacer.update(200, {'X-RateLimit-Remaining': '12', 'X-RateLimit-Reset': '1060'})
+        self.assertEqual(pacer.reserve_slot(), 0)
+        self.assertEqual(pacer.reserve_slot(), 0)
+        self.assertEqual(pacer.reserve_slot(), 60)
+        pacer.acquire()
+        self.assertEqual(clock.now, 1060)
+        self.assertEqual(pacer.reserve_slot(), 0)
+
+    def test_secondary_rate_limit_retry_after(self):
+        clock = Clock()
+        pacer = ratelimit.Pacer(reserve=10, clock=clock, sleep=clock.sleep)
+        self.assertTrue(pacer.update(403, {'Retry-After': '30'}))
+        self.assertEqual(pacer.reserve_slot(), 30)
+        self.assertFalse(pacer.update(403, {}))
+
+    def test_primary_rate_limit_exhausted(self):
+        clock = Clock()
+        pacer = ratelimit.Pacer(reserve=0, clock=clock, sleep=clock.sleep)
+        self.assertTrue(pacer.update(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1042'}))
+        self.assertEqual(pacer.reserve_slot(), 42)
+
+    def test_get_pacer(self):
+        pacer = ratelimit.get_pacer('api.github.com', '*****')
+        self.assertIs(pacer, ratelimit.get_pacer('api.github.com', '*****'))
+        self.assertIsNot(pacer, ratelimit.get_pacer('api.github.com', 'other token'))
@@ -1,11 +1,14 @@
+import datetime
 import tempfile
 import os
-import platform
 import unittest
 import unittest.mock as mock
 
+import requests
+
 from github_watcher.commands import run
 from github_watcher.services import git
+from github_watcher.services import store
 
 from github_watcher.commands.config import (
     Configuration,
@@ -18,6 +21,20 @@ from github_watcher.commands.config import (
 
 class TestRun(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        patches = [
+            mock.patch('github_watcher.settings.WATCHER_STATE_DB', os.path.join(self.tmpdir.name, 'state.db')),
+            mock.patch('github_watcher.settings.WATCHER_ALERT_LOG', os.path.join(self.tmpdir.name, 'alert.log')),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        store.get_store().close()
+        self.tmpdir.cleanup()
+
     def test_is_watched_file(self):
         conf = Configuration(users=[User(
             name='akellehe',
@@ -59,27 +76,12 @@ class TestRun(unittest.TestCase):
         self.assertFalse(target)
         self.assertFalse(run.is_watched_directory(None, '/foo/bar'))
 
-    @unittest.skipIf(platform.system() != 'Darwin', "This test only for OSX")
-    @mock.patch('github_watcher.commands.run.logging.info')
-    @mock.patch('github_watcher.commands.run.subprocess.call')
-    def test_alert_osx(self, subprocess_call, logging_info):
-        msg = 'Found a PR effecting myfile myrange'
-        with mock.patch('github_watcher.commands.run.Notifier.notify') as notify:
-            run.alert('myfile', 'myrange', 'my_pr_link')
-            notify.assert_any_call(msg, title='Github Watcher', open='my_pr_link')
-        logging_info.assert_any_call(msg)
-        subprocess_call.assert_any_call('say ' + msg, shell=True)
-
-    @unittest.skipIf(platform.system() != 'Linux', "This test only for Linux")
-    @unittest.skipIf(os.environ.get('TRAVIS') == 'true', "Skip during CI runs.")
     @mock.patch('github_watcher.commands.run.logging.info')
-    def test_alert_linux(self, logging_info):
+    @mock.patch('github_watcher.notifier.get_worker')
+    def test_alert_queues_the_notification(self, get_worker, logging_info):
         msg = 'Found a PR effecting myfile myrange'
-        with mock.patch('github_watcher.commands.run.notify2.init') as _init:
-            with mock.patch('github_watcher.commands.run.notify2.Notification') as _Note:
-                run.alert('myfile', 'myrange', 'my_pr_link')
-                _init.assert_any_call(app_name='github-watcher')
-                _Note.assert_any_call('Github Watcher', messages=msg)
+        run.alert('myfile', 'myrange', 'my_pr_link', silent=True)
+        get_worker.return_value.put.assert_called_once_with(msg, 'my_pr_link', silent=True, rule=None)
         logging_info.assert_any_call(msg)
 
     def test_are_watched_lines(self):
@@ -87,6 +89,10 @@ class TestRun(unittest.TestCase):
                  Path(path='baz/biz/goat.py', ranges=[Range(10, 20)])]
         self.assertTrue(run.are_watched_lines(paths[0], 0, 10))
         self.assertFalse(run.are_watched_lines(paths[1], 6, 9))
+        several = Path(path='foo/bar/pants.py', ranges=[Range(0, 5), Range(30, 40), Range(10, 20)])
+        self.assertTrue(run.are_watched_lines(several, 35, 36))
+        self.assertTrue(run.are_watched_lines(several, 21, 30))
+        self.assertFalse(run.are_watched_lines(several, 21, 29))
         with self.assertRaisesRegex(ValueError, 'Changed line ranges were out of order.'):
             self.assertTrue(run.are_watched_lines(
                 paths[1], 10, 0
@@ -162,23 +168,30 @@ class TestRun(unittest.TestCase):
             'my diffstring',
             'source'
         ))
-        alert.assert_any_call('foo/bar/pants.py', (0, 10), 'my link', silent=False)
-
-    @unittest.skipIf(platform.system() != 'Darwin', "This test only for OSX")
-    @mock.patch('github_watcher.commands.run.subprocess.call')
-    @mock.patch('github_watcher.commands.run.Notifier.notify')
-    def test_alert_doesnt_make_noise_when_silent(self, notify, _call):
-        run.alert('myfile', (1, 100), 'my pr link', silent=False)
-        _call.assert_any_call('say Found a PR effecting myfile (1, 100)', shell=True)
-        _call.reset_mock()
-        run.alert('myfile2', (10, 1000), 'my pr link2', silent=True)
-        _call.assert_not_called()
+        alert.assert_any_call('foo/bar/pants.py', (0, 10), 'my link', silent=False, rule='lines')
 
     def test_contains_watched_regex(self):
         repo = Repo(name='github-watcher', paths=[], regexes=['foo'])
         self.assertTrue(run.contains_watched_regex(repo, 'my sentence contains foo'))
         self.assertFalse(run.contains_watched_regex(repo, 'my sentence does not contain it'))
 
+    def test_watched_regex_only_scans_changed_lines(self):
+        diff = ("diff --git a/foo.py b/foo.py\n"
+                "--- a/foo.py\n"
+                "+++ b/foo.py\n"
+                "@@ -1,3 +1,3 @@\n"
+                " context password\n"
+                "-removed secret\n"
+                "+added token\n")
+        repo = Repo(name='github-watcher', regexes=['password', 'secret', '^added', 'foo'])
+        self.assertEqual(run.watched_regex(repo, diff), 'foo')
+        repo = Repo(name='github-watcher', regexes=['password', 'secret', '^added', 'foo'], regex_lines='added')
+        self.assertEqual(run.watched_regex(repo, diff), '^added')
+        repo = Repo(name='github-watcher', regexes=['password', 'secret', '^added', 'foo'], regex_lines='removed')
+        self.assertEqual(run.watched_regex(repo, diff), 'secret')
+        repo = Repo(name='github-watcher', regexes=['password', 'foo'], regex_lines='changed')
+        self.assertIsNone(run.watched_regex(repo, diff))
+
 
     @mock.patch('github_watcher.commands.run.already_alerted')
     def test_alert_if_watched_changes_for_regex(self, already_alerted):
@@ -333,46 +346,46 @@ class TestRun(unittest.TestCase):
         ))
 
     def test_mark_as_alerted(self):
-        tmpfile = tempfile.NamedTemporaryFile()
-        with mock.patch('github_watcher.settings.WATCHER_ALERT_LOG', tmpfile.name):
-            run.mark_as_alerted('my pr link')
-        with open(tmpfile.name, 'rb') as fp:
-            self.assertIn('my pr link', fp.read().decode('utf8'))
+        run.mark_as_alerted('my pr link')
+        self.assertTrue(run.already_alerted('my pr link'))
+        store.flush()
+        store.get_store().close()
+        self.assertTrue(run.already_alerted('my pr link'))
 
     def test_already_alerted(self):
-        tmpfile = tempfile.NamedTemporaryFile()
-        with open(tmpfile.name, 'w') as fp:
-            fp.write('my pr link')
-            fp.flush()
-        with mock.patch('github_watcher.settings.WATCHER_ALERT_LOG', tmpfile.name):
-            self.assertTrue(run.already_alerted('my pr link'))
-
-    def test_already_alerted_with_ioerror(self):
-        _open = mock.MagicMock()
-        with mock.patch.dict('github_watcher.commands.run.__builtins__', values={'open': _open}):
-            _open.side_effect = IOError
-            self.assertFalse((run.already_alerted('my pr link')))
-
-    @mock.patch('github_watcher.commands.run.alert_if_watched_changes')
-    @mock.patch('github_watcher.services.git.diff')
-    @mock.patch('github_watcher.commands.run.unidiff.PatchSet.from_string')
+        run.mark_as_alerted('https://github.com/akellehe/github-watcher/pull/123')
+        self.assertTrue(run.already_alerted('https://github.com/akellehe/github-watcher/pull/123'))
+        self.assertFalse(run.already_alerted('https://github.com/akellehe/github-watcher/pull/12'))
+
+    @mock.patch('github_watcher.commands.run.alert_match')
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.commands.run.already_alerted')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.patched_files')
     @mock.patch('github_watcher.services.git.open_pull_requests')
-    def test_find_changes_with_watched_source(self, open_pull_requests, patch_set_from_string, git_diff,
-                          alert_if_watched_changes):
+    def test_find_changes_with_match(self, open_pull_requests, patched_files, diff_files, already_alerted,
+                                     evaluate_files, alert_match):
         open_prs = [mock.MagicMock()]
         open_prs[0].html_url = 'my html url'
+        open_prs[0].base.sha = 'my base sha'
+        open_prs[0].head.sha = 'my head sha'
+        open_prs[0].updated_at = datetime.datetime(2019, 1, 1)
         open_prs[0].user.login = 'akellehe'
         open_pull_requests.return_value = open_prs
-        git_diff.return_value = 'my diff'
-        patched_file_1 = mock.MagicMock()
-        patch_set = [patched_file_1]
-        patch_set_from_string.return_value = patch_set
+        diff_files.return_value = [{'filename': 'foo/bar/pants.py', 'patch': 'my patch'}]
+        patch_set = [mock.MagicMock()]
+        patched_files.return_value = patch_set
+        already_alerted.return_value = False
+        match = run.Match('lines', 'foo/bar/pants.py', (0, 10))
+        evaluate_files.return_value = match
         conf = Configuration.from_json({
             'akellehe': {
                 'repos': {
                     'github-watcher': {
-                        'foo/bar/pants.py': [[0, 5]],
-                        'baz/biz/goat.py': [[10, 20]]
+                        'paths': {
+                            'foo/bar/pants.py': [[0, 5]],
+                            'baz/biz/goat.py': [[10, 20]]
+                        }
                     }
                 },
                 'base_url': 'my base url',
@@ -381,62 +394,220 @@ class TestRun(unittest.TestCase):
         })
         run.find_changes(conf)
         open_pull_requests.assert_any_call(
-            'my base url', '*****', 'akellehe', 'github-watcher')
-        patch_set_from_string.assert_any_call('my diff')
-        git_diff.assert_any_call('my base url', '*****', open_prs[0])
-        alert_if_watched_changes.assert_any_call(
-            conf, conf.users[0], conf.users[0].repos[0], patched_file_1, 'my html url', 'my diff', 'source', 'akellehe'
-        )
+            'my base url', '*****', 'akellehe', 'github-watcher', since=None)
+        self.assertEqual(list(patched_files.call_args[0][0]), diff_files.return_value)
+        diff_files.assert_any_call('my base url', '*****', open_prs[0])
+        evaluate_files.assert_called_once_with(conf.users[0].repos[0], patch_set, 'akellehe')
+        alert_match.assert_called_once_with(conf, match, 'my html url')
 
-    @mock.patch('github_watcher.commands.run.alert_if_watched_changes')
-    @mock.patch('github_watcher.services.git.diff')
-    @mock.patch('github_watcher.commands.run.unidiff.PatchSet.from_string')
+    @mock.patch('github_watcher.commands.run.alert_match')
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.commands.run.already_alerted')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.patched_files')
     @mock.patch('github_watcher.services.git.open_pull_requests')
-    def test_find_changes_with_watched_target(self, open_pull_requests, patch_set_from_string, git_diff,
-                                              alert_if_watched_changes):
-        alert_if_watched_changes.side_effect = [False, True]
+    def test_find_changes_without_match(self, open_pull_requests, patched_files, diff_files, already_alerted,
+                                        evaluate_files, alert_match):
         open_prs = [mock.MagicMock()]
         open_prs[0].html_url = 'my html url'
+        open_prs[0].base.sha = 'my base sha'
+        open_prs[0].head.sha = 'my head sha'
+        open_prs[0].updated_at = datetime.datetime(2019, 1, 1)
         open_prs[0].user.login = 'akellehe'
         open_pull_requests.return_value = open_prs
-        git_diff.return_value = 'my diff'
-        patched_file_1 = mock.MagicMock()
-        patch_set = [patched_file_1]
-        patch_set_from_string.return_value = patch_set
+        diff_files.return_value = [{'filename': 'foo/bar/pants.py', 'patch': 'my patch'}]
+        patched_files.return_value = [mock.MagicMock()]
+        already_alerted.return_value = False
+        evaluate_files.return_value = None
         conf = Configuration.from_json({
             'akellehe': {
                 'repos': {
                     'github-watcher': {
-                        'foo/bar/pants.py': [[0, 5]],
-                        'baz/biz/goat.py': [[10, 20]]
+                        'paths': {
+                            'foo/bar/pants.py': [[0, 5]],
+                        }
                     }
                 },
                 'base_url': 'my base url',
                 'token': '*****'
-            },
+            }
         })
         run.find_changes(conf)
-        open_pull_requests.assert_any_call(
-            'my base url', '*****', 'akellehe', 'github-watcher')
-        patch_set_from_string.assert_any_call('my diff')
-        git_diff.assert_any_call('my base url', '*****', open_prs[0])
-        alert_if_watched_changes.assert_any_call(
-            conf, conf.users[0], conf.users[0].repos[0], patched_file_1, 'my html url', 'my diff', 'target', 'akellehe'
-        )
+        self.assertEqual(evaluate_files.call_count, 1)
+        alert_match.assert_not_called()
+
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.commands.run.already_alerted')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_when_already_alerted(self, open_pull_requests, diff_files, already_alerted,
+                                               evaluate_files):
+        open_prs = [mock.MagicMock()]
+        open_prs[0].html_url = 'my html url'
+        open_prs[0].base.sha = 'my base sha'
+        open_prs[0].head.sha = 'my head sha'
+        open_prs[0].updated_at = datetime.datetime(2019, 1, 1)
+        open_pull_requests.return_value = open_prs
+        already_alerted.return_value = True
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {
+                    'github-watcher': {
+                        'paths': {
+                            'foo/bar/pants.py': [[0, 5]],
+                        }
+                    }
+                },
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        run.find_changes(conf)
+        already_alerted.assert_any_call('my html url')
+        diff_files.assert_not_called()
+        evaluate_files.assert_not_called()
+
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.patched_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_skips_unchanged_pull_requests(self, open_pull_requests, patched_files, diff_files,
+                                                        evaluate_files):
+        open_prs = [mock.MagicMock()]
+        open_prs[0].html_url = 'my html url'
+        open_prs[0].user.login = 'akellehe'
+        open_prs[0].base.sha = 'my base sha'
+        open_prs[0].head.sha = 'my head sha'
+        open_prs[0].updated_at = datetime.datetime(2019, 1, 1)
+        open_pull_requests.return_value = open_prs
+        diff_files.return_value = [{'filename': 'foo/bar/pants.py', 'patch': 'my patch'}]
+        patched_files.return_value = [mock.MagicMock()]
+        evaluate_files.return_value = None
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {
+                    'github-watcher': {
+                        'paths': {
+                            'foo/bar/pants.py': [[0, 5]],
+                        }
+                    }
+                },
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        run.find_changes(conf)
+        run.find_changes(conf)
+        self.assertEqual(diff_files.call_count, 1)
+        self.assertEqual(store.get_store().get_pull_request('my html url'),
+                         ('my base sha', 'my head sha', conf.users[0].repos[0].fingerprint, ''))
+
+        open_prs[0].head.sha = 'my new head sha'
+        run.find_changes(conf)
+        self.assertEqual(diff_files.call_count, 2)
+
+        conf.users[0].repos[0].regexes.append('foo')
+        conf.users[0].repos[0].recompile()
+        run.find_changes(conf)
+        self.assertEqual(diff_files.call_count, 3)
+
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.patched_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_lists_pull_requests_updated_since_last_cycle(self, open_pull_requests, patched_files,
+                                                                       diff_files, evaluate_files):
+        open_prs = []
+        for n in range(2):
+            pr = mock.MagicMock()
+            pr.html_url = 'my html url {}'.format(n)
+            pr.base.sha = 'my base sha'
+            pr.head.sha = 'my head sha'
+            pr.updated_at = datetime.datetime(2019, 1, 2 - n)
+            open_prs.append(pr)
+        open_pull_requests.return_value = open_prs
+        diff_files.return_value = [{'filename': 'foo/bar/pants.py', 'patch': 'my patch'}]
+        patched_files.return_value = [mock.MagicMock()]
+        evaluate_files.return_value = None
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}}},
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        run.find_changes(conf)
+        open_pull_requests.assert_called_with('my base url', '*****', 'akellehe', 'github-watcher', since=None)
+
+        run.find_changes(conf)
+        open_pull_requests.assert_called_with('my base url', '*****', 'akellehe', 'github-watcher',
+                                              since='2019-01-02T00:00:00Z')
+
+        conf.users[0].repos[0].regexes.append('foo')
+        conf.users[0].repos[0].recompile()
+        run.find_changes(conf)
+        open_pull_requests.assert_called_with('my base url', '*****', 'akellehe', 'github-watcher', since=None)
+
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_keeps_cursor_when_cycle_fails(self, open_pull_requests, diff_files):
+        pr = mock.MagicMock()
+        pr.html_url = 'my html url'
+        pr.base.sha = 'my base sha'
+        pr.head.sha = 'my head sha'
+        pr.updated_at = datetime.datetime(2019, 1, 1)
+        open_pull_requests.return_value = [pr]
+        diff_files.side_effect = RuntimeError('Server Error')
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}}},
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        with self.assertRaisesRegex(RuntimeError, 'Server Error'):
+            run.find_changes(conf)
+        repo = conf.users[0].repos[0]
+        self.assertIsNone(store.get_store().get_cursor(run.cursor_key(conf.users[0], repo), repo.fingerprint))
+
+    @mock.patch('github_watcher.services.git.get_session')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_does_not_record_http_errors(self, open_pull_requests, get_session):
+        pr = mock.MagicMock()
+        pr.html_url = 'my html url'
+        pr.updated_at = datetime.datetime(2019, 1, 1)
+        open_pull_requests.return_value = [pr]
+        get_session.return_value.get.return_value.status_code = 502
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}}},
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch('github_watcher.settings.WATCHER_HTTP_CACHE', os.path.join(tmpdir, 'http')), \
+                    mock.patch('github_watcher.settings.WATCHER_DIFF_CACHE', os.path.join(tmpdir, 'diffs')):
+                with self.assertRaises(requests.HTTPError):
+                    run.find_changes(conf)
+        self.assertIsNone(store.get_store().get_pull_request('my html url'))
 
-    @mock.patch('github_watcher.commands.run.alert_if_watched_changes')
-    @mock.patch('github_watcher.services.git.diff')
-    @mock.patch('github_watcher.commands.run.unidiff.PatchSet.from_string')
+    @mock.patch('github_watcher.commands.run.evaluate_files')
+    @mock.patch('github_watcher.commands.run.already_alerted')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.patched_files')
     @mock.patch('github_watcher.services.git.open_pull_requests')
-    def test_find_changes_with_noop(self, open_pull_requests, patch_set_from_string, git_diff,
-                          alert_if_watched_changes):
+    def test_find_changes_with_noop(self, open_pull_requests, patched_files, diff_files, already_alerted,
+                                    evaluate_files):
         open_prs = [mock.MagicMock()]
         open_prs[0].html_url = 'my html url'
+        open_prs[0].base.sha = 'my base sha'
+        open_prs[0].head.sha = 'my head sha'
+        open_prs[0].updated_at = datetime.datetime(2019, 1, 1)
         open_pull_requests.return_value = open_prs
-        diff = mock.MagicMock()
-        diff.return_value = 'my diff'
-        git_diff.return_value = diff
-        patch_set_from_string.side_effect = git.Noop
+        diff_files.return_value = [{'filename': 'foo/bar/pants.py', 'patch': 'my patch'}]
+        already_alerted.return_value = False
+        patched_files.side_effect = git.Noop
         conf = Configuration.from_json({
             'akellehe': {
                 'repos': {
@@ -454,22 +625,246 @@ class TestRun(unittest.TestCase):
         })
         run.find_changes(conf)
         open_pull_requests.assert_any_call(
-            'my base url', '*****', 'akellehe', 'github-watcher')
-        patch_set_from_string.assert_any_call(diff)
-        git_diff.assert_any_call('my base url', '*****', open_prs[0])
-        alert_if_watched_changes.assert_not_called()
+            'my base url', '*****', 'akellehe', 'github-watcher', since=None)
+        self.assertEqual(list(patched_files.call_args[0][0]), diff_files.return_value)
+        diff_files.assert_any_call('my base url', '*****', open_prs[0])
+        evaluate_files.assert_not_called()
+
+    def concurrent_find_changes(self, fetch_mode):
+        head_files = [{'filename': 'foo/bar/pants.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'}]
+        open_prs = {}
+        for repo in ('github-watcher', 'other-repo'):
+            open_prs[repo] = []
+            for n in range(4):
+                pr = mock.MagicMock()
+                pr.html_url = '{}/pull/{}'.format(repo, n)
+                pr.user.login = 'someone'
+                pr.base.sha = 'base'
+                pr.head.sha = 'head'
+                pr.updated_at = datetime.datetime(2019, 1, n + 1)
+                open_prs[repo].append(pr)
+
+        def diff_files(base_url, token, pr):
+            if pr.html_url.endswith('/3'):
+                raise git.Noop()
+            return head_files if pr.html_url.endswith('/1') else []
+
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {
+                    'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}},
+                    'other-repo': {'paths': {'foo/bar/': None}},
+                },
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        with mock.patch('github_watcher.services.git.open_pull_requests',
+                        side_effect=lambda base_url, token, user, repo, since: iter(open_prs[repo])):
+            with mock.patch('github_watcher.services.git.diff_files', side_effect=diff_files) as git_diff_files:
+                with mock.patch('github_watcher.commands.run.alert_match') as alert_match:
+                    with mock.patch('github_watcher.settings.FETCH_MODE', fetch_mode):
+                        run.find_changes(conf)
+        self.assertEqual(git_diff_files.call_count, 8)
+        alerted = sorted(call[0][2] for call in alert_match.call_args_list)
+        self.assertEqual(alerted, ['github-watcher/pull/1', 'other-repo/pull/1'])
+        self.assertEqual(store.get_store().get_pull_request('other-repo/pull/2')[3], '')
+        self.assertEqual(store.get_store().get_pull_request('other-repo/pull/3')[3], 'noop')
+
+    def test_find_changes_async(self):
+        self.concurrent_find_changes('async')
+
+    def test_find_changes_pipeline(self):
+        self.concurrent_find_changes('pipeline')
+
+    def test_evaluate_paths(self):
+        def files(*paths, change_type='MODIFIED'):
+            return [{'path': path, 'changeType': change_type} for path in paths]
+
+        repo = Repo(name='github-watcher', paths=[Path(path='foo/bar/pants.py', ranges=[Range(0, 5)]),
+                                                  Path(path='baz/', ranges=[])], regexes=[], users=['akellehe'])
+        self.assertEqual(run.evaluate_paths(repo, files('README.md'), 'akellehe'), run.Match('user', 'README.md',
+                                                                                             detail='akellehe'))
+        self.assertIsNone(run.evaluate_paths(repo, files('README.md', 'foo/bar/other.py'), 'someone'))
+        self.assertEqual(run.evaluate_paths(repo, files('README.md', 'baz/biz.py'), 'someone'),
+                         run.Match('directory', 'baz/biz.py'))
+        self.assertIs(run.evaluate_paths(repo, files('foo/bar/pants.py'), 'someone'), True)
+        # The path a file was renamed from might be watched, and only the diff names it.
+        self.assertIs(run.evaluate_paths(repo, files('README.md', change_type='RENAMED'), 'someone'), True)
+        repo.regexes.append('token')
+        repo.recompile()
+        self.assertIs(run.evaluate_paths(repo, files('README.md'), 'someone'), True)
+
+    @mock.patch('github_watcher.commands.run.alert_match')
+    @mock.patch('github_watcher.services.git.diff_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests_graphql')
+    def test_find_changes_graphql(self, open_pull_requests_graphql, diff_files, alert_match):
+        head_files = [{'filename': 'foo/bar/pants.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'}]
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {
+                    'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}},
+                    'other-repo': {'paths': {'foo/bar/': None}},
+                },
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        results = []
+        for n, (repo, paths) in enumerate([('github-watcher', ['foo/bar/pants.py']), ('github-watcher', ['README.md']),
+                                           ('other-repo', ['foo/bar/baz.py']), ('other-repo', None),
+                                           ('other-repo', [])]):
+            files = None if paths is None else [{'path': path, 'changeType': 'MODIFIED'} for path in paths]
+            pr = mock.MagicMock()
+            pr.html_url = '{}/pull/{}'.format(repo, n)
+            pr.user.login = 'someone'
+            pr.base.sha = 'base'
+            pr.head.sha = 'head'
+            pr.updated_at = datetime.datetime(2019, 1, n + 1)
+            results.append(('akellehe', repo, pr, files))
+        open_pull_requests_graphql.return_value = iter(results)
+        diff_files.return_value = head_files
+        with mock.patch('github_watcher.settings.FETCH_MODE', 'graphql'):
+            activity = run.find_changes(conf)
+
+        open_pull_requests_graphql.assert_called_once_with(
+            'my base url', '*****', [('akellehe', 'github-watcher', None), ('akellehe', 'other-repo', None)])
+        self.assertEqual([call[0][2].html_url for call in diff_files.call_args_list],
+                         ['github-watcher/pull/0', 'other-repo/pull/3'])
+        self.assertEqual(sorted((call[0][1].rule, call[0][2]) for call in alert_match.call_args_list),
+                         [('directory', 'other-repo/pull/2'), ('directory', 'other-repo/pull/3'),
+                          ('lines', 'github-watcher/pull/0')])
+        self.assertEqual(store.get_store().get_pull_request('github-watcher/pull/1')[3], '')
+        self.assertEqual(store.get_store().get_pull_request('other-repo/pull/4')[3], 'noop')
+        self.assertEqual(activity[('akellehe', 'github-watcher')], 2)
+        self.assertEqual(activity[('akellehe', 'other-repo')], 3)
+        repo = conf.users[0].repos[1]
+        self.assertEqual(store.get_store().get_cursor(run.cursor_key(conf.users[0], repo), repo.fingerprint),
+                         '2019-01-05T00:00:00Z')
+
+    def test_watched_files(self):
+        repo = Repo(name='github-watcher', paths=[Path(path='foo/bar/pants.py', ranges=[Range(0, 5)]),
+                                                  Path(path='baz/', ranges=[])], regexes=[])
+        files = [
+            {'filename': 'README.md', 'patch': '@@ -1 +1 @@'},
+            {'filename': 'foo/bar/pants.py', 'patch': '@@ -1 +1 @@'},
+            {'filename': 'baz/biz.py', 'patch': '@@ -1 +1 @@'},
+            {'filename': 'trousers.py', 'previous_filename': 'foo/bar/pants.py', 'patch': '@@ -1 +1 @@'},
+        ]
+        self.assertEqual(list(run.watched_files(repo, files)), files[1:])
+        with mock.patch('github_watcher.services.git.hunks.parse_hunks') as parse_hunks:
+            parse_hunks.return_value = []
+            run.evaluate_files(repo, git.patched_files(run.watched_files(repo, iter(files[:1]))))
+        parse_hunks.assert_not_called()
+
+        repo.regexes.append('secret')
+        repo.recompile()
+        self.assertEqual(list(run.watched_files(repo, files)), files)
+        self.assertEqual(list(run.watched_files(Repo(name='github-watcher', paths=[], regexes=[]), files)), [])
+
+    def test_evaluate_files(self):
+        repo = Repo(name='github-watcher', paths=[Path(path='foo/bar/pants.py', ranges=[Range(0, 5)])],
+                    regexes=['secret'], users=['akellehe'])
+        files = [
+            {'filename': 'README.md', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'},
+            {'filename': 'logo.png'},
+            {'filename': 'foo/bar/pants.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'},
+            {'filename': 'config.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+secret'},
+        ]
+        consumed = []
+
+        def stream():
+            for head_file in files:
+                consumed.append(head_file['filename'])
+                yield head_file
+
+        self.assertEqual(run.evaluate_files(repo, git.patched_files(stream()), 'someone'),
+                         run.Match('lines', 'foo/bar/pants.py', (1, 2)))
+        self.assertEqual(consumed, ['README.md', 'logo.png', 'foo/bar/pants.py'])
+
+        consumed.clear()
+        self.assertEqual(run.evaluate_files(repo, git.patched_files(stream()), 'akellehe'),
+                         run.Match('user', detail='akellehe'))
+        self.assertEqual(consumed, [])
+
+        repo.paths = []
+        repo.recompile()
+        self.assertEqual(run.evaluate_files(repo, git.patched_files(stream()), 'someone'),
+                         run.Match('regex', 'config.py', detail='secret'))
+        self.assertIsNone(run.evaluate_files(repo, git.patched_files(files[:2]), 'someone'))
+
+    def test_evaluate_files_scans_diff_headers(self):
+        files = [{'filename': 'secrets/keys.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'}]
+        repo = Repo(name='github-watcher', regexes=[r'^diff --git a/secrets/'])
+        self.assertEqual(run.evaluate_files(repo, git.patched_files(files), 'someone'),
+                         run.Match('regex', 'secrets/keys.py', detail=r'^diff --git a/secrets/'))
+        repo = Repo(name='github-watcher', regexes=['secrets/'], regex_lines='added')
+        self.assertIsNone(run.evaluate_files(repo, git.patched_files(files), 'someone'))
+
+        renamed = [{'filename': 'public/keys.py', 'previous_filename': 'secrets/keys.py',
+                    'patch': '@@ -1 +1 @@\n-a\n+b'}]
+        repo = Repo(name='github-watcher', regexes=[r'^--- a/secrets/'])
+        self.assertEqual(run.evaluate_files(repo, git.patched_files(renamed), 'someone'),
+                         run.Match('regex', 'public/keys.py', detail=r'^--- a/secrets/'))
+        # There's no made up `index foo..bar` line to match.
+        for regex in ('foo', 'bar', 'index', '100644'):
+            repo = Repo(name='github-watcher', regexes=[regex])
+            self.assertIsNone(run.evaluate_files(repo, git.patched_files(files), 'someone'))
+
+    @mock.patch('github_watcher.settings.DIFF_ENDPOINT', 'files')
+    @mock.patch('github_watcher.commands.run.alert_match')
+    @mock.patch('github_watcher.services.git.pull_request_files')
+    @mock.patch('github_watcher.services.git.open_pull_requests')
+    def test_find_changes_from_files_endpoint(self, open_pull_requests, pull_request_files, alert_match):
+        open_prs = []
+        for n in range(2):
+            pr = mock.MagicMock()
+            pr.html_url = 'my html url {}'.format(n)
+            pr.user.login = 'someone'
+            pr.base.sha = 'my base sha'
+            pr.head.sha = 'my head sha'
+            pr.updated_at = datetime.datetime(2019, 1, 1)
+            open_prs.append(pr)
+        open_pull_requests.return_value = open_prs
+
+        def files(base_url, token, pr):
+            if pr is open_prs[1]:
+                raise git.Noop()
+            yield {'filename': 'foo/bar/pants.py', 'patch': '@@ -1,1 +1,1 @@\n-old\n+new'}
+
+        pull_request_files.side_effect = files
+        conf = Configuration.from_json({
+            'akellehe': {
+                'repos': {'github-watcher': {'paths': {'foo/bar/pants.py': [[0, 5]]}}},
+                'base_url': 'my base url',
+                'token': '*****'
+            }
+        })
+        run.find_changes(conf)
+        alert_match.assert_called_once_with(conf, run.Match('lines', 'foo/bar/pants.py', (1, 2)), 'my html url 0')
+        self.assertEqual(store.get_store().get_pull_request('my html url 1')[3], 'noop')
+
+    def test_find_changes_with_unknown_fetch_mode(self):
+        with mock.patch('github_watcher.settings.FETCH_MODE', 'threaded'):
+            with self.assertRaisesRegex(ValueError, 'fetch_mode must be one of'):
+                run.find_changes(Configuration(users=[]))
 
     @mock.patch('github_watcher.commands.run.find_changes')
     def test_main(self, find_changes):
-        conf = mock.MagicMock()
+        user = User(name='akellehe', repos=[Repo(name='github-watcher', paths=[], regexes=[])], token='token',
+                    base_url='https://api.github.com')
+        conf = Configuration(users=[user])
+        conf.add_cli_options = mock.MagicMock()
+        find_changes.return_value = run.Activity()
         parser = mock.MagicMock()
         with mock.patch('github_watcher.commands.run.config.Configuration.from_file') as configuration_from_file:
             configuration_from_file.return_value = conf
-            with mock.patch('time.sleep') as time_sleep:
+            with mock.patch('time.time') as time_time, mock.patch('time.sleep') as time_sleep:
+                time_time.return_value = 1000
                 time_sleep.side_effect = StopIteration
                 with self.assertRaisesRegex(StopIteration, ''):
                     run.main(parser)
             assert configuration_from_file.called
             assert conf.add_cli_options.called
-        find_changes.assert_any_call(conf)
+        find_changes.assert_any_call(conf, [(user, user.repos[0])])
         time_sleep.assert_any_call(600)
@@ -0,0 +1,79 @@
+import unittest
+import unittest.mock as mock
+
+from github_watcher import scheduler
+
+
+class Clock:
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.sleep = mock.MagicMock()
+        self.scheduler = scheduler.Scheduler(['busy', 'quiet'], min_interval=60, max_interval=1800, interval=600,
+                                             clock=self.clock, sleep=self.sleep)
+
+    def poll(self, *keys, changes=None):
+        changes = changes or {}
+        for key in keys:
+            self.scheduler.record(key, changes.get(key, 0))
+
+    def test_everything_is_due_at_first(self):
+        self.assertEqual(set(self.scheduler.due()), {'busy', 'quiet'})
+
+    def test_interval_is_used_until_activity_is_known(self):
+        self.poll('busy', 'quiet')
+        self.assertEqual(self.scheduler.due(), [])
+        self.clock.now = 599
+        self.assertEqual(self.scheduler.due(), [])
+        self.clock.now = 600
+        self.assertEqual(set(self.scheduler.due()), {'busy', 'quiet'})
+
+    def test_busy_repos_are_polled_more_often(self):
+        self.poll('busy', 'quiet')
+        self.clock.now = 600
+        self.poll('busy', 'quiet', changes={'busy': 5})
+        self.assertEqual(self.scheduler.schedules['busy'].interval, 120)
+        self.assertEqual(self.scheduler.schedules['quiet'].interval, 1800)
+        self.clock.now = 720
+        self.assertEqual(self.scheduler.due(), ['busy'])
+
+    def test_intervals_are_bounded(self):
+        self.poll('busy')
+        self.clock.now = 600
+        self.poll('busy', changes={'busy': 1000})
+        self.assertEqual(self.scheduler.schedules['busy'].interval, 60)
+
+    def test_rate_is_smoothed(self):
+        self.poll('busy')
+        self.clock.now = 600
+        self.poll('busy', changes={'busy': 5})
+        self.clock.now = 720
+        self.poll('busy')
+        # Half of the previous rate of 1/120 per second.
+        self.assertEqual(self.scheduler.schedules['busy'].interval, 240)
+
+    def test_most_overdue_first(self):
+        self.poll('quiet')
+        self.clock.now = 10
+        self.poll('busy')
+        self.clock.now = 1000
+        self.assertEqual(self.scheduler.due(), ['quiet', 'busy'])
+
+    def test_wait(self):
+        self.poll('busy', 'quiet')
+        self.clock.now = 100
+        self.scheduler.wait()
+        self.sleep.assert_called_once_with(500)
+
+    def test_wait_without_repos(self):
+        scheduler.Scheduler([], max_interval=1800, sleep=self.sleep).wait()
+        self.sleep.assert_called_once_with(1800)
@@ -0,0 +1,109 @@
+import json
+import threading
+import unittest
+import unittest.mock as mock
+
+from github_watcher.commands import post_event, serve
+from github_watcher.commands.config import (
+    Configuration,
+    User,
+    Repo,
+)
+
+
+SECRET = 'It is a secret to everybody.'
+
+
+def payload(action='opened', owner='akellehe', repo='github-watcher'):
+    return {
+        'action': action,
+        'repository': {'name': repo, 'owner': {'login': owner}},
+        'pull_request': {'html_url': 'https://github.com/{}/{}/pull/1'.format(owner, repo), 'number': 1},
+    }
+
+
+class TestServe(unittest.TestCase):
+
+    def setUp(self):
+        self.user = User(name='akellehe', repos=[Repo(name='github-watcher', paths=[], regexes=[])], token='token',
+                         base_url='https://api.github.com')
+        self.conf = Configuration(users=[self.user])
+        self.receiver = serve.Receiver(self.conf, SECRET, catchup_interval=3600)
+
+    def deliver(self, body, event='pull_request', secret=SECRET):
+        body = json.dumps(body).encode('utf-8')
+        return self.receiver.deliver(event, body, post_event.sign(secret, body))
+
+    def test_verify_signature(self):
+        # The example from GitHub's documentation on validating webhook deliveries.
+        self.assertTrue(serve.verify_signature(
+            "It's a Secret to Everybody", b'Hello, World!',
+            'sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17'))
+        self.assertFalse(serve.verify_signature(SECRET, b'Hello, World!', 'sha256=757107ea'))
+        self.assertFalse(serve.verify_signature(SECRET, b'Hello, World!', None))
+
+    def test_deliver(self):
+        self.assertEqual(self.deliver(payload()), 202)
+        self.assertEqual(self.deliver(payload(action='synchronize')), 202)
+        self.assertEqual(self.deliver(payload(owner='AKellehe')), 202)
+        key, raw = self.receiver.events.get_nowait()
+        self.assertEqual(key, ('akellehe', 'github-watcher'))
+        self.assertEqual(raw['number'], 1)
+        self.assertEqual(self.receiver.events.qsize(), 2)
+
+    def test_deliver_with_invalid_signature(self):
+        self.assertEqual(self.deliver(payload(), secret='wrong'), 401)
+        self.assertTrue(self.receiver.events.empty())
+
+    def test_deliver_ignored(self):
+        self.assertEqual(self.deliver({'zen': 'Keep it logically awesome.'}, event='ping'), 200)
+        self.assertEqual(self.deliver(payload(), event='push'), 204)
+        self.assertEqual(self.deliver(payload(action='closed')), 204)
+        self.assertEqual(self.deliver(payload(repo='unwatched')), 204)
+        self.assertEqual(self.deliver({'action': 'opened'}), 400)
+        self.assertTrue(self.receiver.events.empty())
+
+    @mock.patch('github_watcher.commands.serve.git.pull_request_from_json')
+    @mock.patch('github_watcher.commands.serve.run')
+    @mock.patch('github_watcher.commands.serve.store.flush')
+    def test_worker(self, flush, run, pull_request_from_json):
+        self.deliver(payload())
+        self.receiver.start()
+        self.receiver.stop()
+        run.find_changes.assert_called_once_with(self.conf)
+        pull_request_from_json.assert_called_once_with('https://api.github.com', 'token', payload()['pull_request'])
+        run.check_pull_request.assert_called_once_with(self.conf, self.user, self.user.repos[0],
+                                                       pull_request_from_json.return_value)
+        assert flush.called
+
+    @mock.patch('github_watcher.commands.serve.git.pull_request_from_json')
+    @mock.patch('github_watcher.commands.serve.run')
+    @mock.patch('github_watcher.commands.serve.store.flush')
+    def test_worker_survives_errors(self, flush, run, pull_request_from_json):
+        run.find_changes.side_effect = RuntimeError('rate limited')
+        run.check_pull_request.side_effect = [RuntimeError('not found'), None]
+        self.deliver(payload())
+        self.deliver(payload(action='reopened'))
+        self.receiver.start()
+        self.receiver.stop()
+        self.assertEqual(run.check_pull_request.call_count, 2)
+
+    def test_post_event(self):
+        server = serve.make_server(self.receiver, host='127.0.0.1', port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+            self.assertEqual(post_event.post_event(url, payload(), SECRET), 202)
+            self.assertEqual(post_event.post_event(url, payload(), 'wrong'), 401)
+        finally:
+            server.shutdown()
+            server.server_close()
+        key, raw = self.receiver.events.get_nowait()
+        self.assertEqual(raw, payload()['pull_request'])
+        self.assertTrue(self.receiver.events.empty())
+
+    @mock.patch('github_watcher.settings.WEBHOOK_SECRET', None)
+    def test_secret_is_required(self):
+        with self.assertRaisesRegex(RuntimeError, 'webhook_secret'):
+            post_event.get_secret()
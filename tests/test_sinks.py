@@ -0,0 +1,157 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from github_watcher import sinks
+
+
+def alert(number, repo='github-watcher', rule='lines', silent=False):
+    link = 'https://github.com/akellehe/{}/pull/{}'.format(repo, number)
+    return sinks.Alert('Found a PR effecting file{}.py (1, 2)'.format(number), link, silent, rule, 1234.5)
+
+
+class RecordingSink(sinks.Sink):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = []
+
+    def write(self, alerts):
+        self.writes.append(alerts)
+
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_repo_of(self):
+        self.assertEqual(sinks.repo_of('https://github.com/akellehe/github-watcher/pull/1'), 'akellehe/github-watcher')
+        self.assertEqual(sinks.repo_of('https://ghe.example.com/akellehe/github-watcher/pull/1'),
+                         'akellehe/github-watcher')
+        self.assertEqual(sinks.repo_of('my link'), 'my link')
+
+    def test_digest(self):
+        target = sinks.digest([alert(1), alert(2, silent=True, rule='regex'), alert(3, repo='other')])
+        self.assertEqual(target.msg, 'Found 3 PRs of interest: 2 in akellehe/github-watcher, 1 in akellehe/other '
+                                     '(2 lines, 1 regex)')
+        self.assertEqual(target.pr_link, 'https://github.com/akellehe/github-watcher/pull/1')
+        self.assertFalse(target.silent)
+
+    def test_sink_batches_until_due_or_full(self):
+        sink = RecordingSink(flush_interval=60, buffer_size=3)
+        sink.emit([alert(1)])
+        sink.emit([alert(2)])
+        self.assertEqual(sink.writes, [])
+        self.assertIsNotNone(sink.next_flush())
+        sink.emit([alert(3)])
+        self.assertEqual(sink.writes, [[alert(1), alert(2), alert(3)]])
+        self.assertIsNone(sink.next_flush())
+        sink.emit([alert(4)])
+        sink.close()
+        self.assertEqual(sink.writes[-1], [alert(4)])
+
+    def test_sink_keeps_the_newest_alerts_when_writing_fails(self):
+        sink = RecordingSink(flush_interval=60, buffer_size=2)
+        with mock.patch.object(sink, 'write', side_effect=IOError('disk full')) as write:
+            sink.emit([alert(1), alert(2)])
+            sink.emit([alert(3)])
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(list(sink.buffer), [alert(2), alert(3)])
+        sink.flush()
+        self.assertEqual(sink.writes, [[alert(2), alert(3)]])
+
+    def test_stdout_sink(self):
+        sink = sinks.StdoutSink(flush_interval=0)
+        with mock.patch('github_watcher.sinks.sys.stdout', new_callable=io.StringIO) as stdout:
+            sink.emit([alert(1), alert(2)])
+        self.assertEqual([json.loads(line)['pr_link'] for line in stdout.getvalue().splitlines()],
+                         [alert(1).pr_link, alert(2).pr_link])
+
+    def test_json_lines_sink(self):
+        path = os.path.join(self.tmpdir.name, 'alerts.jsonl')
+        sink = sinks.JSONLinesSink(path, flush_interval=60)
+        sink.emit([alert(1)])
+        sink.emit([alert(2, rule='regex')])
+        self.assertFalse(os.path.exists(path))
+        sink.close()
+        sink.emit([alert(3)])
+        sink.close()
+        with open(path) as fp:
+            records = [json.loads(line) for line in fp]
+        self.assertEqual(records[1], {
+            'time': 1234.5,
+            'repo': 'akellehe/github-watcher',
+            'rule': 'regex',
+            'message': 'Found a PR effecting file2.py (1, 2)',
+            'pr_link': 'https://github.com/akellehe/github-watcher/pull/2',
+        })
+        self.assertEqual(len(records), 3)
+
+    @mock.patch('github_watcher.sinks.requests.post')
+    def test_http_sink(self, post):
+        sink = sinks.HTTPSink('http://127.0.0.1:9000/alerts', flush_interval=60)
+        sink.emit([alert(1), alert(2)])
+        post.assert_not_called()
+        sink.close()
+        post.assert_called_once_with('http://127.0.0.1:9000/alerts', timeout=30, json={
+            'alerts': [sinks.to_json(alert(1)), sinks.to_json(alert(2))]})
+
+    def test_desktop_sink_shows_a_digest(self):
+        sink = sinks.DesktopSink()
+        with mock.patch.object(sink, 'notify') as notify:
+            sink.emit([alert(1)])
+            notify.assert_called_once_with(alert(1).msg, alert(1).pr_link, False)
+            sink.emit([alert(1), alert(2)])
+            notify.assert_called_with('Found 2 PRs of interest: 2 in akellehe/github-watcher (2 lines)',
+                                      alert(1).pr_link, False)
+
+    def test_make_sinks(self):
+        target = sinks.make_sinks([{'type': 'desktop'}, {'type': 'jsonl', 'path': 'alerts.jsonl', 'buffer_size': 10}])
+        self.assertIsInstance(target[0], sinks.DesktopSink)
+        self.assertEqual(target[0].flush_interval, 0)
+        self.assertEqual(target[1].path, 'alerts.jsonl')
+        self.assertEqual(target[1].buffer.maxlen, 10)
+        self.assertEqual(target[1].flush_interval, 5)
+        with self.assertRaisesRegex(ValueError, "Unknown alert sink type 'pager'"):
+            sinks.make_sinks([{'type': 'pager'}])
+
+    @mock.patch('github_watcher.sinks.SYSTEM', 'Darwin')
+    @mock.patch('github_watcher.sinks.subprocess.call')
+    def test_notify_osx(self, subprocess_call):
+        msg = 'Found a PR effecting myfile myrange'
+        pync = mock.MagicMock()
+        with mock.patch.dict('sys.modules', {'pync': pync}):
+            sinks.DesktopSink().notify(msg, 'my_pr_link')
+        pync.Notifier.notify.assert_any_call(msg, title='Github Watcher', open='my_pr_link')
+        subprocess_call.assert_any_call('say ' + msg, shell=True)
+
+    @mock.patch('github_watcher.sinks.SYSTEM', 'Darwin')
+    @mock.patch('github_watcher.sinks.subprocess.call')
+    def test_notify_doesnt_make_noise_when_silent(self, _call):
+        with mock.patch.dict('sys.modules', {'pync': mock.MagicMock()}):
+            sinks.DesktopSink().notify('Found a PR effecting myfile2 (10, 1000)', 'my pr link2', silent=True)
+        _call.assert_not_called()
+
+    @mock.patch('github_watcher.sinks.SYSTEM', 'Linux')
+    @mock.patch.dict('os.environ', {'TRAVIS': 'false'})
+    def test_notify_linux_reuses_the_connection(self):
+        msg = 'Found a PR effecting myfile myrange'
+        notify2 = mock.MagicMock()
+        with mock.patch.dict('sys.modules', {'notify2': notify2}):
+            desktop = sinks.DesktopSink()
+            desktop.notify(msg, 'my_pr_link')
+            desktop.notify(msg, 'my_pr_link')
+        notify2.init.assert_called_once_with(app_name='github-watcher')
+        notify2.Notification.assert_any_call('Github Watcher', message=msg)
+        notify2.Notification.return_value.set_timeout.assert_any_call(5000)
+        notify2.Notification.return_value.close.assert_not_called()
+
+    @mock.patch('github_watcher.sinks.SYSTEM', 'Linux')
+    def test_desktop_sink_doesnt_import_notify2_until_it_notifies(self):
+        with mock.patch.dict('sys.modules', {'notify2': None}):
+            sinks.make_sinks([{'type': 'desktop'}])
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from github_watcher.services import store
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmpdir.name, 'state.db')
+        self.alert_log = os.path.join(self.tmpdir.name, 'watcher_alert.log')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_mark_alerted_is_buffered_until_flush(self):
+        s = store.Store(self.db, alert_log=self.alert_log)
+        s.mark_alerted('https://github.com/akellehe/github-watcher/pull/1')
+        self.assertTrue(s.is_alerted('https://github.com/akellehe/github-watcher/pull/1'))
+        self.assertEqual(s.connection.execute("SELECT COUNT(*) FROM alerts").fetchone()[0], 0)
+        s.flush()
+        self.assertEqual(s.connection.execute("SELECT COUNT(*) FROM alerts").fetchone()[0], 1)
+        s.close()
+
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertTrue(s.is_alerted('https://github.com/akellehe/github-watcher/pull/1'))
+        s.close()
+
+    def test_mark_alerted_flushes_full_batches(self):
+        s = store.Store(self.db, alert_log=self.alert_log, batch_size=2)
+        s.mark_alerted('link 1')
+        s.mark_alerted('link 2')
+        self.assertEqual(s.pending_alerts, {})
+        self.assertEqual(s.connection.execute("SELECT COUNT(*) FROM alerts").fetchone()[0], 2)
+        s.close()
+
+    def test_is_alerted_matches_exact_links(self):
+        s = store.Store(self.db, alert_log=self.alert_log)
+        s.mark_alerted('https://github.com/akellehe/github-watcher/pull/123')
+        s.flush()
+        self.assertFalse(s.is_alerted('https://github.com/akellehe/github-watcher/pull/12'))
+        s.close()
+
+    def test_record_pull_request(self):
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertIsNone(s.get_pull_request('my pr link'))
+        self.assertFalse(s.is_unchanged('my pr link', 'base', 'head', 'fingerprint'))
+        s.record_pull_request('my pr link', 'base', 'head', 'fingerprint', 'lines')
+        self.assertTrue(s.is_unchanged('my pr link', 'base', 'head', 'fingerprint'))
+        s.close()
+
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertEqual(s.get_pull_request('my pr link'), ('base', 'head', 'fingerprint', 'lines'))
+        self.assertTrue(s.is_unchanged('my pr link', 'base', 'head', 'fingerprint'))
+        self.assertFalse(s.is_unchanged('my pr link', 'base', 'new head', 'fingerprint'))
+        self.assertFalse(s.is_unchanged('my pr link', 'base', 'head', 'new fingerprint'))
+        s.record_pull_request('my pr link', 'base', 'new head', 'fingerprint')
+        s.flush()
+        self.assertEqual(s.get_pull_request('my pr link'), ('base', 'new head', 'fingerprint', ''))
+        s.close()
+
+    def test_cursor(self):
+        repo = 'https://api.github.com/repos/akellehe/github-watcher'
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertIsNone(s.get_cursor(repo, 'fingerprint'))
+        s.set_cursor(repo, '2019-01-01T00:00:00Z', 'fingerprint')
+        self.assertEqual(s.get_cursor(repo, 'fingerprint'), '2019-01-01T00:00:00Z')
+        s.close()
+
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertEqual(s.get_cursor(repo, 'fingerprint'), '2019-01-01T00:00:00Z')
+        self.assertIsNone(s.get_cursor(repo, 'another fingerprint'))
+        s.close()
+
+    def test_migrate_alert_log(self):
+        with open(self.alert_log, 'w') as fp:
+            fp.write('my pr link\nmy other pr link\n\n')
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertTrue(s.is_alerted('my pr link'))
+        self.assertTrue(s.is_alerted('my other pr link'))
+        self.assertFalse(s.is_alerted(''))
+        s.close()
+
+        with open(self.alert_log, 'a') as fp:
+            fp.write('added after migration\n')
+        s = store.Store(self.db, alert_log=self.alert_log)
+        self.assertFalse(s.is_alerted('added after migration'))
+        s.close()
+
+    def test_migrate_missing_alert_log(self):
+        s = store.Store(self.db, alert_log=os.path.join(self.tmpdir.name, 'missing.log'))
+        self.assertIsNotNone(s.get_meta('alert_log_migrated'))
+        s.close()
+
+    def test_get_store(self):
+        with mock.patch('github_watcher.settings.WATCHER_ALERT_LOG', self.alert_log):
+            with mock.patch('github_watcher.settings.WATCHER_STATE_DB', self.db):
+                s = store.get_store()
+                self.assertIs(store.get_store(), s)
+                s.mark_alerted('my pr link')
+                store.flush()
+                self.assertEqual(s.pending_alerts, {})
+                s.close()
+                self.assertIsNot(store.get_store(), s)
+                store.get_store().close()